@@ -5,3 +5,4 @@ BUFFER = 10000
 FILE = 'alice.txt'
 CNT = 3
 DEBUG = False
+SEED = None
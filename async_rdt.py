@@ -0,0 +1,352 @@
+"""
+RDT 的 asyncio 前端
+
+一个 asyncio 事件循环驱动所有连接，不再为每个端点开 EventLoop/SendLoop/RecvLoop 三个线程。
+包格式、序号、重传和拥塞控制全部复用 rdt.py 里 ServerEventLoop/ClientEventLoop 的处理函数，
+这里只替换三样东西：
+-   事件队列：put 变成 loop.call_soon(dispatch)
+-   发送循环：put 直接写 DatagramTransport
+-   定时器：堆还是 EventLoop 的堆，堆顶用 loop.call_later 唤醒
+
+用法:
+    conn = await open_connection('127.0.0.1', 9999)
+    conn.send(b'hello')
+    await conn.drain()
+    data = await conn.recv(2048)
+    await conn.close()
+
+    server = await start_server(handle, '127.0.0.1', 9999)  # handle(conn) 是协程函数
+"""
+import asyncio
+import time
+
+from USocket import addr_to_bytes, bytes_to_addr, network
+from rdt import RDTEvent, RDTEventType, RDTPacket, SimpleRDT, ServerEventLoop, ClientEventLoop, \
+    CHECKSUM_ALGORITHMS, ACK_EVERY, SEND_WAIT, DUP_ACK_INTERVAL, MIN_RTO, MAX_RTO, RCVBUF, MAX_PKT_LEN, MAX_MSS, \
+    datagram_size
+
+DRAIN_HIGH_WATER = 64 * 1024  # drain 等到未发出的数据不超过这么多字节
+
+
+class _CallSoonQueue:
+    """
+    代替 SimpleQueue 的事件队列，放进来的事件在 asyncio 循环的下一轮处理
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, dispatch):
+        self.loop = loop
+        self.dispatch = dispatch
+
+    def put(self, event: RDTEvent):
+        self.loop.call_soon(self.dispatch, event)
+
+    put_nowait = put
+
+
+class _DatagramSender:
+    """
+    代替 SendLoop，包直接写进 transport
+    """
+
+    def __init__(self, tracer=None):
+        self.transport = None
+        self.buffer = memoryview(bytearray(datagram_size(0xFFFF)))  # 前8字节是目的地址，包接着编码进去
+        self.tracer = tracer
+
+    def put(self, pkt: RDTPacket):
+        if pkt == 0 or self.transport is None or self.transport.is_closing():
+            return
+        self.buffer[:8] = addr_to_bytes(pkt.remote)
+        n = pkt.pack_into(self.buffer, 8)
+        self.transport.sendto(self.buffer[:8 + n], network)
+        if self.tracer is not None:
+            self.tracer.sent(pkt, n)
+
+
+class _AcceptQueue(asyncio.Queue):
+    """
+    ServerEventLoop 同步地 put/get，协程用 pop 等待
+    """
+
+    def put(self, item):
+        self.put_nowait(item)
+
+    def get(self):
+        return self.get_nowait()
+
+    async def pop(self):
+        return await super().get()
+
+
+class _AsyncLoopMixin:
+    """
+    把 EventLoop 的事件队列、发送循环和定时器换成 asyncio 的实现，放在 MRO 最前面
+    """
+
+    def setup(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event_queue = _CallSoonQueue(loop, self.dispatch)
+        self.send_loop = _DatagramSender(self.socket.tracer)
+        self.timer_handle = None
+        self.timer_at = None  # timer_handle 对应的触发时间
+        self.vanished = loop.create_future()
+
+    def connection_made(self, transport):
+        self.send_loop.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        if addr != network:
+            return
+        try:
+            self.recv_loop.deal_datagram(data[8:], bytes_to_addr(data[:8]))
+        except Exception as ev:
+            self.put(RDTEventType.UNKNOWN_ERROR, ev)
+
+    def error_received(self, exc):
+        self.put(RDTEventType.UNKNOWN_ERROR, exc)
+
+    def connection_lost(self, exc):
+        pass
+
+    def dispatch(self, event: RDTEvent) -> bool:
+        running = super().dispatch(event)
+        self.arm_timer()
+        return running
+
+    def push_raw_timer(self, timer):
+        super().push_raw_timer(timer)
+        self.arm_timer()
+
+    def arm_timer(self):
+        """
+        让 asyncio 在最近的定时器到点时回调，取消的定时器留在堆里，提前醒来也无妨
+        """
+        next_time = self.next_timer_time()
+        if next_time == self.timer_at:
+            return
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        self.timer_at = next_time
+        if next_time is not None and not self.vanished.done():
+            self.timer_handle = self.loop.call_later(max(0.0, next_time - time.time()), self.on_timer)
+
+    def on_timer(self):
+        self.timer_handle = None
+        self.timer_at = None
+        self.fire_timers(time.time())
+        self.arm_timer()
+
+    def on_vanish(self) -> bool:
+        if self.timer_cnt > 0:
+            self.loop.call_later(max(0.0, self.next_timer_time() - time.time()), self.put, RDTEventType.VANISH,
+                                 None)
+            return True
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+            self.timer_at = None
+        if self.send_loop.transport is not None:
+            self.send_loop.transport.close()
+        self.before_vanish()
+        if not self.vanished.done():
+            self.vanished.set_result(None)
+        return False
+
+
+class AsyncServerEventLoop(_AsyncLoopMixin, ServerEventLoop, asyncio.DatagramProtocol):
+    def __init__(self, listen_socket: 'AsyncRDTSocket', loop: asyncio.AbstractEventLoop):
+        super().__init__(listen_socket)
+        self.setup(loop)
+        self.accept_queue = _AcceptQueue()
+
+
+class AsyncClientEventLoop(_AsyncLoopMixin, ClientEventLoop, asyncio.DatagramProtocol):
+    def __init__(self, socket_: 'AsyncRDTSocket', remote: (str, int), loop: asyncio.AbstractEventLoop):
+        super().__init__(socket_, remote)
+        self.setup(loop)
+        self.simple_sct.event_queue = self.event_queue
+        self.connected = asyncio.Event()
+
+    def on_connect(self, remote: (str, int)):
+        self.start_handshake(remote)
+
+
+class AsyncRDTSocket:
+    """
+    RDTSocket 的协程版本，监听、客户端和 accept 得到的连接都是这个类
+    """
+
+    def __init__(self, debug=False, checksum='sum', ack_every=ACK_EVERY, ack_delay=SEND_WAIT,
+                 dup_ack_interval=DUP_ACK_INTERVAL, congestion='vegas', pacing=True, min_rto=MIN_RTO,
+                 max_rto=MAX_RTO, rcvbuf=RCVBUF, mss=MAX_PKT_LEN, mss_probe=False, fast_open=False, tracer=None):
+        assert checksum in CHECKSUM_ALGORITHMS, 'Unknown checksum algorithm: %s' % checksum
+        assert ack_every >= 1 and ack_delay >= 0 and dup_ack_interval >= 0, 'Bad ACK policy'
+        assert 0 < mss <= MAX_MSS, 'MSS out of range'
+        self.debug = debug
+        self.checksum = CHECKSUM_ALGORITHMS.index(checksum)
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.dup_ack_interval = dup_ack_interval
+        self.congestion = congestion
+        self.pacing = pacing
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rcvbuf = rcvbuf
+        self.mss = mss
+        self.mss_probe = mss_probe
+        self.fast_open = fast_open
+        self.tracer = tracer
+        self._rate = None  # 没有 rate 参数，EventLoop.pace 里 socket 共用的令牌桶不限速
+        self.addr = None
+        self.simple_sct: SimpleRDT = None
+        self._event_loop = None
+        self._wake = None
+        self.is_close = False
+
+    def bind(self, address: (str, int)):
+        assert self._event_loop is None, 'Can not duplicate binding'
+        assert self.addr is None, 'Has bound'
+        self.addr = address
+        if self.tracer is not None:
+            self.tracer.local = address
+
+    async def listen(self):
+        assert self.addr is not None, 'Not bound'
+        if self._event_loop is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._event_loop = AsyncServerEventLoop(self, loop)
+        await loop.create_datagram_endpoint(lambda: self._event_loop, local_addr=self.addr)
+
+    async def accept(self) -> ('AsyncRDTSocket', (str, int)):
+        await self.listen()
+        assert isinstance(self._event_loop, AsyncServerEventLoop), 'This socket is not a listener, please bind'
+        s: SimpleRDT = await self._event_loop.accept_queue.pop()
+        if s is None:  # 监听关了，放回去叫醒别的 accept
+            self._event_loop.accept_queue.put(None)
+        assert s is not None, 'Can not accept after close'
+        conn = AsyncRDTSocket(self.debug)
+        conn._attach(s, self._event_loop)
+        return conn, s.remote
+
+    async def connect(self, address: (str, int)):
+        assert self._event_loop is None, 'Duplicated connecting or it is listening'
+        loop = asyncio.get_running_loop()
+        self._event_loop = AsyncClientEventLoop(self, address, loop)
+        await loop.create_datagram_endpoint(lambda: self._event_loop,
+                                            local_addr=self.addr or ('127.0.0.1', 0))
+        self._event_loop.put(RDTEventType.CONNECT, address)
+        if self._event_loop.fast_open_ready(address):  # SYN 等第一次 send 一起发
+            self._attach(self._event_loop.simple_sct, self._event_loop)
+            return
+        await self._event_loop.connected.wait()
+        s = self._event_loop.connect_()
+        if s is None:
+            raise ConnectionRefusedError('Connection refused')
+        self._attach(s, self._event_loop)
+
+    def _attach(self, s: SimpleRDT, event_loop):
+        self.simple_sct = s
+        self._event_loop = event_loop
+        self._wake = asyncio.Event()
+        s.waker = self._wake.set
+
+    async def _wait(self, predicate):
+        while not predicate():
+            self._wake.clear()
+            await self._wake.wait()
+
+    async def recv(self, bufsize: int) -> bytes:
+        assert self.simple_sct is not None, 'Connection not established or it is the listener'
+        s = self.simple_sct
+        await self._wait(lambda: len(s.data) > 0 or s.remote_close)
+        return s.recv(bufsize)
+
+    async def recv_exactly(self, n: int) -> bytes:
+        assert self.simple_sct is not None, 'Connection not established or it is the listener'
+        s = self.simple_sct
+        chunks = bytearray()
+        while True:  # 同 SimpleRDT.recv_exactly，一块一块读走，n 可以比接收缓冲区大
+            need = n - len(chunks)
+            await self._wait(lambda: len(s.data) >= s.chunk_of(need) or s.remote_close)
+            closed = s.remote_close
+            bs = s.recv(need)
+            if len(bs) == n:
+                return bs
+            chunks += bs
+            if len(chunks) == n or closed:
+                return bytes(chunks)
+
+    def send(self, _bytes: bytes):
+        assert self.simple_sct is not None, 'Connection not established yet.'
+        self.simple_sct.send(_bytes)
+
+    async def drain(self):
+        """
+        等到还没交给网络的数据降到 DRAIN_HIGH_WATER 以下
+        """
+        s = self.simple_sct
+        await asyncio.sleep(0)  # 先让排队的 SEND 事件处理掉
+        await self._wait(lambda: len(s.wait_send) - s.wait_send_offset <= DRAIN_HIGH_WATER or s.remote_close)
+
+    def get_stats(self) -> dict:
+        """
+        同 RDTSocket.get_stats，监听 socket 上是所有连接的汇总
+        """
+        if self.simple_sct is not None:
+            return self.simple_sct.get_stats()
+        assert isinstance(self._event_loop, AsyncServerEventLoop), 'Not connected or listening'
+        return self._event_loop.get_stats()
+
+    async def close(self):
+        assert self._event_loop is not None and not self.is_close, 'Duplicated closing'
+        self.is_close = True
+        if isinstance(self._event_loop, AsyncServerEventLoop) and self.simple_sct is not None:
+            self.simple_sct.close()  # accept 得到的连接
+            return
+        self._event_loop.put(RDTEventType.LISTEN_CLOSE, None)
+        await self._event_loop.vanished
+
+    def create_simple_socket(self, remote: (str, int), recv_offset: int, send_offset: int,
+                             event_queue=None) -> SimpleRDT:
+        if event_queue is None:
+            event_queue = self._event_loop.event_queue
+        s = SimpleRDT(None, self.debug, recv_offset, send_offset, remote, event_queue)
+        s.inherit(self)
+        return s
+
+    def bind_(self, address: (str, int)):
+        pass  # transport 在 create_datagram_endpoint 时已经绑定
+
+    def force_close(self):
+        pass
+
+
+async def open_connection(host: str, port: int, **kwargs) -> AsyncRDTSocket:
+    sock = AsyncRDTSocket(**kwargs)
+    await sock.connect((host, port))
+    return sock
+
+
+async def start_server(client_connected_cb, host: str, port: int, **kwargs) -> AsyncRDTSocket:
+    """
+    监听 (host, port)，每个新连接开一个任务运行 client_connected_cb(conn)
+    返回监听用的 AsyncRDTSocket，它的 serve_task 是 accept 循环
+    """
+    sock = AsyncRDTSocket(**kwargs)
+    sock.bind((host, port))
+    await sock.listen()
+
+    async def serve():
+        while True:
+            try:
+                conn, _ = await sock.accept()
+            except AssertionError:
+                if sock.is_close:
+                    return  # 监听关了，accept 循环跟着结束
+                raise
+            asyncio.ensure_future(client_connected_cb(conn))
+
+    sock.serve_task = asyncio.ensure_future(serve())
+    return sock
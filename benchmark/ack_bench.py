@@ -0,0 +1,79 @@
+"""
+延迟ACK策略基准：单向传一段数据，统计接收方发回的包数（ACK/SAK）和发送方发出的数据包数之比
+
+在仓库根目录运行: python -m benchmark.ack_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用
+"""
+import os
+import threading
+import time
+
+import network
+from rdt import RDTSocket
+
+SIZE = 300000
+LOSSES = (0.0, 0.05)
+POLICIES = (  # 名字, RDTSocket 的 ACK 参数
+    ('timer only', dict(ack_every=10 ** 9, dup_ack_interval=0)),  # 原来的行为：只靠 SEND_WAIT 定时器，重复包立即ACK
+    ('every 1', dict(ack_every=1, dup_ack_interval=0)),
+    ('every 2', dict()),  # 默认
+    ('every 4', dict(ack_every=4)),
+    ('every 8 / 20ms', dict(ack_every=8, ack_delay=0.02)),
+)
+
+
+def transfer(port: int, data: bytes, policy: dict) -> dict:
+    listener = RDTSocket(debug=False, **policy)
+    listener.bind(('127.0.0.1', port))
+    received = bytearray()
+    done = []
+
+    def serve():
+        conn, _ = listener.accept()
+        while True:
+            bs = conn.recv(65536)
+            if not bs:
+                break
+            received.extend(bs)
+            if len(received) == len(data):
+                done.append(time.time())
+        conn.close()
+
+    server = threading.Thread(target=serve)
+    server.start()
+    client = RDTSocket(debug=False, **policy)
+    client.connect(('127.0.0.1', port))
+    start = time.time()
+    client.send(data)
+    client.close()  # 服务端读到结尾后才关，两边的挥手都能走完
+    client.block_until_close()
+    server.join()
+    assert bytes(received) == data, 'Data mismatch'
+    forward = client._event_loop.send_loop.report()['sendto']
+    reverse = listener._event_loop.send_loop.report()['sendto']
+    listener.close()
+    listener.block_until_close()
+    return {'forward': forward, 'reverse': reverse, 'seconds': done[0] - start}
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = network.Server(network.server_address)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    data = os.urandom(SIZE)
+    port = 9300
+    print('%d bytes one way, reverse = packets sent by the receiver' % SIZE)
+    print('%-6s %-16s %8s %8s %12s %10s' % ('loss', 'policy', 'forward', 'reverse', 'reverse/data', 'KB/s'))
+    for loss in LOSSES:
+        network.LOSS = loss
+        for name, policy in POLICIES:
+            r = transfer(port, data, policy)
+            port += 1
+            print('%-6.2f %-16s %8d %8d %12.3f %10.1f' % (loss, name, r['forward'], r['reverse'],
+                                                          r['reverse'] / r['forward'], SIZE / r['seconds'] / 1000))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+拥塞控制算法对比：同一个模拟器设置下，每种算法单向传一段数据的吞吐和发包数（含重传）
+
+在仓库根目录运行: python -m benchmark.cc_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用
+"""
+import os
+import threading
+
+import network
+from benchmark.ack_bench import transfer
+from congestion import CONTROLLERS
+
+SIZE = 300000
+SCENARIOS = (  # 名字, 模拟器的 rate, LOSS
+    ('no limit', None, 0.0),
+    ('loss 5%', None, 0.05),
+    ('rate 100000', 100000, 0.0),
+    ('rate 100000 + loss 10%', 100000, 0.1),
+)
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = network.Server(network.server_address)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    data = os.urandom(SIZE)
+    port = 9400
+    print('%d bytes one way, simulator buffer %d bytes' % (SIZE, network.BUFFER))
+    print('%-24s %-8s %10s %8s %10s' % ('scenario', 'cc', 'KB/s', 'sent', 'overhead'))
+    for scenario, rate, loss in SCENARIOS:
+        net.rate = rate
+        network.LOSS = loss
+        for name in CONTROLLERS:
+            r = transfer(port, data, dict(congestion=name))
+            port += 1
+            print('%-24s %-8s %10.1f %8d %10.3f' % (scenario, name, SIZE / r['seconds'] / 1000, r['forward'],
+                                                    r['forward'] / -(-SIZE // 1024) - 1))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
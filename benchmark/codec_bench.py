@@ -0,0 +1,105 @@
+"""
+编解码微基准：每个包编码、解码（resolve + check）的纳秒数，比较原来拼接 bytes 的实现和现在的 struct.Struct 编解码
+
+在仓库根目录运行: python -m benchmark.codec_bench
+校验和用 crc32，'sum' 的逐字求和比编解码本身慢一个数量级，会把差别盖住
+"""
+import os
+import struct
+import timeit
+
+from rdt import RDTPacket, CHECKSUM_ALGORITHMS, FLAG_WND, FLAG_PROBE
+
+SIZES = (0, 1024, 8192)
+ALGO = CHECKSUM_ALGORITHMS.index('crc32')
+REMOTE = ('127.0.0.1', 1)
+ROUNDS = 30
+NUMBER = 5000
+
+
+class ConcatPacket(RDTPacket):
+    """
+    原来的编解码：包头、补齐、WND 各自 struct.pack 再 += 拼起来，解码时先切出整个包尾再切负载
+    """
+    __slots__ = ('PAYLOAD_REAL',)
+
+    def make_packet(self):
+        self._ = (self._ & ~FLAG_WND) | (FLAG_WND if self.WND is not None else 0)
+        packet = bytearray()
+        packet += ((self.SYN << 7) + (self.ACK << 6) + (self.FIN << 5) + (self.RST << 4) +
+                   (self.SAK << 3) + self._).to_bytes(1, 'big')
+        packet += struct.pack('!2I2H', self.SEQ, self.SEQ_ACK, self.LEN, 0)
+        extra = (4 - self.LEN % 4) % 4
+        self.PAYLOAD_REAL = self.PAYLOAD + b'\x00' * extra
+        if self.WND is not None:
+            self.PAYLOAD_REAL += struct.pack('!I', self.WND)
+        self.CHECKSUM = self._checksum(self.PAYLOAD_REAL)
+        packet[-2:] = struct.pack('!H', self.CHECKSUM)
+        packet += self.PAYLOAD_REAL
+        return packet
+
+    @staticmethod
+    def resolve(bs, addr):
+        r = ConcatPacket(remote=addr, SEQ=0, SEQ_ACK=0)
+        bits, r.SEQ, r.SEQ_ACK, r.LEN, r.CHECKSUM = struct.unpack('!B2I2H', bs[:13])
+        r.SYN, r.ACK, r.FIN, = (bits >> 7) & 1, (bits >> 6) & 1, (bits >> 5) & 1
+        r.RST, r.SAK, r._ = (bits >> 4) & 1, (bits >> 3) & 1, bits & 0x7
+        r.PAYLOAD_REAL = bs[13:]
+        return r
+
+    def check(self):
+        if len(self.PAYLOAD_REAL) % 4 != 0:
+            return False
+        check = self._checksum(self.PAYLOAD_REAL)
+        self.PAYLOAD = self.PAYLOAD_REAL[:self.LEN]
+        if check != self.CHECKSUM or self._ & ~(FLAG_WND | FLAG_PROBE):
+            return False
+        if self._ & FLAG_WND:
+            if len(self.PAYLOAD_REAL) < self.LEN + 4:
+                return False
+            self.WND = struct.unpack('!I', self.PAYLOAD_REAL[-4:])[0]
+        return True
+
+
+def codec(cls, payload: bytes) -> (callable, callable):
+    pkt = cls(remote=REMOTE, ACK=1, SEQ=123456, SEQ_ACK=654321, PAYLOAD=payload, algo=ALGO, WND=1 << 20)
+    datagram = bytes(pkt.make_packet())
+
+    def decode():
+        r = cls.resolve(datagram, REMOTE)
+        r.algo = ALGO
+        assert r.check()
+
+    if cls is RDTPacket:  # 发送循环里写进复用的缓冲区
+        buffer = memoryview(bytearray(len(datagram)))
+        encode = lambda: pkt.pack_into(buffer)
+    else:
+        encode = pkt.make_packet
+    return encode, decode
+
+
+def bench(stmts: dict) -> dict:
+    """
+    各个实现轮流跑 ROUNDS 轮，每个取最快的一轮，机器上别的负载对谁都一样
+    """
+    best = {name: float('inf') for name in stmts}
+    for _ in range(ROUNDS):
+        for name, stmt in stmts.items():
+            best[name] = min(best[name], timeit.timeit(stmt, number=NUMBER) / NUMBER * 1e9)
+    return best
+
+
+def main():
+    print('%-10s %8s %14s %14s' % ('codec', 'payload', 'encode (ns)', 'decode (ns)'))
+    for size in SIZES:
+        payload = os.urandom(size)
+        stmts = {}
+        for name, cls in (('concat', ConcatPacket), ('struct', RDTPacket)):
+            stmts[name, 'encode'], stmts[name, 'decode'] = codec(cls, payload)
+        best = bench(stmts)
+        for name in ('concat', 'struct'):
+            print('%-10s %8d %14.0f %14.0f' % (name, size, best[name, 'encode'], best[name, 'decode']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+快速打开基准：每次新建连接发一个请求收一个回复，统计从 connect 到收完回复的时间
+
+在仓库根目录运行: python -m benchmark.fast_open_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用
+模拟器每个包延迟 DELAY 秒，一个 RTT 大约 2 * DELAY；快速打开的第一个连接拿 cookie，不计入统计
+"""
+import threading
+import time
+
+import network
+from rdt import RDTSocket
+
+ROUNDS = 30
+DELAY = 0.02
+REQUEST = bytes(512)
+RESPONSE = bytes(512)
+
+
+def request_response(port: int, fast_open: bool) -> list:
+    listener = RDTSocket(debug=False, fast_open=fast_open)
+    listener.bind(('127.0.0.1', port))
+
+    def serve():
+        for _ in range(ROUNDS + 1):
+            conn, _ = listener.accept()
+            conn.recv_exactly(len(REQUEST))
+            conn.send(RESPONSE)
+            conn.recv(1)  # 等对方先关
+            conn.close()
+
+    server = threading.Thread(target=serve)
+    server.start()
+    latencies = []
+    for i in range(ROUNDS + 1):
+        start = time.time()
+        client = RDTSocket(debug=False, fast_open=fast_open)
+        client.connect(('127.0.0.1', port))
+        client.send(REQUEST)
+        client.recv_exactly(len(RESPONSE))
+        if i > 0:
+            latencies.append(time.time() - start)
+        client.close()
+        client.block_until_close()
+    server.join()
+    listener.close()
+    listener.block_until_close()
+    return sorted(latencies)
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = network.Server(network.server_address, delay=DELAY)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    port = 9700
+    print('%d request/response connections, %d ms one-way delay, milliseconds' % (ROUNDS, DELAY * 1000))
+    print('%-10s %8s %8s %8s' % ('', 'p50', 'p90', 'max'))
+    for fast_open in (False, True):
+        lat = request_response(port, fast_open)
+        port += 1
+        print('%-10s %8.1f %8.1f %8.1f' % ('fast open' if fast_open else 'normal', lat[len(lat) // 2] * 1000,
+                                           lat[len(lat) * 9 // 10] * 1000, lat[-1] * 1000))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
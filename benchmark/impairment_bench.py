@@ -0,0 +1,45 @@
+"""
+损伤模型下的传输：抖动、乱序、复制、突发丢包、带宽变化时单向传一段数据的吞吐和发包开销（含重传）
+
+在仓库根目录运行: python -m benchmark.impairment_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用；每个场景换一条新的默认链路，种子固定
+"""
+import os
+import threading
+
+import network
+from benchmark.ack_bench import transfer
+
+SIZE = 300000
+SEED = 305
+SCENARIOS = (  # 名字, network.Impairment 的参数
+    ('clean', dict()),
+    ('delay 20ms, jitter 10ms', dict(delay=0.02, jitter=0.01)),
+    ('delay 10ms, reorder 5%', dict(delay=0.01, reorder=0.05)),
+    ('duplicate 5%', dict(duplicate=0.05)),
+    ('burst loss', dict(burst=(0.01, 0.3, 0.0, 0.5))),  # 平均 3% 的包在坏状态，坏状态丢一半
+    ('200k/50k every 1s', dict(rate=200000, schedule=[(0, 200000), (1, 50000)], period=2, buffer=50000)),
+)
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = network.Server(network.server_address)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    data = os.urandom(SIZE)
+    port = 9600
+    print('%d bytes one way, seed %d' % (SIZE, SEED))
+    print('%-26s %10s %8s %10s' % ('scenario', 'KB/s', 'sent', 'overhead'))
+    for scenario, kwargs in SCENARIOS:
+        net.default = network.Impairment(**kwargs)
+        net.reseed(SEED)
+        r = transfer(port, data, dict())
+        port += 1
+        print('%-26s %10.1f %8d %10.3f' % (scenario, SIZE / r['seconds'] / 1000, r['forward'],
+                                           r['forward'] / -(-SIZE // 1024) - 1))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+吞吐矩阵：扫 RATE × BUFFER × LOSS × CORRUPTION × 连接数，每格重复 --repeat 次算均值和 95% 置信区间，
+结果写成 CSV/JSON，再生成 README 那样的 markdown 表（每组 连接数/丢包/出错 一张，行是 buffer，列是 rate）
+
+在仓库根目录运行，例如 README 里丢包出错的两组表:
+    python -m benchmark.matrix_bench --rate 3000 10000 30000 50000 100000 --buffer 10000 50000 100000 \\
+        --loss 0.1 --corruption 5e-5 --connections 1 2 --repeat 3 --json matrix.json --markdown matrix.md
+改了 rdt.py 以后同样的参数再跑一遍，加 --baseline matrix.json 和上次比，有格子明显变慢时退出码为 1
+
+工作负载同测试目录里的 client.py/server.py：客户端把 FILE 发 CNT 遍，服务端原样回显，收齐后按双向字节数算吞吐；
+rate 同时给模拟器和两端的 RDTSocket，0 表示不限速；没给的维度用 Cons.py 里的值
+--mode process 时模拟器、每个服务端、每个客户端各一个进程，同原来开几个终端分别跑；thread 时都在本进程的线程里
+--seed 固定模拟器的随机数，默认 Cons.SEED，重复第 i 次用 seed + i，端口也是固定的，同样的参数再跑时每个流第 n 个包丢不丢、错在哪都一样
+USocket.network 端口不能被占用
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+
+import Cons
+import network
+from rdt import RDTSocket
+
+FILE = os.path.join('single connection test', Cons.FILE)
+PORT = 20000  # 每个连接用一个新端口，免得上一轮没关干净的包串进来
+CLIENT_OFFSET = 20000  # 客户端绑在服务端端口加上这个，端口固定了有种子时每次跑的丢包出错才一样
+# 自由度 1..30 的 t 分布双侧 95% 分位数，再往上按正态分布算
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+DIMENSIONS = ('connections', 'loss', 'corruption', 'buffer', 'rate')  # 一格的键，也是输出里的列顺序
+
+
+def simulator(rate, buffer, loss, corruption, ready, seed=None):
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = network.Server(network.server_address, rate=rate or None, loss=loss, corruption=corruption, buffer=buffer,
+                         seed=seed)
+    if ready is None:
+        return net
+    ready.set()
+    net.serve_forever()
+
+
+def echo_server(port, rate, ready):
+    server = RDTSocket(debug=False, rate=rate or None)
+    server.bind(('127.0.0.1', port))
+    ready.set()
+    conn, _ = server.accept()
+    while True:
+        data = conn.recv(2048)
+        if not data:
+            break
+        conn.send(data)
+    conn.close()
+
+
+def echo_client(port, rate, data, count, result):
+    """
+    往 result 里放 (双向字节数, 秒数, 回显是否一致)
+    """
+    client = RDTSocket(debug=False, rate=rate or None)
+    client.bind(('127.0.0.1', port + CLIENT_OFFSET))
+    client.connect(('127.0.0.1', port))
+    start = time.perf_counter()
+    for _ in range(count):
+        client.send(data)
+    echo = bytearray()
+    while len(echo) < len(data) * count:
+        echo += client.recv(2048)
+    elapsed = time.perf_counter() - start
+    result.put((len(data) * count * 2, elapsed, echo == data * count))
+    client.close()
+    client.block_until_close()
+
+
+def run_once(cell: dict, data: bytes, count: int, port: int, mode: str, timeout: float, net, seed) -> dict:
+    """
+    跑一次：cell['connections'] 对客户端/服务端同时开始，返回每个连接的吞吐；超时或回显不对的连接不算
+    seed 是模拟器这一次的种子，None 时用 Cons.SEED，它也是 None 就不固定
+    """
+    rate, n = cell['rate'], cell['connections']
+    if mode == 'process':
+        Worker, Event, Queue = multiprocessing.Process, multiprocessing.Event, multiprocessing.Queue
+    else:
+        Worker, Event, Queue = threading.Thread, threading.Event, queue.Queue
+        net.rate = rate or None
+        net.loss, net.corruption, net.capacity = cell['loss'], cell['corruption'], cell['buffer']
+        net.reseed(seed)
+    workers = []
+    if mode == 'process':
+        ready = Event()
+        args = (rate, cell['buffer'], cell['loss'], cell['corruption'], ready, seed)
+        workers.append(Worker(target=simulator, args=args, daemon=True))
+        workers[-1].start()
+        ready.wait()
+    result = Queue()
+    for i in range(n):
+        ready = Event()
+        workers.append(Worker(target=echo_server, args=(port + i, rate, ready), daemon=True))
+        workers[-1].start()
+        ready.wait()
+    for i in range(n):
+        workers.append(Worker(target=echo_client, args=(port + i, rate, data, count, result), daemon=True))
+        workers[-1].start()
+    deadline = time.time() + timeout
+    rates, failed = [], 0
+    for _ in range(n):
+        try:
+            size, elapsed, ok = result.get(timeout=max(0.0, deadline - time.time()))
+        except queue.Empty:
+            failed = n - len(rates)
+            break
+        if ok:
+            rates.append(size / elapsed / 1000)
+        else:
+            failed += 1
+    if mode == 'process':
+        for w in workers:
+            w.join(1)  # 客户端正常是等关闭完自己退出，卡住的直接杀掉
+            if w.is_alive():
+                w.terminate()
+    return dict(cell, kbps=statistics.mean(rates) if rates else None, total_kbps=sum(rates), failed=failed)
+
+
+def summarize(cell: dict, runs: list) -> dict:
+    """
+    一格里几次重复的均值、标准差和 95% 置信区间半宽，吞吐是每个连接的平均 KB/s，同 README
+    """
+    values = [r['kbps'] for r in runs if r['kbps'] is not None]
+    summary = dict(cell, n=len(values), failed=sum(r['failed'] for r in runs), mean=None, stdev=None, ci95=None,
+                   total_mean=None)
+    if values:
+        summary['mean'] = statistics.mean(values)
+        summary['total_mean'] = statistics.mean(r['total_kbps'] for r in runs if r['kbps'] is not None)
+        if len(values) > 1:
+            summary['stdev'] = statistics.stdev(values)
+            t = T_95[len(values) - 2] if len(values) - 1 <= len(T_95) else 1.96
+            summary['ci95'] = t * summary['stdev'] / math.sqrt(len(values))
+    return summary
+
+
+def cell_text(summary: dict) -> str:
+    if summary['mean'] is None:
+        return '-'
+    if summary['ci95'] is None:
+        return '%.2f' % summary['mean']
+    return '%.2f ± %.2f' % (summary['mean'], summary['ci95'])
+
+
+def markdown(summaries: list) -> str:
+    """
+    README 的格式：每组 (连接数, 丢包, 出错) 一段说明加一张 buffer × rate 的表
+    """
+    rates = sorted({s['rate'] for s in summaries})
+    lines = []
+    for (n, loss, corruption), group in itertools.groupby(
+            summaries, key=lambda s: (s['connections'], s['loss'], s['corruption'])):
+        table = {(s['buffer'], s['rate']): s for s in group}
+        lines.append('%d server%s & %d client%s' % (n, 's' if n > 1 else '', n, 's' if n > 1 else ''))
+        lines.append('')
+        lines.append('packet loss rate: %g' % loss)
+        lines.append('')
+        lines.append('corruption rate: %g' % corruption)
+        lines.append('')
+        lines.append('| buffer\\rate | ' + ' | '.join('%g' % r if r else 'no limit' for r in rates) + ' |')
+        lines.append('| ----------- | ' + ' | '.join('-' * max(8, len('%g' % r)) for r in rates) + ' |')
+        for buffer in sorted({b for b, _ in table}):
+            cells = [cell_text(table[buffer, r]) if (buffer, r) in table else '' for r in rates]
+            lines.append('| **%d** | ' % buffer + ' | '.join(cells) + ' |')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def compare(summaries: list, baseline: list) -> int:
+    """
+    和上次的结果逐格比较，新的置信区间整个落在旧的下面算退化，返回退化的格子数
+    """
+    old = {tuple(s[k] for k in DIMENSIONS): s for s in baseline}
+    regressions = 0
+    print('%-56s %10s %10s %8s' % ('cell', 'baseline', 'now', 'change'))
+    for s in summaries:
+        key = tuple(s[k] for k in DIMENSIONS)
+        b = old.get(key)
+        if b is None or b['mean'] is None or s['mean'] is None:
+            continue
+        worse = s['mean'] + (s['ci95'] or 0) < b['mean'] - (b['ci95'] or 0)
+        regressions += worse
+        print('%-56s %10.2f %10.2f %+7.1f%%%s' % (' '.join('%s=%g' % (k, v) for k, v in zip(DIMENSIONS, key)),
+                                                  b['mean'], s['mean'], (s['mean'] / b['mean'] - 1) * 100,
+                                                  '  REGRESSION' if worse else ''))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Throughput matrix over the network simulator')
+    parser.add_argument('--rate', type=float, nargs='+', default=[Cons.RATE], help='bytes/s, 0 for no limit')
+    parser.add_argument('--buffer', type=int, nargs='+', default=[Cons.BUFFER], help='simulator buffer in bytes')
+    parser.add_argument('--loss', type=float, nargs='+', default=[Cons.LOSS])
+    parser.add_argument('--corruption', type=float, nargs='+', default=[Cons.CORRUPTION], help='per byte')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1], help='client/server pairs at once')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=Cons.SEED, help='simulator seed, repeat i of a cell uses seed + i')
+    parser.add_argument('--file', default=FILE, help='payload the clients send')
+    parser.add_argument('--count', type=int, default=Cons.CNT, help='times each client sends the file')
+    parser.add_argument('--mode', choices=('process', 'thread'), default='process')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds per run before it counts as failed')
+    parser.add_argument('--csv')
+    parser.add_argument('--json')
+    parser.add_argument('--markdown', help='write the tables here instead of stdout')
+    parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    assert args.repeat >= 1 and min(args.connections) >= 1, 'Need at least one run and one connection'
+    with open(args.file, 'rb') as f:
+        data = f.read()
+    net = None
+    if args.mode == 'thread':
+        net = simulator(None, None, None, None, None)
+        threading.Thread(target=net.serve_forever, daemon=True).start()
+    cells = [dict(zip(DIMENSIONS, values)) for values in itertools.product(
+        args.connections, args.loss, args.corruption, args.buffer, args.rate)]
+    runs, summaries = [], []
+    port = PORT
+    for cell in cells:
+        cell_runs = []
+        for i in range(args.repeat):
+            seed = None if args.seed is None else args.seed + i
+            r = run_once(cell, data, args.count, port, args.mode, args.timeout, net, seed)
+            port += cell['connections']
+            cell_runs.append(dict(r, repeat=i))
+        runs += cell_runs
+        summaries.append(summarize(cell, cell_runs))
+        print(' '.join('%s=%g' % (k, cell[k]) for k in DIMENSIONS), cell_text(summaries[-1]), 'KB/s',
+              '(%d failed)' % summaries[-1]['failed'] if summaries[-1]['failed'] else '', file=sys.stderr, flush=True)
+    if net is not None:
+        net.shutdown()
+        net.server_close()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(summaries[0]))
+            writer.writeheader()
+            writer.writerows(summaries)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'cells': summaries, 'runs': runs}, f, indent=2)
+    tables = markdown(summaries)
+    if args.markdown:
+        with open(args.markdown, 'w') as f:
+            f.write(tables)
+    else:
+        print(tables)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(summaries, json.load(f)['cells']):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+内存基准：用 tracemalloc 量每个在途数据包和每个空闲连接占的字节数
+
+在仓库根目录运行: python -m benchmark.memory_bench
+不走网络：在途包直接用 EventLoop.deal_send 发出去（发送循环没启动，包只进 wait_ack 和定时器堆），
+空闲连接用监听 socket 的 create_simple_socket 建 CONNECTIONS 个放进连接表
+"""
+import gc
+import tracemalloc
+
+import USocket
+from rdt import RDTSocket, ServerEventLoop
+
+PACKETS = 10000
+PKT_LEN = 1024
+CONNECTIONS = 10000
+
+
+def measure(build) -> (int, object):
+    """
+    build 建好的对象都留着，返回它们占的字节数
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, kept
+
+
+def in_flight(loop: ServerEventLoop):
+    skt = loop.socket.create_simple_socket(('127.0.0.1', 1), 0, 0, loop.event_queue)
+    skt.cc.cwnd = PACKETS  # 一次全发出去
+    skt.pacing = False
+    data = bytes(PACKETS * PKT_LEN)
+    loop.send_loop.put = lambda pkt: None  # 发送循环没启动，不让包堆在它的队列里
+    used, skt = measure(lambda: loop.deal_send(skt, data) or skt)
+    assert len(skt.wait_ack) == PACKETS
+    return used
+
+
+def idle_connections(loop: ServerEventLoop):
+    def build():
+        for i in range(CONNECTIONS):
+            remote = ('127.0.0.1', 10000 + i)
+            loop.connections[remote] = loop.socket.create_simple_socket(remote, 0, 0, loop.event_queue)
+        return loop.connections
+
+    sockets = len(USocket.sockets)
+    used, _ = measure(build)
+    return used, len(USocket.sockets) - sockets
+
+
+def main():
+    listener = RDTSocket(debug=False)
+    used = in_flight(ServerEventLoop(listener))
+    print('%d in-flight packets of %d bytes' % (PACKETS, PKT_LEN))
+    print('  %.0f bytes per packet, %.0f beyond the payload' % (used / PACKETS, used / PACKETS - PKT_LEN))
+    used, opened = idle_connections(ServerEventLoop(listener))
+    print('%d idle connections' % CONNECTIONS)
+    print('  %.0f bytes per connection, %d UDP sockets opened' % (used / CONNECTIONS, opened))
+
+
+if __name__ == '__main__':
+    main()
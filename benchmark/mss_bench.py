@@ -0,0 +1,47 @@
+"""
+MSS 基准：不同包长下单向传一段数据的吞吐和发包数，最后一行是从 MAX_PKT_LEN 开始探测
+
+在仓库根目录运行: python -m benchmark.mss_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用
+模拟器一次最多读 network.MAX_DATAGRAM（8192）字节，datagram_size(mss) 超过它的包会被截断，所以固定 MSS 最大只测到 8164；
+模拟器缓冲区按字节算，默认的 BUFFER 只够排一个大包，这里调大
+"""
+import os
+import threading
+
+import network
+from benchmark.ack_bench import transfer
+
+SIZE = 2000000
+LOSSES = (0.0, 0.02)
+SETTINGS = (  # 名字, RDTSocket 参数
+    ('512', dict(mss=512)),
+    ('1024', dict()),  # 默认
+    ('2048', dict(mss=2048)),
+    ('4096', dict(mss=4096)),
+    ('8164', dict(mss=8164)),
+    ('probe 60000', dict(mss=60000, mss_probe=True)),
+)
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    network.BUFFER = 1 << 20
+    net = network.Server(network.server_address)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    data = os.urandom(SIZE)
+    port = 9600
+    print('%d bytes one way, simulator buffer %d bytes' % (SIZE, network.BUFFER))
+    print('%-6s %-12s %10s %8s' % ('loss', 'mss', 'KB/s', 'forward'))
+    for loss in LOSSES:
+        network.LOSS = loss
+        for name, policy in SETTINGS:
+            r = transfer(port, data, policy)
+            port += 1
+            print('%-6.2f %-12s %10.1f %8d' % (loss, name, SIZE / r['seconds'] / 1000, r['forward']))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+模拟器转发速率：不限速、不丢包时每秒转发多少个数据报，比较原来每个数据报一个线程的 ThreadingUDPServer
+和现在单线程按时间调度的 network.Server；出错率不为 0 时原来逐字节掷骰子，现在按间隔抽出错位置
+
+在仓库根目录运行: python -m benchmark.network_bench
+模拟器在单独的进程里，本进程只管发和收；发送端最多 WINDOW 个包在路上，超时没回来的算丢了接着发
+USocket.network 端口不能被占用
+"""
+import multiprocessing
+import random
+import socket
+import threading
+import time
+from socketserver import ThreadingUDPServer
+
+import network
+
+DATAGRAMS = 20000
+SIZE = 1024 + 8 + 13  # 一个满的 RDT 包加上模拟器的地址头
+WINDOW = 32
+CORRUPTIONS = (0.0, 5e-5, 1e-3)
+
+lock = threading.Lock()
+
+
+class ThreadingServer(ThreadingUDPServer):
+    """
+    原来的模拟器：每个数据报一个线程，全局锁里 sleep 模拟带宽，逐字节 random.random() 决定出不出错
+    """
+
+    def __init__(self, addr, rate=None, delay=None, loss=None, corruption=None, buffer=None):
+        super().__init__(addr, None)
+        self.rate = rate
+        self.buffer = 0
+        self.delay = delay
+        self.loss = loss
+        self.corruption = corruption
+        self.capacity = buffer
+
+    def verify_request(self, request, client_address):
+        capacity = network.BUFFER if self.capacity is None else self.capacity
+        if self.buffer < capacity:
+            self.buffer += len(request[0])
+            return True
+        else:
+            network.print('爆炸了')
+            return False
+
+    def finish_request(self, request, client_address):
+        data, socket = request
+        with lock:
+            if random.random() < (network.LOSS if self.loss is None else self.loss):
+                self.buffer -= len(data)
+                return
+            if self.rate:
+                time.sleep(len(data) / self.rate)
+            self.buffer -= len(data)
+        to = network.bytes_to_addr(data[:8])
+        dara = bytearray(data)
+        network.print(client_address, to)
+        corruption = network.CORRUPTION if self.corruption is None else self.corruption
+        for i in range(len(data[8:])):
+            if random.random() < corruption:
+                dara[i + 8] = data[i + 8] ^ 0x7F
+                network.print('corruption')
+        socket.sendto(network.addr_to_bytes(client_address) + dara[8:], to)
+
+
+def simulator(cls, corruption: float, ready):
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    net = cls(network.server_address, loss=0.0, corruption=corruption, buffer=1 << 30)
+    ready.set()
+    net.serve_forever()
+
+
+def drive() -> (float, int):
+    """
+    发 DATAGRAMS 个数据报经模拟器转给自己，返回每秒收到的个数和丢了几个
+    """
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    sink.settimeout(0.5)
+    source = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    datagram = network.addr_to_bytes(sink.getsockname()) + bytes(SIZE - 8)
+    sent = received = lost = 0
+    start = time.perf_counter()
+    while received + lost < DATAGRAMS:
+        while sent < DATAGRAMS and sent - received - lost < WINDOW:
+            source.sendto(datagram, network.server_address)
+            sent += 1
+        try:
+            sink.recv(0x10000)
+            received += 1
+        except socket.timeout:
+            lost = sent - received
+    elapsed = time.perf_counter() - start
+    sink.close()
+    source.close()
+    return received / elapsed, lost
+
+
+def main():
+    print('%d datagrams of %d bytes, at most %d in flight' % (DATAGRAMS, SIZE, WINDOW))
+    print('%-12s %-10s %12s %8s' % ('corruption', 'simulator', 'datagrams/s', 'lost'))
+    for corruption in CORRUPTIONS:
+        for name, cls in (('threading', ThreadingServer), ('scheduled', network.Server)):
+            ready = multiprocessing.Event()
+            net = multiprocessing.Process(target=simulator, args=(cls, corruption, ready), daemon=True)
+            net.start()
+            ready.wait()
+            rate, lost = drive()
+            net.terminate()
+            net.join()
+            print('%-12g %-10s %12.0f %8d' % (corruption, name, rate, lost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+乱序重组基准：回放 10 万个按 10% 丢包重传、再局部乱序的包，比较原来的有序列表和现在的 SEQ 字典
+
+在仓库根目录运行: python -m benchmark.reassembly_bench
+"""
+import random
+import time
+
+from rdt import RDTPacket, SimpleRDT
+
+PACKETS = 100000
+LOSS = 0.1
+WINDOW = 512  # 丢掉的包大约晚这么多个包才重传到
+REORDER = 8  # 没丢的包最多错开这么多个位置
+PKT_LEN = 1024
+
+
+class ListReassembly:
+    """
+    原来 SimpleRDT.deal_recv_data 的做法：有序列表线性查找插入，pop(0) 取出
+    """
+
+    def __init__(self, recv_offset: int):
+        self.SEQ_ACK = recv_offset
+        self.recv_buffer = []
+        self.data = bytearray()
+
+    def deal_recv_data(self, pkt: RDTPacket) -> (bool, int):
+        if pkt.SEQ == self.SEQ_ACK:
+            self.data.extend(pkt.PAYLOAD)
+            self.SEQ_ACK += pkt.LEN
+            while len(self.recv_buffer) > 0 and self.recv_buffer[0].SEQ == self.SEQ_ACK:
+                pkt = self.recv_buffer.pop(0)
+                self.data.extend(pkt.PAYLOAD)
+                self.SEQ_ACK += pkt.LEN
+            return True, 0
+        elif pkt.SEQ > self.SEQ_ACK:
+            index = 0
+            while len(self.recv_buffer) > index:
+                if self.recv_buffer[index].SEQ < pkt.SEQ:
+                    index += 1
+                elif self.recv_buffer[index].SEQ == pkt.SEQ:
+                    return False, pkt.SEQ
+                else:
+                    self.recv_buffer.insert(index, pkt)
+                    return False, pkt.SEQ
+            self.recv_buffer.append(pkt)
+            return False, pkt.SEQ
+        else:
+            return False, 0
+
+
+def arrivals(seed: int = 305) -> list:
+    """
+    每个包的到达位置：丢一次就晚 WINDOW 个位置再到，没丢的随机错开几个位置
+    """
+    rnd = random.Random(seed)
+    payload = bytes(PKT_LEN)
+    order = []
+    for i in range(PACKETS):
+        pos = i + rnd.random() * REORDER
+        while rnd.random() < LOSS:
+            pos += WINDOW
+        order.append((pos, RDTPacket(remote=None, SEQ=i * PKT_LEN, SEQ_ACK=0, PAYLOAD=payload)))
+    order.sort(key=lambda x: x[0])
+    return [pkt for _, pkt in order]
+
+
+def replay(receiver, pkts: list) -> float:
+    start = time.perf_counter()
+    for pkt in pkts:
+        receiver.deal_recv_data(pkt)
+    cost = time.perf_counter() - start
+    assert receiver.SEQ_ACK == PACKETS * PKT_LEN and len(receiver.data) == PACKETS * PKT_LEN
+    return cost
+
+
+def main():
+    pkts = arrivals()
+    simple = SimpleRDT(None, False, 0, 0, ('127.0.0.1', 1), None)
+    results = {'list': replay(ListReassembly(0), pkts), 'dict': replay(simple, pkts)}
+    print('%d packets, loss %.0f%%, retransmit distance %d packets' % (PACKETS, LOSS * 100, WINDOW))
+    for name, cost in results.items():
+        print('%-5s %8.3f s %8.2f us/packet' % (name, cost, cost / len(pkts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+重传超时基准：丢包时一问一答的往返延迟分布，主要看尾延迟
+
+在仓库根目录运行: python -m benchmark.rto_bench
+会在本进程里起 network.Server 模拟器，USocket.network 端口不能被占用
+min_rto=0.75 大致相当于原来 BASE_RTT * 2 + EXTRA_ACK_WAIT 的下限
+"""
+import threading
+import time
+
+import network
+from rdt import RDTSocket
+
+ROUNDS = 200
+MESSAGE = bytes(512)
+LOSS = 0.1
+SETTINGS = (  # 名字, RDTSocket 参数
+    ('floor 0.75s', dict(min_rto=0.75)),
+    ('default', dict()),
+    ('min_rto 20ms', dict(min_rto=0.02)),
+)
+
+
+def ping_pong(port: int, policy: dict) -> list:
+    listener = RDTSocket(debug=False, **policy)
+    listener.bind(('127.0.0.1', port))
+
+    def serve():
+        conn, _ = listener.accept()
+        while True:
+            bs = conn.recv_exactly(len(MESSAGE))
+            if len(bs) < len(MESSAGE):
+                break
+            conn.send(bs)
+        conn.close()
+
+    server = threading.Thread(target=serve)
+    server.start()
+    client = RDTSocket(debug=False, **policy)
+    client.connect(('127.0.0.1', port))
+    latencies = []
+    for _ in range(ROUNDS):
+        start = time.time()
+        client.send(MESSAGE)
+        client.recv_exactly(len(MESSAGE))
+        latencies.append(time.time() - start)
+    client.close()
+    client.block_until_close()
+    server.join()
+    listener.close()
+    listener.block_until_close()
+    return sorted(latencies)
+
+
+def main():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    network.LOSS = LOSS
+    net = network.Server(network.server_address)
+    threading.Thread(target=net.serve_forever, daemon=True).start()
+    port = 9500
+    print('%d round trips of %d bytes, loss %.2f, milliseconds' % (ROUNDS, len(MESSAGE), LOSS))
+    print('%-14s %8s %8s %8s %8s %8s' % ('', 'p50', 'p90', 'p99', 'max', 'total s'))
+    for name, policy in SETTINGS:
+        lat = ping_pong(port, policy)
+        port += 1
+        print('%-14s %8.1f %8.1f %8.1f %8.1f %8.2f' % (name, lat[len(lat) // 2] * 1000, lat[len(lat) * 9 // 10] * 1000,
+                                                       lat[len(lat) * 99 // 100] * 1000, lat[-1] * 1000, sum(lat)))
+    net.shutdown()
+    net.server_close()
+
+
+if __name__ == '__main__':
+    main()
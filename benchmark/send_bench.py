@@ -0,0 +1,70 @@
+"""
+发送循环基准：每个数据包后面跟一个同远端的纯ACK（接收方逐包确认的情形），
+比较原来逐包发送的 SendLoop 和现在按批取、合并多余ACK的 SendLoop
+
+在仓库根目录运行: python -m benchmark.send_bench
+包会发到 USocket.network，没有模拟器在跑时由这里开一个丢弃用的 UDP 套接字
+"""
+import socket
+import time
+
+from USocket import network
+from rdt import RDTPacket, RDTSocket, SendLoop
+
+PACKETS = 20000
+REMOTE = ('127.0.0.1', 9999)
+
+
+class PerPacketSendLoop(SendLoop):
+    """
+    原来的 SendLoop：一次取一个包，队列空时睡 10us
+    """
+
+    def run(self) -> None:
+        self.start_time = time.time()
+        while True:
+            if not self.send_queue.empty():
+                pkt: RDTPacket = self.send_queue.get_nowait()
+                if pkt == 0:
+                    break
+                self.pkt_cnt += 1
+                self.wakeup_cnt += 1
+                self.socket.sendto(pkt.make_packet(), pkt.remote)
+                self.sendto_cnt += 1
+            else:
+                time.sleep(0.00001)
+
+
+def bench(loop_class) -> dict:
+    rdt_socket = RDTSocket(debug=False)
+    loop = loop_class(rdt_socket, None)
+    payload = bytes(1024)
+    for i in range(PACKETS):
+        loop.put(RDTPacket(remote=REMOTE, ACK=1, SEQ=i * 1024, SEQ_ACK=i, PAYLOAD=payload))
+        loop.put(RDTPacket(remote=REMOTE, ACK=1, SEQ=(i + 1) * 1024, SEQ_ACK=i + 1))
+    loop.put(0)
+    loop.start()  # 先把队列填满，只计发送本身的耗时
+    loop.join()
+    rdt_socket.force_close()
+    return loop.report()
+
+
+def main():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sink.bind(network)
+    except OSError:
+        sink.close()
+        sink = None  # 模拟器已经在监听了
+    results = {'per-packet': bench(PerPacketSendLoop), 'batched': bench(SendLoop)}
+    if sink is not None:
+        sink.close()
+    print('%d data packets + %d pure ACKs queued' % (PACKETS, PACKETS))
+    print('%-11s %10s %10s %12s %12s %14s' % ('', 'sendto', 'wakeups', 'pkts/s', 'syscall/pkt', 'pkts/wakeup'))
+    for name, r in results.items():
+        print('%-11s %10d %10d %12.0f %12.3f %14.1f' % (name, r['sendto'], r['wakeups'], r['packets_per_second'],
+                                                        r['syscalls_per_packet'], r['packets_per_wakeup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+分片基准：CLIENTS 个连接同时往一个监听 socket 上传，比较不同分片数下服务端的总吞吐
+
+在仓库根目录运行: python -m benchmark.shard_bench
+模拟器、服务端、客户端各在自己的进程里，互相不抢 GIL；客户端分到 CLIENT_PROCS 个进程，每个连接一个线程
+USocket.network 端口不能被占用；模拟器缓冲区按字节算，64 个连接同时发时默认的 BUFFER 太小，这里调大
+服务端是 shard.ShardedListener，每个分片一个进程；机器的核数比 模拟器 + 分片 + 客户端 的进程数少时看不出扩展
+"""
+import multiprocessing
+import threading
+import time
+
+import network
+from rdt import RDTSocket
+from shard import ShardedListener
+
+SHARDS = (1, 2, 4, 8)
+CLIENTS = 64
+CLIENT_PROCS = 4
+SIZE = 100000  # 每个连接上传的字节数
+
+
+def simulator():
+    network.print = lambda *args, **kwargs: None  # 模拟器每个包都打印，基准里关掉
+    network.BUFFER = 1 << 24
+    network.Server(network.server_address).serve_forever()
+
+
+def server(port: int, shards: int, ready, result):
+    listener = ShardedListener(shards, debug=False)
+    listener.bind(('127.0.0.1', port))
+    received = []
+
+    def serve(conn):
+        received.append(len(conn.recv_exactly(SIZE)))
+        conn.send(b'.')  # 收完了告诉对方再关
+        conn.recv(1)
+        conn.close()
+
+    start = None
+    workers = []
+    ready.set()
+    for _ in range(CLIENTS):
+        conn, _ = listener.accept()
+        if start is None:
+            start = time.time()
+        workers.append(threading.Thread(target=serve, args=(conn,)))
+        workers[-1].start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+    listener.close()
+    listener.block_until_close()
+    result.put((sum(received), elapsed))
+
+
+def clients(port: int, n: int):
+    data = bytes(SIZE)
+
+    def upload():
+        c = RDTSocket(debug=False)
+        c.connect(('127.0.0.1', port))
+        c.send(data)
+        c.recv_exactly(1)
+        c.close()
+        c.block_until_close()
+
+    threads = [threading.Thread(target=upload) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run(port: int, shards: int) -> (int, float):
+    ready, result = multiprocessing.Event(), multiprocessing.Queue()
+    srv = multiprocessing.Process(target=server, args=(port, shards, ready, result))
+    srv.start()
+    ready.wait()
+    procs = [multiprocessing.Process(target=clients, args=(port, CLIENTS // CLIENT_PROCS)) for _ in range(CLIENT_PROCS)]
+    for p in procs:
+        p.start()
+    total, elapsed = result.get()
+    for p in procs:
+        p.join()
+    srv.join()
+    return total, elapsed
+
+
+def main():
+    net = multiprocessing.Process(target=simulator, daemon=True)
+    net.start()
+    time.sleep(0.5)
+    port = 9800
+    print('%d clients x %d bytes upload' % (CLIENTS, SIZE))
+    print('%-8s %10s %10s' % ('shards', 'seconds', 'KB/s'))
+    for shards in SHARDS:
+        total, elapsed = run(port, shards)
+        port += 1
+        print('%-8d %10.2f %10.1f' % (shards, elapsed, total / elapsed / 1000))
+    net.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+定时器基准：10k 个未到期定时器时，原来的有序列表和现在的堆各操作的平均耗时
+
+在仓库根目录运行: python -m benchmark.timer_bench
+"""
+import random
+import time
+
+from rdt import EventLoop, RDTEvent, RDTEventType, RDTSocket, RDTTimer
+
+OUTSTANDING = 10000
+OPS = 10000
+
+
+class ListTimers:
+    """
+    原来 EventLoop 的定时器实现：有序插入、remove 取消、pop(0) 触发
+    """
+
+    def __init__(self):
+        self.timers = []
+
+    def push_timer(self, timeout: float, ev: RDTEvent):
+        index = 0
+        timer = RDTTimer(timeout=timeout, e=ev)
+        while len(self.timers) > index:
+            if self.timers[index].target_time <= timer.target_time:
+                index += 1
+            else:
+                self.timers.insert(index, timer)
+                return timer
+        self.timers.append(timer)
+        return timer
+
+    def cancel_timer(self, timer: RDTTimer):
+        self.timers.remove(timer)
+
+    def fire_timers(self, now: float):
+        while len(self.timers) > 0 and self.timers[0].target_time <= now:
+            self.timers.pop(0)
+
+
+def bench(timers) -> dict:
+    random.seed(305)
+    ev = RDTEvent(RDTEventType.ACK_TIMEOUT, None)
+    pending = [timers.push_timer(random.uniform(10, 20), ev) for _ in range(OUTSTANDING)]
+
+    start = time.perf_counter()
+    for _ in range(OPS):
+        pending.append(timers.push_timer(random.uniform(10, 20), ev))
+    push = time.perf_counter() - start
+
+    random.shuffle(pending)
+    start = time.perf_counter()
+    for timer in pending[:OPS]:
+        timers.cancel_timer(timer)
+    cancel = time.perf_counter() - start
+
+    start = time.perf_counter()
+    timers.fire_timers(float('inf'))
+    fire = time.perf_counter() - start
+    return {'push': push / OPS, 'cancel': cancel / OPS, 'fire': fire / OUTSTANDING}
+
+
+def main():
+    loop = EventLoop(RDTSocket(debug=False))
+    results = {'list': bench(ListTimers()), 'heap': bench(loop)}
+    loop.socket.force_close()
+    print('%d outstanding timers, us per operation' % OUTSTANDING)
+    print('%-6s %10s %10s %10s' % ('', 'push', 'cancel', 'fire'))
+    for name, r in results.items():
+        print('%-6s %10.2f %10.2f %10.2f' % (name, r['push'] * 1e6, r['cancel'] * 1e6, r['fire'] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
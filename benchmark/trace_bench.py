@@ -0,0 +1,83 @@
+"""
+跟踪开销基准：发送循环 send_batch 和接收循环 deal_datagram 每个包的耗时，不跟踪、跟踪、打开 debug 打印三种情况
+
+在仓库根目录运行: python -m benchmark.trace_bench
+包会发到 USocket.network，没有模拟器在跑时由这里开一个丢弃用的 UDP 套接字；debug 打印写到 /dev/null
+"""
+import contextlib
+import os
+import socket
+import time
+
+from USocket import network
+from rdt import RDTPacket, RDTSocket, SendLoop, RecvLoop
+from tracer import PacketTracer
+
+PACKETS = 5000
+ROUNDS = 10
+REMOTE = ('127.0.0.1', 9999)
+
+
+class NullLoop:
+    """
+    只接事件不处理的事件循环，接收循环解析出来的包放进来就丢掉
+    """
+
+    def put(self, e_type, e_args):
+        pass
+
+    def checksum_of(self, remote):
+        return 0
+
+
+def packets() -> list:
+    payload = bytes(1024)
+    return [RDTPacket(remote=REMOTE, ACK=1, SEQ=i * 1024, SEQ_ACK=i, PAYLOAD=payload, WND=1 << 20)
+            for i in range(PACKETS)]
+
+
+def send_cost(rdt_socket: RDTSocket, pkts: list) -> float:
+    loop = SendLoop(rdt_socket, None)
+    start = time.perf_counter()
+    loop.send_batch(pkts)
+    return (time.perf_counter() - start) / len(pkts) * 1e9
+
+
+def recv_cost(rdt_socket: RDTSocket, datagrams: list) -> float:
+    loop = RecvLoop(rdt_socket, NullLoop())
+    start = time.perf_counter()
+    for bs in datagrams:
+        loop.deal_datagram(bs, REMOTE)
+    return (time.perf_counter() - start) / len(datagrams) * 1e9
+
+
+def main():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sink.bind(network)
+    except OSError:
+        sink.close()
+        sink = None  # 模拟器已经在监听了
+    pkts = packets()
+    datagrams = [bytes(pkt.make_packet()) for pkt in pkts]
+    settings = (('off', dict(debug=False)), ('tracer', dict(debug=False, tracer=PacketTracer(PACKETS))),
+                ('debug', dict(debug=True)))
+    sockets = {name: RDTSocket(**kwargs) for name, kwargs in settings}
+    best = {name: [float('inf'), float('inf')] for name in sockets}
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        for _ in range(ROUNDS):  # 轮流跑，每种取最快的一轮
+            for name, rdt_socket in sockets.items():
+                best[name][0] = min(best[name][0], send_cost(rdt_socket, pkts))
+                best[name][1] = min(best[name][1], recv_cost(rdt_socket, datagrams))
+    for rdt_socket in sockets.values():
+        rdt_socket.force_close()
+    print('%d packets of 1024 bytes, ns per packet' % PACKETS)
+    print('%-8s %10s %10s' % ('', 'send', 'recv'))
+    for name, (send, recv) in best.items():
+        print('%-8s %10.0f %10.0f' % (name, send, recv))
+    if sink is not None:
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+拥塞控制算法
+
+每个连接一个控制器实例，窗口以包为单位（SimpleRDT.SEND_WINDOW_SIZE 就是 cwnd），事件循环在这几处回调：
+-   on_ack(acked_bytes)      累计ACK或者SAK确认了新数据
+-   on_rtt_sample(rtt)       拿到一个RTT样本（按 Karn 算法，重传过的包不给样本）
+-   on_loss(ahead, rto)      一个包等ACK超时，ahead 是它前面还没确认的包数，rto 是当前的超时时间
+控制器给出 cwnd（包）和 pacing_rate（字节/秒，None 表示不限）
+
+用 RDTSocket(congestion='cubic') 选择，名字见 CONTROLLERS
+"""
+import time
+from collections import deque
+from math import log
+
+INIT_WINDOW = 3  # 初始窗口
+MIN_WINDOW = 2.0  # 最小窗口，和 NewReno 的 ssthresh 下限一样，小于 2 时 deal_resend 一个包也不重发
+
+INCREASE_ = 0  # Vegas 升窗界线
+DECREASE_ = 3  # Vegas 降窗界线
+RTT_ = 0.95  # Vegas 基准RTT对于上次的保留系数
+BOMB_RATE = 0.15  # Vegas 超时包前面未确认的包占窗口的比例，超过就强制降窗
+
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+BBR_STARTUP_GAIN = 2.89
+BBR_CYCLE = (1.25, 0.75, 1, 1, 1, 1, 1, 1)  # ProbeBW 阶段每个 min_rtt 轮换的增益
+BBR_BW_ROUNDS = 10  # 最大带宽滤波器的长度，单位 min_rtt
+BBR_MIN_RTT_WIN = 10  # min_rtt 的有效期，秒
+BBR_MIN_WINDOW = 4
+
+
+class CongestionControl:
+    """
+    拥塞控制器的基类，什么都不做，窗口固定在 INIT_WINDOW
+    """
+    name = 'fixed'
+
+    def __init__(self, mss: int = 1024):
+        self.mss = mss  # 每个满包的字节数，字节和包互相换算用
+        self.cwnd = float(INIT_WINDOW)
+        self.srtt = 0  # 平滑RTT，pacing_rate 的默认实现用
+
+    @property
+    def pacing_rate(self):
+        """
+        默认一个 srtt 发完一个窗口
+        """
+        if self.srtt == 0:
+            return None
+        return self.cwnd * self.mss / self.srtt
+
+    def on_ack(self, acked_bytes: int):
+        pass
+
+    def on_rtt_sample(self, rtt: float):
+        self.srtt = rtt if self.srtt == 0 else self.srtt * 0.875 + rtt * 0.125
+
+    def on_loss(self, ahead: float, rto: float):
+        pass
+
+
+class Vegas(CongestionControl):
+    """
+    原来写死在 SimpleRDT.deal_RTT 里的算法：按 (1 - (BASE_RTT/RTT)^3) * 窗口 估计排队的包数调窗，
+    超时的包前面堆了太多未确认的包时窗口乘 0.65
+    """
+    name = 'vegas'
+
+    def __init__(self, mss: int = 1024):
+        super().__init__(mss)
+        self.base_rtt = 0  # 基准应答延迟
+        self.last_bomb = 0  # 上次强制降窗
+
+    def on_rtt_sample(self, rtt: float):
+        super().on_rtt_sample(rtt)
+        if self.base_rtt == 0:
+            self.base_rtt = rtt
+        tr_differ = (1 - (self.base_rtt / rtt) ** 3) * self.cwnd if rtt > 0 else 0
+        if tr_differ > DECREASE_:
+            self.cwnd -= min(0.8, log(self.cwnd) / max(self.cwnd / 3, 1))
+        elif tr_differ < INCREASE_:
+            self.cwnd += 1 / max(1.0, log(self.cwnd))
+        else:
+            self.cwnd += log(self.cwnd + 1) / self.cwnd
+        self.base_rtt = self.base_rtt * RTT_ + (1 - RTT_) * rtt
+
+    def on_loss(self, ahead: float, rto: float):
+        now = time.time()
+        if self.cwnd > 1.6 and ahead / self.cwnd > BOMB_RATE and now - self.last_bomb > rto:  # 连续丢包强制降窗
+            self.cwnd *= 0.65
+            self.last_bomb = now
+
+
+class NewReno(CongestionControl):
+    """
+    慢启动 + 拥塞避免（每个窗口 +1），丢包时窗口减半，一个 RTO 内的多次丢包只算一次
+    """
+    name = 'newreno'
+
+    def __init__(self, mss: int = 1024):
+        super().__init__(mss)
+        self.ssthresh = float('inf')
+        self.recover_until = 0  # 这之前的丢包算同一次
+
+    def on_ack(self, acked_bytes: int):
+        acked = acked_bytes / self.mss
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+
+    def on_loss(self, ahead: float, rto: float):
+        now = time.time()
+        if now < self.recover_until:
+            return
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = self.ssthresh
+        self.recover_until = now + rto
+
+
+class Cubic(CongestionControl):
+    """
+    CUBIC：拥塞避免时窗口按 C*(t-K)^3 + W_max 增长，取它和 Reno 估计的较大值
+    """
+    name = 'cubic'
+
+    def __init__(self, mss: int = 1024):
+        super().__init__(mss)
+        self.ssthresh = float('inf')
+        self.w_max = 0.0  # 上次丢包时的窗口
+        self.k = 0.0  # 回到 w_max 需要的时间
+        self.epoch_start = 0  # 这轮拥塞避免开始的时间
+        self.w_est = 0.0  # Reno 友好的窗口估计
+        self.recover_until = 0
+
+    def on_ack(self, acked_bytes: int):
+        acked = acked_bytes / self.mss
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+            return
+        now = time.time()
+        if self.epoch_start == 0:
+            self.epoch_start = now
+            if self.w_max < self.cwnd:
+                self.k = 0.0
+                self.w_max = self.cwnd
+            self.w_est = self.cwnd
+        t = now - self.epoch_start + self.srtt
+        target = CUBIC_C * (t - self.k) ** 3 + self.w_max
+        self.w_est += 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * acked / self.cwnd
+        target = max(target, self.w_est)
+        if target > self.cwnd:
+            self.cwnd += min(acked, acked * (target - self.cwnd) / self.cwnd)  # 最快也就是慢启动
+        else:
+            self.cwnd += 0.01 * acked / self.cwnd
+
+    def on_loss(self, ahead: float, rto: float):
+        now = time.time()
+        if now < self.recover_until:
+            return
+        self.w_max = self.cwnd
+        self.cwnd = max(self.cwnd * CUBIC_BETA, MIN_WINDOW)
+        self.ssthresh = max(self.cwnd, 2.0)
+        self.k = (self.w_max * (1 - CUBIC_BETA) / CUBIC_C) ** (1 / 3)
+        self.epoch_start = 0
+        self.recover_until = now + rto
+
+
+class BBR(CongestionControl):
+    """
+    BBR 式的控制器：估计瓶颈带宽（最近几轮交付速率的最大值）和最小RTT，
+    按 增益*带宽 发送，窗口是两倍 BDP，不把丢包当拥塞信号
+    """
+    name = 'bbr'
+
+    def __init__(self, mss: int = 1024):
+        super().__init__(mss)
+        self.delivered = 0  # 累计交付字节
+        self.samples = deque()  # (时间, delivered)，用来算最近一个 min_rtt 的交付速率
+        self.bw_samples = deque()  # (时间, 速率)，最大值滤波
+        self.btl_bw = 0.0  # 瓶颈带宽估计，字节/秒
+        self.min_rtt = 0
+        self.min_rtt_at = 0
+        self.startup = True
+        self.full_bw = 0.0  # 慢启动阶段带宽不再增长的判断
+        self.full_bw_cnt = 0
+        self.round_start = 0  # 当前这轮（一个 min_rtt）开始的时间
+        self.cycle_index = 0
+
+    @property
+    def pacing_gain(self) -> float:
+        return BBR_STARTUP_GAIN if self.startup else BBR_CYCLE[self.cycle_index]
+
+    @property
+    def pacing_rate(self):
+        if self.btl_bw == 0:
+            return None
+        return self.pacing_gain * self.btl_bw
+
+    def on_rtt_sample(self, rtt: float):
+        super().on_rtt_sample(rtt)
+        now = time.time()
+        if self.min_rtt == 0 or rtt <= self.min_rtt or now - self.min_rtt_at > BBR_MIN_RTT_WIN:
+            self.min_rtt = rtt
+            self.min_rtt_at = now
+
+    def on_ack(self, acked_bytes: int):
+        now = time.time()
+        self.delivered += acked_bytes
+        self.samples.append((now, self.delivered))
+        if self.min_rtt == 0:
+            self.cwnd += acked_bytes / self.mss  # 还没有RTT样本，先按慢启动走
+            return
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.min_rtt:
+            self.samples.popleft()
+        then, delivered_then = self.samples[0]
+        if now - then >= self.min_rtt / 2:  # 间隔太短的样本会被一批同时到的ACK放大
+            self.bw_samples.append((now, (self.delivered - delivered_then) / (now - then)))
+        while len(self.bw_samples) > 0 and now - self.bw_samples[0][0] > BBR_BW_ROUNDS * self.min_rtt:
+            self.bw_samples.popleft()
+        self.btl_bw = max((bw for _, bw in self.bw_samples), default=0.0)
+        if now - self.round_start >= self.min_rtt:
+            self.on_round(now)
+        bdp = self.btl_bw * self.min_rtt / self.mss
+        self.cwnd = max(bdp * (BBR_STARTUP_GAIN if self.startup else 2), BBR_MIN_WINDOW)
+
+    def on_round(self, now: float):
+        self.round_start = now
+        if self.startup:
+            if self.btl_bw >= self.full_bw * 1.25:
+                self.full_bw = self.btl_bw
+                self.full_bw_cnt = 0
+            else:
+                self.full_bw_cnt += 1
+                if self.full_bw_cnt >= 3:  # 三轮带宽没涨 25%，管道满了
+                    self.startup = False
+        else:
+            self.cycle_index = (self.cycle_index + 1) % len(BBR_CYCLE)
+
+
+CONTROLLERS = {c.name: c for c in (CongestionControl, Vegas, NewReno, Cubic, BBR)}
+
+
+def make_controller(name: str, mss: int = 1024) -> CongestionControl:
+    assert name in CONTROLLERS, 'Unknown congestion control: %s' % name
+    return CONTROLLERS[name](mss)
@@ -1,10 +1,17 @@
-from socket import inet_aton, inet_ntoa
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF, SO_SNDBUF, inet_aton, inet_ntoa
+from bisect import bisect_right
+from collections import deque
+import heapq
+import math
 import random, time
+import selectors
 import threading
-from socketserver import ThreadingUDPServer
 from Cons import *
 
-lock = threading.Lock()
+SOCKET_BUFFER = 1 << 22  # 内核收发缓冲区，单线程处理一批的时候别让内核先把包丢了
+BATCH = 256  # 一次最多收这么多个数据报就回去看有没有该送达的
+REORDER_DELAY = 0.01  # 被挑中乱序的包额外晚到的秒数
+MAX_DATAGRAM = 8192  # 一次最多收的字节数，和原来 UDPServer 的 max_packet_size 一样，超过的部分被截掉
 
 
 def bytes_to_addr(bytes):
@@ -15,68 +22,281 @@ def addr_to_bytes(addr):
     return inet_aton(addr[0]) + addr[1].to_bytes(4, 'big')
 
 
-class Server(ThreadingUDPServer):
-    def __init__(self, addr, rate=None, delay=None):
-        super().__init__(addr, None)
+class Impairment:
+    """
+    一条链路的损伤参数和它的瓶颈队列；几个流用同一个 Impairment 就是共用一条链路、一个队列
+
+    -   rate: 带宽 bytes/s，None 不限；schedule=[(秒, rate), ...] 按模拟器启动后的时间切换带宽，period 不为 None 时循环
+    -   buffer: 瓶颈队列字节数，满了尾部丢弃
+    -   delay, jitter: 传播时延，加上 [-jitter, jitter] 均匀分布的抖动（不小于 0），抖动大了自然会乱序
+    -   reorder: 包被挑出来多晚到 reorder_delay 秒的概率，让后面的包先到
+    -   duplicate: 包被复制一份的概率，复制的那份单独算时延和出错
+    -   loss: 独立丢包率；burst=(p, r, 好状态丢包率, 坏状态丢包率) 时改用 Gilbert-Elliott 模型，
+        每个包先以 p 从好变坏、以 r 从坏变好，再按当前状态丢包
+    -   corruption: 每个字节出错的概率
+    loss/corruption/buffer 为 None 时用模块里的 LOSS/CORRUPTION/BUFFER
+    """
+
+    def __init__(self, rate=None, delay=None, loss=None, corruption=None, buffer=None, jitter=0.0, reorder=0.0,
+                 reorder_delay=REORDER_DELAY, duplicate=0.0, burst=None, schedule=None, period=None):
+        assert jitter >= 0 and reorder_delay >= 0, 'Delays should be non-negative'
+        assert 0 <= reorder <= 1 and 0 <= duplicate <= 1, 'Probabilities should be in [0, 1]'
+        assert burst is None or len(burst) == 4 and all(0 <= x <= 1 for x in burst), 'Bad Gilbert-Elliott parameters'
+        assert period is None or period > 0, 'Period should be positive'
         self.rate = rate
-        self.buffer = 0
         self.delay = delay
+        self.loss = loss
+        self.corruption = corruption
+        self.capacity = buffer
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.burst = burst
+        self.schedule = sorted(schedule) if schedule else None
+        self.times = [t for t, _ in self.schedule] if schedule else None
+        self.period = period
+        self.backlog = 0  # 瓶颈队列里的字节数，包括正在发的那个
+        self.queue = deque()  # 瓶颈队列里每个包 (发完的时刻, 字节数)
+        self.link_free = 0.0  # 链路空出来的时刻
 
-    def verify_request(self, request, client_address):
+    def rate_at(self, t: float):
+        """
+        启动后 t 秒时的带宽
         """
-        request is a tuple (data, socket)
-        data is the received bytes object
-        socket is new socket created automatically to handle the request
+        if self.schedule is None:
+            return self.rate
+        if self.period is not None:
+            t %= self.period
+        i = bisect_right(self.times, t) - 1
+        return self.schedule[i][1] if i >= 0 else self.rate
+
+
+class Flow:
+    """
+    一个方向的流 (来源, 目的) 自己的随机数和 Gilbert-Elliott 状态，
+    有种子时随机数由种子和流的地址决定，别的流怎么插进来都不影响这个流里每个包的命运
+    """
+    __slots__ = ('random', 'bad')
+
+    def __init__(self, rng: random.Random):
+        self.random = rng
+        self.bad = False
+
+
+class Server:
+    """
+    单线程、按时间调度的模拟器：一个 UDP 套接字，一个按送达时间排序的堆
+
+    每个数据报到达时就定好命运：丢包，或者进瓶颈队列排队发送（按字节算队列长度，满了尾部丢弃），
+    发完再过 delay 秒送达，到时间由同一个线程从堆里取出来转发。不再每个包一个线程、一把全局锁、sleep 着占住锁
+    rate/delay/loss/corruption/capacity 是默认链路 self.default 上的参数，可以在运行中改；其余损伤参数见 Impairment
+    flows={(来源, 目的): Impairment} 给某个方向的流单独配，来源或目的写 None 匹配任意地址，没配的流共用默认链路
+    seed 为 None 时用模块里的 SEED，SEED 也是 None 就不固定种子
+    max_datagram: 每个数据报最多收这么多字节（含 8 字节地址头），多出来的截掉，默认 MAX_DATAGRAM
+    """
+
+    def __init__(self, addr, rate=None, delay=None, loss=None, corruption=None, buffer=None, seed=None,
+                 flows=None, max_datagram=MAX_DATAGRAM, **impairment):
+        self.server_address = addr
+        self.socket = socket(AF_INET, SOCK_DGRAM)
+        self.socket.setsockopt(SOL_SOCKET, SO_RCVBUF, SOCKET_BUFFER)
+        self.socket.setsockopt(SOL_SOCKET, SO_SNDBUF, SOCKET_BUFFER)
+        self.socket.bind(addr)
+        self.socket.setblocking(False)
+        self.default = Impairment(rate, delay, loss, corruption, buffer, **impairment)
+        self.max_datagram = max_datagram
+        self.flows = dict(flows or {})
+        self.seed = SEED if seed is None else seed
+        self.flow_state = {}  # (来源, 目的) -> Flow
+        self.start = time.monotonic()  # 带宽表的时间从这里算
+        self.pending = []  # 堆: (送达时刻, 序号, 目的, 数据报)
+        self.seq = 0
+        self.addresses = {}  # 地址头 <-> 地址，两个方向都缓存
+        self.__shutdown_request = False
+        self.__is_shut_down = threading.Event()
+
+    rate = property(lambda self: self.default.rate, lambda self, v: setattr(self.default, 'rate', v))
+    delay = property(lambda self: self.default.delay, lambda self, v: setattr(self.default, 'delay', v))
+    loss = property(lambda self: self.default.loss, lambda self, v: setattr(self.default, 'loss', v))
+    corruption = property(lambda self: self.default.corruption,
+                          lambda self, v: setattr(self.default, 'corruption', v))
+    capacity = property(lambda self: self.default.capacity, lambda self, v: setattr(self.default, 'capacity', v))
 
-        if this function returns False， the request will not be processed, i.e. is discarded.
-        details: https://docs.python.org/3/library/socketserver.html
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def configure(self, src, dst, impairment: Impairment = None, **kwargs) -> Impairment:
         """
-        # return True
-        if self.buffer < BUFFER:  # some finite buffer size (in bytes) #change1
-            self.buffer += len(request[0])
-            return True
-        else:
-            print('爆炸了')
-            return False
+        给 src -> dst 方向的流单独配一条链路，src/dst 为 None 匹配任意地址；impairment 为 None 时用 kwargs 新建
+        """
+        self.flows[src, dst] = impairment or Impairment(**kwargs)
+        return self.flows[src, dst]
 
-    def finish_request(self, request, client_address):
-        data, socket = request
+    def reseed(self, seed=None):
+        """
+        换种子，所有流的随机数和 Gilbert-Elliott 状态从头来，带宽表也从现在重新计时；seed 为 None 时和构造时一样用 SEED
+        """
+        self.seed = SEED if seed is None else seed
+        self.flow_state.clear()
+        self.start = time.monotonic()
 
-        with lock:
-            if random.random() < LOSS:  # change1
-                self.buffer -= len(data)
-                return
-            if self.rate:
-                time.sleep(len(data) / self.rate)
-            self.buffer -= len(data)
-            """
-            blockingly process each request
-            you can add random loss/corrupt here
-
-            for example:
-            if random.random() < loss_rate:
-                return 
-            for i in range(len(data)-1):
-                if random.random() < corrupt_rate:
-                    data[i] = data[:i] + (data[i]+1).to_bytes(1,'big) + data[i+1:]
-            """
+    def serve_forever(self, poll_interval=0.5):
+        """
+        收包、到点转发，直到 shutdown；没事干的时候睡到下一个包该送达，最多 poll_interval 秒
+        """
+        self.__is_shut_down.clear()
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.socket, selectors.EVENT_READ)
+                while not self.__shutdown_request:
+                    timeout = poll_interval
+                    if self.pending:
+                        timeout = min(poll_interval, max(0.0, self.pending[0][0] - time.monotonic()))
+                    if selector.select(timeout):
+                        self.receive()
+                    self.deliver()
+        finally:
+            self.__shutdown_request = False
+            self.__is_shut_down.set()
+
+    def shutdown(self):
+        self.__shutdown_request = True
+        self.__is_shut_down.wait()
+
+    def server_close(self):
+        self.socket.close()
 
+    def receive(self):
         """
-        this part is not blocking and is executed by multiple threads in parallel
-        you can add random delay here, this would change the order of arrival at the receiver side.
-        
-        for example:
-        time.sleep(random.random())
+        把内核里攒着的数据报收上来，最多 BATCH 个
         """
+        recvfrom = self.socket.recvfrom
+        size = self.max_datagram
+        for _ in range(BATCH):
+            try:
+                data, client_address = recvfrom(size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:  # 目的端口没人时 ICMP 报错会冒到这里，忽略
+                continue
+            self.arrive(data, client_address, time.monotonic())
+
+    def impairment_of(self, src, dst) -> Impairment:
+        flows = self.flows
+        if not flows:
+            return self.default
+        return flows.get((src, dst)) or flows.get((src, None)) or flows.get((None, dst)) or self.default
 
-        to = bytes_to_addr(data[:8])
-        dara = bytearray(data)
+    def flow_of(self, src, dst) -> Flow:
+        flow = self.flow_state.get((src, dst))
+        if flow is None:
+            rng = random.Random() if self.seed is None else random.Random('%s %s:%d %s:%d' % (self.seed, *src, *dst))
+            flow = self.flow_state[src, dst] = Flow(rng)
+        return flow
+
+    def arrive(self, data: bytes, client_address, now: float):
+        """
+        一个数据报到达瓶颈：尾部丢弃、随机丢包、排队发送，再交给 schedule 加时延、抖动、乱序、复制
+        """
+        to = self.addresses.get(data[:8])
+        if to is None:
+            to = self.addresses[data[:8]] = bytes_to_addr(data[:8])
+        link = self.impairment_of(client_address, to)
+        flow = self.flow_of(client_address, to)
+        rng = flow.random
+        queue = link.queue
+        while queue and queue[0][0] <= now:  # 已经发完的出队
+            link.backlog -= queue.popleft()[1]
+        if link.backlog >= (BUFFER if link.capacity is None else link.capacity):  # some finite buffer size (in bytes)
+            print('爆炸了')
+            return
+        if link.burst is not None:
+            p, r, good_loss, bad_loss = link.burst
+            flow.bad = rng.random() >= r if flow.bad else rng.random() < p
+            loss = bad_loss if flow.bad else good_loss
+        else:
+            loss = LOSS if link.loss is None else link.loss
+        if rng.random() < loss:
+            return
         print(client_address, to)  # observe tht traffic
-        for i in range(len(data[8:])):
-            if random.random() < CORRUPTION:
-                dara[i + 8] = data[i + 8] ^ 0x7F
+        begin = max(now, link.link_free)  # 排在前面的发完才轮到它，带宽按开始发的时刻算
+        rate = link.rate_at(begin - self.start)
+        if rate:
+            link.link_free = begin + len(data) / rate
+            queue.append((link.link_free, len(data)))
+            link.backlog += len(data)
+            at = link.link_free
+        else:
+            at = now
+        head = self.addresses.get(client_address)
+        if head is None:
+            head = self.addresses[client_address] = addr_to_bytes(client_address)
+        self.schedule(at, data, head, to, link, rng, now)
+        if link.duplicate and rng.random() < link.duplicate:
+            self.schedule(at, data, head, to, link, rng, now)
+
+    def schedule(self, at: float, data: bytes, head: bytes, to, link: Impairment, rng: random.Random, now: float):
+        """
+        发完的时刻 at 再加上传播时延送达；目的地址头换成来源地址，出错的字节就地改
+        """
+        if link.delay:
+            at += link.delay
+        if link.jitter:
+            at = max(at - (link.delay or 0), at + rng.uniform(-link.jitter, link.jitter))
+        if link.reorder and rng.random() < link.reorder:
+            at += link.reorder_delay
+        corruption = CORRUPTION if link.corruption is None else link.corruption
+        positions = corrupt_positions(len(data) - 8, corruption, rng) if corruption > 0 else None
+        if positions:
+            out = bytearray(data)
+            out[:8] = head
+            for i in positions:
+                out[i + 8] ^= 0x7F
                 print('corruption')
-        socket.sendto(addr_to_bytes(client_address) + dara[8:], to)
+        else:
+            out = head + data[8:]
+        if at <= now:
+            self.forward(out, to)
+        else:
+            heapq.heappush(self.pending, (at, self.seq, to, out))
+            self.seq += 1
+
+    def deliver(self):
+        pending = self.pending
+        now = time.monotonic()
+        while pending and pending[0][0] <= now:
+            _, _, to, out = heapq.heappop(pending)
+            self.forward(out, to)
+
+    def forward(self, out: bytes, to):
+        try:
+            self.socket.sendto(out, to)
+        except OSError:
+            pass  # 发不出去就当丢了
+
+
+def corrupt_positions(n: int, p: float, rng: random.Random = random) -> list:
+    """
+    n 个字节各自以概率 p 出错时出错的位置：按几何分布抽相邻两个出错字节的间隔，
+    和逐字节掷骰子同分布，但只要出错字节数次随机数
+    """
+    if p >= 1:
+        return list(range(n))
+    log_q = math.log(1 - p)
+    positions = []
+    i = -1
+    while True:
+        i += 1 + int(math.log(1 - rng.random()) / log_q)
+        if i >= n:
+            return positions
+        positions.append(i)
 
 
 server_address = ('127.0.0.1', 12345)
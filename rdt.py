@@ -1,23 +1,68 @@
+import bisect
+import hashlib
+import heapq
+import hmac
+import os
 import random
 import struct
+import sys
+import zlib
+from array import array
 from enum import Enum
+from socket import timeout as socket_timeout, SHUT_RDWR
 
-from USocket import UnreliableSocket
+from USocket import UnreliableSocket, sockets
+from congestion import make_controller
 import time
 import threading
 from queue import SimpleQueue, Empty
-from math import log
+from collections import deque, OrderedDict
+from itertools import count
 import json
 
-SEND_WAIT = 0.005  # ACK等数据的时间
+try:
+    import numpy
+except ImportError:  # numpy 是可选依赖，没有就用标准库的引擎
+    numpy = None
+
+SEND_WAIT = 0.005  # ACK等数据的时间，即延迟ACK的最长延迟
+ACK_EVERY = 2  # 攒够这么多个满包就立即ACK
+DUP_ACK_INTERVAL = 0.02  # 回复重复包的ACK的最小间隔
 SEND_FIN_WAIT = 0.5  # 下次尝试发FIN的时间
-RTT_ = 0.95  # RTT对于上次的保留系数，越小变化越剧烈
-INCREASE_ = 0  # 升窗界线
-DECREASE_ = 3  # 降窗界线
-EXTRA_ACK_WAIT = 0.75  # 额外的等待ACK的时间
+EXTRA_ACK_WAIT = 0.75  # 挥手阶段额外等待对方重发FIN的时间
+INIT_RTO = 1.0  # 还没有RTT样本时的重传超时
+MIN_RTO = 0.05  # 重传超时的下限
+MAX_RTO = 10.0  # 重传超时的上限，退避也不超过它
+RTO_ALPHA = 1 / 8  # SRTT 的平滑系数
+RTO_BETA = 1 / 4  # RTTVAR 的平滑系数
 SYN_ACK_WAIT = 5  # 等待回复SYN_ACK的时间
-MAX_PKT_LEN = 1024  # 最大包长度
-BOMB_RATE = 0.15  # 超时包长度占窗口的比例，强制降窗
+FAST_OPEN_WAIT = 0.005  # 快速打开时 connect 之后等第一次 send 的时间，到点没数据就发不带数据的 SYN
+FAST_OPEN_REPLAY_WAIT = 60  # 收过数据的快速打开 SYN 记这么久，远长于 SYN 重传和网络里迟到的副本能活的时间
+MAX_PKT_LEN = 1024  # 默认的最大包长度（MSS），对方握手时没带 OPT_MSS 也按它
+MAX_MSS = 65000  # MSS 的上限，LEN 字段两字节，UDP 数据报也不能超过 64K，给包头留点余量
+MSS_PROBE_STEP = 64  # MSS 探测的上下界差到这么多就停
+MSS_PROBE_TRIES = 3  # 同一个大小连着这么多次没回应才认为过不去，免得把丢包当成包太大
+SAK_WAIT = 0.005  # 收到乱序包后攒多久再发SAK
+MAX_SACK_BLOCKS = 16  # 一个SAK包最多带的区间数
+PACING_BURST = 4  # 发送令牌桶最多攒几个满包
+DUP_THRESH = 3  # 重复ACK数或者后面被SAK的包数到了这么多，就认为第一个未确认的包丢了
+RCVBUF = 1 << 20  # 默认的接收缓冲区上限，收好没读走的数据加上乱序缓存不超过它
+
+CHECKSUM_ALGORITHMS = ('sum', 'adler32', 'crc32')  # 可协商的校验和算法，下标即握手时的编号，越往后越强
+OPT_END = 0  # 握手选项结束
+OPT_CHECKSUM = 1  # 握手选项：校验和算法
+OPT_WINDOW = 2  # 握手选项：接收缓冲区大小，双方都带了才通告接收窗口
+OPT_MSS = 3  # 握手选项：愿意收的最大包长度，连接用双方的较小值
+OPT_COOKIE = 4  # 握手选项：快速打开的 cookie，SYN 里为空表示向服务端要一个
+FLAG_WND = 0b100  # 占位位里的最高位，置位时包尾多4字节接收窗口，不算在LEN里
+FLAG_PROBE = 0b010  # 占位位里的中间位，MSS 探测包和它的回复，不占序号
+
+HEADER = struct.Struct('!B2I2H')  # 包头：标志位、SEQ、SEQ_ACK、LEN、CHECKSUM
+HEADER_LEN = HEADER.size
+CHECKSUM_AT = HEADER_LEN - 2  # CHECKSUM 在包头里的偏移
+CHECKSUM_FIELD = struct.Struct('!H')
+WORD = struct.Struct('!I')  # 包尾的 WND
+PADDING = bytes(3)
 
 
 class RDTEventType(Enum):
@@ -30,6 +75,7 @@ class RDTEventType(Enum):
     SAK = 6
     CORRUPTION = 7
     SEND_ACK = 8  # 需要 send ACK
+    SEND_SAK = 9  # 需要 send SAK
     SEND_FIN = 10  # 需要 send FIN
     UNKNOWN_ERROR = 11  # 在 send loop 或 recv loop 捕获的异常，未知类型
     ACK_TIMEOUT = 12  # 等待ACK超时
@@ -40,6 +86,9 @@ class RDTEventType(Enum):
     DESTROY_SIMPLE = 17  # 销毁单个连接
     DESTROY_ALL = 18  # 尝试结束所有循环线程，探测到可以结束时会引发VANISH事件
     VANISH = 19  # 真正结束所有线程，这个事件会break掉事件循环
+    WINDOW_UPDATE = 20  # 上层读走数据，接收窗口变大了，需要通告
+    MSS_PROBE = 21  # 对方的 MSS 探测包或者探测的回复
+    MSS_PROBE_TIMEOUT = 22  # MSS 探测没有回应
 
 
 class RDTConnectionStatus(Enum):
@@ -55,6 +104,7 @@ class RDTEvent:
     """
     事件的实体类，body有多种类型
     """
+    __slots__ = ('type', 'body')
 
     def __init__(self, e_type: RDTEventType, body: any):
         self.type = e_type
@@ -65,20 +115,117 @@ class RDTTimer:
     """
     计时器实体类
     """
+    __slots__ = ('start_time', 'event', 'target_time', 'active', 'sacked', 'resent', 'backoff', 'entry')
 
     def __init__(self, timeout: float, e: RDTEvent):
         self.start_time = time.time()
         self.event = e
         self.target_time = self.start_time + timeout
         self.active = True
+        self.sacked = False  # 对方已经SAK过这个包，等累计ACK把它弹出
+        self.resent = False  # 重发过，按 Karn 算法它的ACK不能用来测RTT
+        self.backoff = 0  # 启动时连接的退避次数，同一轮超时的包只退避一次
+        self.entry = None  # 在事件循环定时器堆里的条目，不在堆里时为 None
+
+
+def _word_sum_python(bs) -> int:
+    """
+    逐个4字节大端字求和，最初的纯Python实现，留作对照
+    """
+    checksum = 0
+    for i in range(0, len(bs), 4):
+        checksum += (bs[i] << 24) + (bs[i + 1] << 16) + (bs[i + 2] << 8) + bs[i + 3]
+    return checksum
+
+
+_WORD_STRUCTS = {}  # 按字数缓存编译好的 struct
+
+
+def _word_sum_struct(bs) -> int:
+    n = len(bs) >> 2
+    words = _WORD_STRUCTS.get(n)
+    if words is None:
+        words = _WORD_STRUCTS[n] = struct.Struct('!%dI' % n)
+    return sum(words.unpack_from(bs))
+
+
+def _word_sum_array(bs) -> int:
+    words = array('I')
+    words.frombytes(bs)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return sum(words)
+
+
+def _word_sum_numpy(bs) -> int:
+    return int(numpy.frombuffer(bs, dtype='>u4').sum(dtype=numpy.uint64))
+
+
+CHECKSUM_ENGINES = {'python': _word_sum_python, 'struct': _word_sum_struct}  # 求和引擎，结果完全一致
+if array('I').itemsize == 4:
+    CHECKSUM_ENGINES['array'] = _word_sum_array
+if numpy is not None:
+    CHECKSUM_ENGINES['numpy'] = _word_sum_numpy
+_word_sum = CHECKSUM_ENGINES.get('numpy') or CHECKSUM_ENGINES.get('array') or _word_sum_struct
+
+
+def set_checksum_engine(name: str):
+    """
+    切换 'sum' 校验和使用的求和引擎，只影响速度，不影响结果
+    :param name: CHECKSUM_ENGINES 中的名字
+    """
+    global _word_sum
+    assert name in CHECKSUM_ENGINES, 'No such checksum engine: %s' % name
+    _word_sum = CHECKSUM_ENGINES[name]
+
+
+def _fold_32(checksum: int) -> int:
+    return (checksum >> 16) ^ (checksum & 0xFFFF)
+
+
+fast_open_cookies = {}  # 服务端地址 -> 它发的快速打开 cookie，进程里所有客户端共用
+
+
+def pack_options(options: dict) -> bytes:
+    """
+    握手选项编码: kind(1B) len(1B) value，以 OPT_END 结束，后面可以跟快速打开的数据
+    """
+    bs = bytearray()
+    for kind, value in options.items():
+        bs += bytes((kind, len(value))) + value
+    bs.append(OPT_END)
+    return bytes(bs)
+
+
+def datagram_size(payload_len: int) -> int:
+    """
+    装得下 payload_len 字节数据的最大数据报：地址8 + 包头13 + 补齐到4字节的数据 + 窗口4
+    """
+    return 8 + HEADER_LEN + -(-payload_len // 4) * 4 + 4
+
+
+def parse_options(payload) -> (dict, int):
+    """
+    :return: 选项, OPT_END 之后第一个字节的下标（旧版本补的0或者快速打开的数据从这里开始）
+    """
+    options = {}
+    i = 0
+    while i + 1 < len(payload) and payload[i] != OPT_END:
+        kind, length = payload[i], payload[i + 1]
+        options[kind] = bytes(payload[i + 2:i + 2 + length])
+        i += 2 + length
+    return options, min(i + 1, len(payload))
 
 
 class RDTPacket:
     """
     包的实体类
     """
+    __slots__ = ('SYN', 'ACK', 'FIN', 'RST', 'SAK', '_', 'SEQ', 'SEQ_ACK', 'LEN', 'CHECKSUM', 'PAYLOAD', 'remote',
+                 'algo', 'WND', 'raw')
 
-    def __init__(self, remote, SEQ, SEQ_ACK, SYN=0, ACK=0, FIN=0, RST=0, SAK=0, _=0, PAYLOAD=bytes()):
+    def __init__(self, remote, SEQ, SEQ_ACK, SYN=0, ACK=0, FIN=0, RST=0, SAK=0, _=0, PAYLOAD=bytes(), algo=0,
+                 WND=None):
         self.SYN = SYN
         self.ACK = ACK
         self.FIN = FIN
@@ -90,55 +237,149 @@ class RDTPacket:
         self.LEN = len(PAYLOAD)
         self.CHECKSUM = 0
         self.PAYLOAD: bytes = PAYLOAD
-        self.PAYLOAD_REAL: bytes = self.PAYLOAD
         self.remote = remote
-        self.__packet: bytearray = bytearray()
+        self.algo = algo  # 校验和算法在 CHECKSUM_ALGORITHMS 中的下标，带SYN的包总是用 'sum'
+        self.WND = WND  # 通告的接收窗口，None 表示不带
+        self.raw = None  # 收到的整个包，check 之前才有，校验完就放掉
 
-    def make_packet(self):
-        self.__packet = bytearray()
-        self.__packet += ((self.SYN << 7) + (self.ACK << 6) + (self.FIN << 5) + (self.RST << 4) +
-                          (self.SAK << 3) + self._).to_bytes(1, 'big')
-        self.__packet += struct.pack('!2I2H', self.SEQ, self.SEQ_ACK, self.LEN, 0)  # CHECKSUM
-        extra = (4 - self.LEN % 4) % 4
-        self.PAYLOAD_REAL = self.PAYLOAD + b'\x00' * extra
-        self.CHECKSUM = self._checksum()
+    @property
+    def bits(self) -> int:
+        return (self.SYN << 7) + (self.ACK << 6) + (self.FIN << 5) + (self.RST << 4) + (self.SAK << 3) + self._
 
-        self.__packet[-2:] = struct.pack('!H', self.CHECKSUM)
-        self.__packet += self.PAYLOAD_REAL
-        return self.__packet
+    @property
+    def size(self) -> int:
+        """
+        编码后的长度：包头 + 补齐到4字节的负载 + WND
+        """
+        return HEADER_LEN + -(-self.LEN // 4) * 4 + (4 if self.WND is not None else 0)
+
+    def pack_into(self, buffer: memoryview, offset: int = 0) -> int:
+        """
+        把整个包写进 buffer 的 offset 处，buffer 可以反复用，返回写了多少字节
+        """
+        wnd = self.WND
+        self._ = (self._ & ~FLAG_WND) | (FLAG_WND if wnd is not None else 0)
+        HEADER.pack_into(buffer, offset, self.bits, self.SEQ, self.SEQ_ACK, self.LEN, 0)  # CHECKSUM 最后填
+        start = offset + HEADER_LEN
+        end = start + self.LEN
+        buffer[start:end] = self.PAYLOAD
+        pad = -self.LEN % 4
+        if pad:
+            buffer[end:end + pad] = PADDING[:pad]  # 复用的 buffer 里可能有上个包的残留
+            end += pad
+        if wnd is not None:
+            WORD.pack_into(buffer, end, wnd)
+            end += 4
+        self.CHECKSUM = self._checksum(buffer[start:end], buffer[offset:start])
+        CHECKSUM_FIELD.pack_into(buffer, offset + CHECKSUM_AT, self.CHECKSUM)
+        return end - offset
+
+    def make_packet(self) -> bytearray:
+        packet = bytearray(self.size)
+        self.pack_into(memoryview(packet))
+        return packet
 
     @staticmethod
-    def resolve(bs: bytearray, addr: (str, int)) -> 'RDTPacket':
-        r: RDTPacket = RDTPacket(remote=addr, SEQ=0, SEQ_ACK=0)
-        bits, r.SEQ, r.SEQ_ACK, r.LEN, r.CHECKSUM = struct.unpack('!B2I2H', bs[:13])
+    def resolve(bs: bytes, addr: (str, int)) -> 'RDTPacket':
+        r: RDTPacket = RDTPacket.__new__(RDTPacket)  # 字段都从包里来，不走 __init__ 的默认值
+        bits, r.SEQ, r.SEQ_ACK, r.LEN, r.CHECKSUM = HEADER.unpack_from(bs)
         r.SYN, r.ACK, r.FIN, = (bits >> 7) & 1, (bits >> 6) & 1, (bits >> 5) & 1
         r.RST, r.SAK, r._ = (bits >> 4) & 1, (bits >> 3) & 1, bits & 0x7
+        r.PAYLOAD, r.remote, r.algo, r.WND = b'', addr, 0, None
 
-        r.PAYLOAD_REAL = bs[13:]
+        r.raw = bs
         return r
 
-    def _checksum(self) -> int:
-        bs = self.PAYLOAD_REAL
+    def _checksum(self, bs, head=None) -> int:
+        """
+        bs 是包头之后的部分：负载、补齐和 WND；head 是 CHECKSUM 为0的包头，编码时已经写好了就不用再打包一次
+        """
+        if self.algo and not self.SYN:
+            if head is None:
+                head = HEADER.pack(self.bits, self.SEQ, self.SEQ_ACK, self.LEN, 0)
+            if CHECKSUM_ALGORITHMS[self.algo] == 'crc32':
+                return _fold_32(zlib.crc32(bs, zlib.crc32(head)))
+            return _fold_32(zlib.adler32(bs, zlib.adler32(head)))
         checksum = (self.SYN << 7 + self.ACK << 6 + self.FIN << 5 + self.RST << 4 + self.SAK << 3 + self._) << 24
         checksum += self.SEQ + self.SEQ_ACK + (self.LEN << 16)
         if len(bs) > 0:
-            for i in range(0, len(bs), 4):
-                checksum += (bs[i] << 24) + (bs[i + 1] << 16) + (bs[i + 2] << 8) + bs[i + 3]
+            checksum += _word_sum(bs)
         while checksum > 0xFFFF:
             checksum = (checksum % 0xFFFF) + (checksum // 0xFFFF)
         return checksum
 
     def check(self) -> bool:
-        if len(self.PAYLOAD_REAL) % 4 != 0:
+        raw, self.raw = self.raw, None
+        if (len(raw) - HEADER_LEN) % 4 != 0:
             return False
-        check = self._checksum()
-        self.PAYLOAD = self.PAYLOAD_REAL[:self.LEN]
-        if check != self.CHECKSUM or self._ != 0:
+        check = self._checksum(memoryview(raw)[HEADER_LEN:])
+        self.PAYLOAD = raw[HEADER_LEN:HEADER_LEN + self.LEN]  # 唯一的一次复制
+        if check != self.CHECKSUM or self._ & ~(FLAG_WND | FLAG_PROBE):
             return False
+        if self._ & FLAG_WND:
+            if len(raw) < HEADER_LEN + self.LEN + 4:
+                return False
+            self.WND = WORD.unpack_from(raw, len(raw) - 4)[0]
 
         return True
 
 
+class RDTRecvBuffer:
+    """
+    收好的正序数据，按包存成块的队列，读的时候只复制被读走的部分
+    """
+
+    def __init__(self):
+        self.chunks = deque()
+        self.offset = 0  # 队头的块已经被读走的字节数
+        self.size = 0  # 还没读的总字节数
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, bs: bytes):
+        if len(bs) > 0:
+            self.chunks.append(bs)
+            self.size += len(bs)
+
+    def read(self, n: int) -> bytes:
+        n = min(n, self.size)
+        if n == 0:
+            return b''
+        head = self.chunks[0]
+        if self.offset == 0 and len(head) == n:  # 正好一整块，不用复制
+            self.chunks.popleft()
+            self.size -= n
+            return head
+        parts = []
+        while n > 0:
+            head = self.chunks[0]
+            take = min(n, len(head) - self.offset)
+            parts.append(memoryview(head)[self.offset:self.offset + take])
+            self.consume(take)
+            n -= take
+        return b''.join(parts)
+
+    def read_into(self, buffer, n: int) -> int:
+        view = memoryview(buffer).cast('B')
+        n = min(n, self.size, len(view))
+        done = 0
+        while done < n:
+            head = self.chunks[0]
+            take = min(n - done, len(head) - self.offset)
+            view[done:done + take] = memoryview(head)[self.offset:self.offset + take]
+            self.consume(take)
+            done += take
+        return done
+
+    def consume(self, n: int):
+        self.offset += n
+        self.size -= n
+        if self.offset == len(self.chunks[0]):
+            self.chunks.popleft()
+            self.offset = 0
+
+
 class RDTSocket(UnreliableSocket):
     """
     The functions with which you are to build your RDT.
@@ -153,15 +394,66 @@ class RDTSocket(UnreliableSocket):
     https://docs.python.org/3/library/socket.html#socket-timeouts
 
     """
-
-    def __init__(self, rate=None, debug=True):
-        super().__init__(rate=rate)
-        self._rate = rate
+    own_socket = True  # 是否打开自己的 UDP socket
+
+    def __init__(self, rate=None, debug=True, checksum='sum', ack_every=ACK_EVERY, ack_delay=SEND_WAIT,
+                 dup_ack_interval=DUP_ACK_INTERVAL, congestion='vegas', pacing=True, min_rto=MIN_RTO,
+                 max_rto=MAX_RTO, rcvbuf=RCVBUF, mss=MAX_PKT_LEN, mss_probe=False, fast_open=False, tracer=None):
+        assert rate is None or rate > 0, 'Rate should be positive or None.'
+        if self.own_socket:
+            super().__init__()  # rate 不在 sendto 里 sleep，交给事件循环的令牌桶，见 EventLoop.pace
+        assert checksum in CHECKSUM_ALGORITHMS, 'Unknown checksum algorithm: %s' % checksum
+        assert ack_every >= 1 and ack_delay >= 0 and dup_ack_interval >= 0, 'Bad ACK policy'
+        assert isinstance(pacing, bool) or pacing > 0, 'Pacing rate should be positive'
+        assert 0 < min_rto <= max_rto, 'Bad RTO range'
+        assert 0 < mss <= MAX_MSS, 'MSS out of range'
+        assert mss <= rcvbuf < 1 << 32, 'Receive buffer out of range'
+        self._rate = rate  # 整个 socket 发数据的限速，字节/秒，None 不限
         self.addr = None
         self.debug = debug
+        self.checksum = CHECKSUM_ALGORITHMS.index(checksum)  # 握手时提议的校验和算法，SimpleRDT 上是协商结果
         self.simple_sct = None
         self._event_loop = None
         self.is_close = False
+        self._timeout = None  # None 阻塞，0.0 非阻塞，正数为超时秒数，只作用于上层调用，不动底层UDP
+        self.ack_every = ack_every  # 延迟ACK策略，连接建立时复制给 SimpleRDT
+        self.ack_delay = ack_delay
+        self.dup_ack_interval = dup_ack_interval
+        self.congestion = congestion  # 拥塞控制算法名，见 congestion.CONTROLLERS
+        self.pacing = pacing  # True 按拥塞控制器给的速率发包，False 不限，数字为固定的 字节/秒
+        self.min_rto = min_rto  # 重传超时的范围
+        self.max_rto = max_rto
+        self.rcvbuf = rcvbuf  # 每个连接的接收缓冲区上限
+        self.mss = mss  # 握手时通告的最大包长度，SimpleRDT 上是当前发包用的包长
+        self.mss_probe = mss_probe  # 从 MAX_PKT_LEN 开始往协商出的 MSS 探测，找路径上过得去的最大包
+        self.fast_open = fast_open  # 客户端：第一次 send 的数据跟着 SYN 走；服务端：验过 cookie 就收 SYN 里的数据
+        self.tracer = tracer  # tracer.PacketTracer，记下收发的每个包头，None 不记
+
+    def settimeout(self, value):
+        assert value is None or value >= 0, 'Timeout value out of range'
+        self._timeout = value
+        if self.simple_sct is not None:
+            self.simple_sct.settimeout(value)
+
+    def gettimeout(self):
+        return self._timeout
+
+    def setblocking(self, flag):
+        self.settimeout(None if flag else 0.0)
+
+    def getblocking(self):
+        return self._timeout != 0.0
+
+    def wait_for(self, cond: threading.Condition, predicate):
+        """
+        按 timeout 设置在条件变量上等待 predicate 成立，调用方需持有 cond 的锁
+        """
+        if predicate():
+            return
+        if self._timeout == 0.0:
+            raise BlockingIOError('Resource temporarily unavailable')
+        if not cond.wait_for(predicate, self._timeout):
+            raise socket_timeout('timed out')
 
     def accept(self) -> ('RDTSocket', (str, int)):
         """
@@ -178,27 +470,39 @@ class RDTSocket(UnreliableSocket):
             self._event_loop.start()
             self.bind_(self.addr)
         assert isinstance(self._event_loop, ServerEventLoop), 'This socket is not a listener, please bind'
-        while True:
-            s: SimpleRDT = self._event_loop.accept()
-            if s is not None:
-                return s, s.remote
-            time.sleep(0.001)
+        try:
+            s: SimpleRDT = self._event_loop.accept(self._timeout)
+        except Empty:
+            if self._timeout == 0.0:
+                raise BlockingIOError('Resource temporarily unavailable')
+            raise socket_timeout('timed out')
+        return s, s.remote
 
     def connect(self, address: (str, int)):
         """
         Connect to a remote socket at address.
         Corresponds to the process of establishing a connection on the client side.
+        非阻塞或超时后可以用同一地址再次调用 connect 继续等待握手
         """
-        assert not self._event_loop, 'Duplicated connecting or it is listening'
-        self._event_loop = ClientEventLoop(self, address)
-        self._event_loop.start()
-        self._event_loop.put(RDTEventType.CONNECT, address)
-        while True:
-            s: SimpleRDT = self._event_loop.connect_()
-            if s is not None:
-                self.simple_sct = s
-                return
-            time.sleep(0.001)
+        if self._event_loop is None:
+            self._event_loop = ClientEventLoop(self, address)
+            self._event_loop.start()
+            self._event_loop.put(RDTEventType.CONNECT, address)
+        assert isinstance(self._event_loop, ClientEventLoop), 'It is listening'
+        assert self._event_loop.simple_sct.remote == address, 'Duplicated connecting'
+        if self._event_loop.fast_open_ready(address):  # 不等握手，SYN 等第一次 send 一起发
+            self.simple_sct = self._event_loop.simple_sct
+            self.simple_sct.settimeout(self._timeout)
+            return
+        if not self._event_loop.connected.wait(self._timeout):
+            if self._timeout == 0.0:
+                raise BlockingIOError('Operation now in progress')
+            raise socket_timeout('timed out')
+        s: SimpleRDT = self._event_loop.connect_()
+        if s is None:
+            raise ConnectionRefusedError('Connection refused')
+        s.settimeout(self._timeout)
+        self.simple_sct = s
 
     def recv(self, bufsize: int) -> bytes:
         """
@@ -214,6 +518,22 @@ class RDTSocket(UnreliableSocket):
             "Connection not established or it is the listener"
         return self.simple_sct.recv(bufsize=bufsize)
 
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        """
+        像 socket.recv_into 一样把数据直接写进 buffer，返回写入的字节数
+        """
+        assert self._event_loop and isinstance(self._event_loop, ClientEventLoop) and self.simple_sct, \
+            "Connection not established or it is the listener"
+        return self.simple_sct.recv_into(buffer, nbytes)
+
+    def recv_exactly(self, n: int) -> bytes:
+        """
+        收满 n 字节再返回，对方先关闭时返回剩下的全部数据
+        """
+        assert self._event_loop and isinstance(self._event_loop, ClientEventLoop) and self.simple_sct, \
+            "Connection not established or it is the listener"
+        return self.simple_sct.recv_exactly(n)
+
     def send(self, _bytes: bytes):
         """
         Send data to the socket. 
@@ -233,6 +553,10 @@ class RDTSocket(UnreliableSocket):
         self._event_loop.put(RDTEventType.LISTEN_CLOSE, None)
 
     def force_close(self):
+        try:
+            sockets[id(self)].shutdown(SHUT_RDWR)  # 唤醒阻塞在 recvfrom 的接收循环，否则要等到下一个包
+        except OSError:
+            pass  # UDP 没有 connect 会报 ENOTCONN，但阻塞的 recvfrom 照样会返回
         super(RDTSocket, self).close()
 
     def bind(self, address: (str, int)):
@@ -244,16 +568,29 @@ class RDTSocket(UnreliableSocket):
 
     def bind_(self, address: (str, int)):
         super(RDTSocket, self).bind(address)
+        if self.tracer is not None:
+            self.tracer.local = address
 
     def create_simple_socket(self, remote: (str, int), recv_offset: int, send_offset: int,
                              event_queue=None) -> 'SimpleRDT':
-        if event_queue is not None:
-            return SimpleRDT(self._rate, self.debug, recv_offset, send_offset, remote, event_queue)
-        return SimpleRDT(self._rate, self.debug, recv_offset, send_offset, remote, self._event_loop.event_queue)
+        if event_queue is None:
+            event_queue = self._event_loop.event_queue
+        s = SimpleRDT(self._rate, self.debug, recv_offset, send_offset, remote, event_queue)
+        s.inherit(self)
+        return s
 
     def block_until_close(self):
         self._event_loop.join()
 
+    def get_stats(self) -> dict:
+        """
+        连接的计数和当前的窗口、RTT、缓冲区，监听 socket 上是所有连接的汇总；不用开 debug，随时可以调
+        """
+        if self.simple_sct is not None:
+            return self.simple_sct.get_stats()
+        assert isinstance(self._event_loop, ServerEventLoop), 'Not connected or listening'
+        return self._event_loop.get_stats()
+
     def save_perf(self, path: str):
         """
         debug模式下保存RTT和Window变化的一个函数，只有client或者SimpleRDT可以用，server的listen不能用
@@ -264,37 +601,152 @@ class RDTSocket(UnreliableSocket):
 
 
 class SimpleRDT(RDTSocket):
+    own_socket = False  # 连接的收发都走事件循环所在的 socket，每个连接再开一个 UDP socket 只是白占文件描述符
 
     def __init__(self, rate, debug, recv_offset: int, send_offset: int, remote: (str, int), event_queue: SimpleQueue):
         super(SimpleRDT, self).__init__(rate, debug)
         self.remote: (str, int) = None  # 远方地址
-        self.wait_ack = []  # 定时器数组，可能是已经触发的定时器，发出去的包等ack，无数据且不是(SYN, SYN_ACK, FIN)的包不会等待ACK，超时了会重发
-        self.timeout_cnt = 0  # 连续超时计数
+        self.wait_ack = OrderedDict()  # SEQ -> 定时器，按发送顺序（即SEQ递增），可能是已经触发的定时器，发出去的包等ack，无数据且不是(SYN, SYN_ACK, FIN)的包不会等待ACK，超时了会重发
+        self.timeout_cnt = 0  # 连续超时计数，即重传超时的退避次数
         self.wait_send = bytearray()  # 上层来的等待发送的数据
         self.wait_send_offset = 0  # 多次挪动wait_send很耗时，所以只移动指针，wait_send全发送后一次性清空
-        self.wait_resend = []  # 等待窗口空闲进行重发的包
+        self.wait_resend = OrderedDict()  # SEQ -> 定时器，按超时顺序等待窗口空闲进行重发的包
         self.SEQ = send_offset  # 下一个发包的SEQ
         self.ack_timer = RDTTimer(0, RDTEvent(RDTEventType.ACK_TIMEOUT, None))  # ACK等数据的计时器，超时就会发空ACK出去
         self.ack_timer.start_time = self.ack_timer.target_time = 0
         self.event_queue = event_queue  # 调度队列
         self.remote = remote  # 连接的对应的远端地址
         self.last_ACK = 0  # 自己发出去的最后一个ACK
-        self.recv_buffer = []  # 收到的乱序包缓存
+        self.last_dup_ACK = 0  # 上次回复重复包的时间
+        self.recv_buffer = {}  # 收到的乱序包缓存，SEQ -> 包
+        self.sack_ranges = []  # recv_buffer 覆盖的 [start, end) 区间，有序且互不相连
+        self.sak_timer = None  # 攒SAK的计时器
+        self.sacked_cnt = 0  # wait_ack 里已经被SAK的包数
+        self.dup_acks = 0  # 没有推进累计确认的纯ACK和SAK个数
+        self.recover = None  # 快速重传后进入恢复，累计确认越过这个SEQ才算恢复完
+        self.wnd_ok = False  # 握手时双方都带了 OPT_WINDOW，收发都按接收窗口来
+        self.send_edge = 0  # 对方通告的窗口右沿，SEQ 到这里为止的数据可以发
+        self.last_WND = 0  # 自己最后通告的接收窗口
+        self.mss_limit = MAX_PKT_LEN  # 协商出的 MSS，探测的上限
+        self.probe_high = 0  # 探测中：比它大的包过不去
+        self.probe_size = 0  # 正在探测的包长，0 表示没在探测
+        self.probe_tries = 0  # 这个包长已经探测了几次
+        self.probe_timer = None  # 探测包等回复的计时器
+        self.early_accept = False  # 快速打开，收到 SYN 时就放进了 accept 队列
         self.SEQ_ACK = recv_offset  # 收到的最后一个正序SEQ
-        self.data: bytearray = bytearray()  # 收好的正序数据
+        self.data: RDTRecvBuffer = RDTRecvBuffer()  # 收好的正序数据
         self.status = None  # 这个连接当前的状态
         self.is_close = False  # 上层是否close
         self.remote_close = False  # 远方是否挥手完毕
         self.lock: threading.RLock = threading.RLock()  # 锁
-        self.BASE_RTT = 0  # 基准应答延迟
-        self.SEND_WINDOW_SIZE = 3  # 发送窗口大小，限制 wait_ack 的大小
-        self.last_bomb = 0  # 上次强制降窗
+        self.SRTT = 0  # 平滑RTT
+        self.RTTVAR = 0  # RTT的平均偏差
+        self.base_RTO = INIT_RTO  # SRTT + 4 * RTTVAR，未退避
+        self.cc = make_controller(self.congestion, self.mss)  # 拥塞控制器，决定发送窗口
+        self.pace_tokens = PACING_BURST * self.mss  # 令牌桶里的字节数
+        self.pace_at = time.time()  # 上次往令牌桶里加令牌的时间
+        self.pace_timer = None  # 令牌不够时，等令牌的计时器
         self.destroy_timer = None  # 强制销毁定时器
         self.perf = []  # 记录性能的数组，只在debug模式下开启
+        self.sent_pkt_cnt = 0  # 第一次发出的数据包数，下同，get_stats 用
+        self.sent_bytes = 0
+        self.resent_pkt_cnt = 0  # 重发的数据包数，超时重发和快速重传都算
+        self.resent_bytes = 0
+        self.fast_resent_cnt = 0  # 其中快速重传的次数
+        self.recv_pkt_cnt = 0  # 收到的带数据的包数，重复的和乱序的也算
+        self.recv_bytes = 0  # 按序交给上层的字节数
+        self.sak_sent_cnt = 0
+        self.sak_recv_cnt = 0
+        self.corrupt_cnt = 0  # 来自对方、校验没过的包数
+        self.rto_cnt = 0  # 等ACK超时的次数
+        self.readable = threading.Condition(self.lock)  # 有新数据或远方关闭时通知 recv
+        self.waker = None  # 有新数据、远方关闭或收到ACK时额外调用的回调，给 asyncio 前端用
+
+    @property
+    def SEND_WINDOW_SIZE(self) -> float:
+        return self.cc.cwnd  # 发送窗口大小，限制 wait_ack 的大小
+
+    def inherit(self, sct):
+        """
+        从监听或者发起连接的 socket 复制每个连接的策略
+        """
+        self.ack_every, self.ack_delay, self.dup_ack_interval = sct.ack_every, sct.ack_delay, sct.dup_ack_interval
+        self.congestion = sct.congestion
+        self.pacing = sct.pacing
+        self.min_rto, self.max_rto = sct.min_rto, sct.max_rto
+        self.rcvbuf = sct.rcvbuf
+        self.mss, self.mss_probe = sct.mss, sct.mss_probe
+        self.checksum = sct.checksum  # 先是自己的提议，握手时换成协商结果
+        self.cc = make_controller(sct.congestion, sct.mss)
+
+    def negotiate_checksum(self, options: dict):
+        """
+        服务端：双方提议的校验和算法取强的一个；对方不认识的算法它也不会提议，对方提议的我们不认识就用我们最强的
+        旧版本的 SYN 没有这个选项，只会 'sum'
+        """
+        if OPT_CHECKSUM not in options:
+            self.checksum = 0
+            return
+        self.checksum = max(self.checksum, min(options[OPT_CHECKSUM][0], len(CHECKSUM_ALGORITHMS) - 1))
+
+    def negotiate_mss(self, options: dict):
+        """
+        按对方握手时通告的 MSS 定这个连接的包长，要探测的话先从 MAX_PKT_LEN 用起
+        """
+        peer = struct.unpack('!H', options[OPT_MSS])[0] if OPT_MSS in options else MAX_PKT_LEN
+        self.mss_limit = min(self.mss, peer)
+        self.set_mss(min(self.mss_limit, MAX_PKT_LEN) if self.mss_probe else self.mss_limit)
+        self.probe_high = self.mss_limit
+
+    def set_mss(self, mss: int):
+        self.mss = mss
+        self.cc.mss = mss
+
+    @property
+    def recv_window(self) -> int:
+        return max(0, self.rcvbuf - len(self.data))
+
+    def advertise(self, pkt: RDTPacket):
+        """
+        把当前的累计确认和接收窗口写进要发出去的包
+        """
+        pkt.SEQ_ACK = self.SEQ_ACK
+        self.last_ACK = self.SEQ_ACK
+        if self.wnd_ok:
+            pkt.WND = self.last_WND = self.recv_window
+
+    def update_send_edge(self, pkt: RDTPacket):
+        if pkt.WND is not None:
+            self.send_edge = max(self.send_edge, pkt.SEQ_ACK + pkt.WND)
+
+    def check_window_update(self):
+        """
+        上层读走数据后，窗口比上次通告的大了一倍以上，让事件循环马上通告，免得对方一直停在零窗口上
+        """
+        window = self.recv_window
+        if self.wnd_ok and window - self.last_WND >= self.mss and window >= 2 * self.last_WND:
+            self.last_WND = window
+            self.event_queue.put(RDTEvent(RDTEventType.WINDOW_UPDATE, self))
+
+    @property
+    def RTO(self) -> float:
+        """
+        重传超时，连续超时时指数退避
+        """
+        return min(self.max_rto, max(self.min_rto, self.base_RTO) * 2 ** self.timeout_cnt)
+
+    @property
+    def pacing_rate(self):
+        """
+        当前的发包速率，字节/秒，None 表示不限
+        """
+        if self.pacing is True:
+            return self.cc.pacing_rate
+        return self.pacing or None
 
     @property
     def current_window(self):
-        return len(self.wait_ack) - len(self.wait_resend)
+        return len(self.wait_ack) - len(self.wait_resend) - self.sacked_cnt
 
     def close(self):
         assert not self.is_close, 'Duplicated close'
@@ -310,15 +762,51 @@ class SimpleRDT(RDTSocket):
 
     def recv(self, bufsize: int) -> bytes:
         assert not self.is_close, 'Closed!'
+        with self.lock:
+            self.wait_for(self.readable, lambda: len(self.data) > 0 or self.remote_close)
+            bs = self.data.read(bufsize)
+        self.check_window_update()
+        return bs
+
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        assert not self.is_close, 'Closed!'
+        with self.lock:
+            self.wait_for(self.readable, lambda: len(self.data) > 0 or self.remote_close)
+            n = self.data.read_into(buffer, nbytes or len(memoryview(buffer).cast('B')))
+        self.check_window_update()
+        return n
+
+    def recv_exactly(self, n: int) -> bytes:
+        """
+        接收缓冲区最多存 rcvbuf 字节，n 比它大时攒够一块就先读走、通告窗口，再接着等
+        """
+        assert not self.is_close, 'Closed!'
+        chunks = bytearray()
         while True:
+            need = n - len(chunks)
             with self.lock:
-                if len(self.data) > 0:
-                    re = self.data[:bufsize]
-                    self.data = self.data[bufsize:]
-                    return re
-                if self.remote_close:
-                    return b''
-            time.sleep(0.0001)
+                self.wait_for(self.readable, lambda: len(self.data) >= self.chunk_of(need) or self.remote_close)
+                closed = self.remote_close
+                bs = self.data.read(need)
+            self.check_window_update()
+            if len(bs) == n:
+                return bs  # 一次就够，不再复制
+            chunks += bs
+            if len(chunks) == n or closed:
+                return bytes(chunks)
+
+    def chunk_of(self, need: int) -> int:
+        """
+        recv_exactly 一次等多少字节：不超过半个接收缓冲区，读走以后窗口至少翻倍，能触发窗口更新
+        """
+        return min(need, max(1, self.rcvbuf // 2))
+
+    def set_remote_close(self):
+        with self.lock:
+            self.remote_close = True
+            self.readable.notify_all()
+        if self.waker is not None:
+            self.waker()
 
     def connect(self, address: (str, int)):
         assert False, 'Duplicated connecting'
@@ -330,57 +818,147 @@ class SimpleRDT(RDTSocket):
         assert RTT >= 0, 'RTT-> %d ?' % RTT
         if self.debug:
             print('\033[0;34m212: 更新前WINDOW-> ', self.SEND_WINDOW_SIZE, 'RTT->', RTT)
-        if self.BASE_RTT == 0:
-            self.BASE_RTT = RTT
-        tr_differ = (1 - (self.BASE_RTT / RTT) ** 3) * self.SEND_WINDOW_SIZE
-        if self.debug:
-            print('217: 计算出的differ-> ', tr_differ)
-        if tr_differ > DECREASE_:
-            self.SEND_WINDOW_SIZE -= min(0.8, log(self.SEND_WINDOW_SIZE) / max(self.SEND_WINDOW_SIZE / 3, 1))
-        elif tr_differ < INCREASE_:
-            self.SEND_WINDOW_SIZE += 1 / max(1.0, log(self.SEND_WINDOW_SIZE))
+        self.cc.on_rtt_sample(RTT)
+        if self.SRTT == 0:
+            self.SRTT = RTT
+            self.RTTVAR = RTT / 2
         else:
-            self.SEND_WINDOW_SIZE += log(self.SEND_WINDOW_SIZE + 1) / self.SEND_WINDOW_SIZE
-        self.BASE_RTT = self.BASE_RTT * RTT_ + (1 - RTT_) * RTT
+            self.RTTVAR = (1 - RTO_BETA) * self.RTTVAR + RTO_BETA * abs(self.SRTT - RTT)
+            self.SRTT = (1 - RTO_ALPHA) * self.SRTT + RTO_ALPHA * RTT
+        self.base_RTO = self.SRTT + 4 * self.RTTVAR
+        self.timeout_cnt = 0
         if self.debug:
-            print('226: 更新后WINDOW->', self.SEND_WINDOW_SIZE, '\033[0m')
+            print('226: 更新后WINDOW->', self.SEND_WINDOW_SIZE, 'RTO->', self.RTO, '\033[0m')
             self.perf.append({
-                'BASE-RTT': self.BASE_RTT,
+                'BASE-RTT': self.SRTT,
+                'RTO': self.RTO,
                 'RTT': RTT,
-                'WINDOW': self.SEND_WINDOW_SIZE
+                'WINDOW': self.SEND_WINDOW_SIZE,
+                'PACING': self.pacing_rate
             })
 
     def deal_recv_data(self, pkt: RDTPacket) -> (bool, int):
+        self.recv_pkt_cnt += 1
+        if self.wnd_ok and pkt.SEQ + pkt.LEN > self.SEQ_ACK + self.recv_window:
+            return False, 0  # 超出接收窗口，丢掉，回的ACK里带着当前窗口
         if pkt.SEQ == self.SEQ_ACK:
             with self.lock:
                 self.data.extend(pkt.PAYLOAD)  # 放进对应连接的接受数据里
-            self.SEQ_ACK += pkt.LEN
-            while len(self.recv_buffer) > 0 and self.recv_buffer[0].SEQ == self.SEQ_ACK:
-                pkt = self.recv_buffer.pop(0)
-                with self.lock:
-                    self.data.extend(pkt.PAYLOAD)
                 self.SEQ_ACK += pkt.LEN
+                self.recv_bytes += pkt.LEN
+                self.deliver_buffered()
             return True, 0
         elif pkt.SEQ > self.SEQ_ACK:
-            index = 0
-            while len(self.recv_buffer) > index:
-                if self.recv_buffer[index].SEQ < pkt.SEQ:
-                    index += 1
-                elif self.recv_buffer[index].SEQ == pkt.SEQ:
-                    return False, pkt.SEQ
-                else:
-                    self.recv_buffer.insert(index, pkt)
-                    return False, pkt.SEQ
-            self.recv_buffer.append(pkt)
+            if pkt.SEQ not in self.recv_buffer:  # 重复的乱序包直接丢
+                self.recv_buffer[pkt.SEQ] = pkt
+                self.add_sack_range(pkt.SEQ, pkt.SEQ + pkt.LEN)
             return False, pkt.SEQ
         else:
             return False, 0
 
+    def deliver_buffered(self):
+        """
+        SEQ_ACK 前进以后，把乱序缓存里接得上的包交给上层，调用时持有 self.lock
+        """
+        while self.SEQ_ACK in self.recv_buffer:
+            pkt = self.recv_buffer.pop(self.SEQ_ACK)
+            self.data.extend(pkt.PAYLOAD)
+            self.SEQ_ACK += pkt.LEN
+            self.recv_bytes += pkt.LEN
+        while len(self.sack_ranges) > 0 and self.sack_ranges[0][1] <= self.SEQ_ACK:
+            self.sack_ranges.pop(0)
+        self.readable.notify_all()
+        if self.waker is not None:
+            self.waker()
+
+    def add_sack_range(self, start: int, end: int):
+        ranges = self.sack_ranges
+        i = bisect.bisect_left(ranges, [start, end])
+        if i > 0 and ranges[i - 1][1] >= start:
+            i -= 1
+            ranges[i][1] = max(ranges[i][1], end)
+        else:
+            ranges.insert(i, [start, end])
+        while i + 1 < len(ranges) and ranges[i + 1][0] <= ranges[i][1]:
+            ranges[i][1] = max(ranges[i][1], ranges.pop(i + 1)[1])
+
+    def sack_payload(self, latest: int) -> bytes:
+        """
+        SAK包的负载：若干个 (start, end) 区间，包含 latest 的区间放最前，其余从小到大，最多 MAX_SACK_BLOCKS 个
+        """
+        ranges = self.sack_ranges
+        i = bisect.bisect_right(ranges, [latest, 0xFFFFFFFF]) - 1
+        first = ranges[i] if i >= 0 and ranges[i][1] > latest else None
+        blocks = [] if first is None else [first]
+        for r in ranges:
+            if len(blocks) >= MAX_SACK_BLOCKS:
+                break
+            if r is not first:
+                blocks.append(r)
+        return b''.join(struct.pack('!2I', s, e) for s, e in blocks)
+
+    def get_stats(self) -> dict:
+        """
+        事件循环线程外也能调，读到的是某个时刻前后的值，不加锁
+        """
+        try:
+            una = next(iter(self.wait_ack)) if len(self.wait_ack) > 0 else self.SEQ  # 最早没确认的 SEQ
+        except (StopIteration, RuntimeError):  # 事件循环正好在改 wait_ack
+            una = self.SEQ
+        return {
+            'remote': self.remote,
+            'status': self.status.name if self.status is not None else None,
+            'bytes_sent': self.sent_bytes,
+            'bytes_received': self.recv_bytes,
+            'bytes_retransmitted': self.resent_bytes,
+            'packets_sent': self.sent_pkt_cnt + self.resent_pkt_cnt,
+            'packets_received': self.recv_pkt_cnt,
+            'packets_retransmitted': self.resent_pkt_cnt,
+            'fast_retransmits': self.fast_resent_cnt,
+            'timeouts': self.rto_cnt,
+            'saks_sent': self.sak_sent_cnt,
+            'saks_received': self.sak_recv_cnt,
+            'corruptions': self.corrupt_cnt,
+            'cwnd': self.cc.cwnd,
+            'srtt': self.SRTT,
+            'rttvar': self.RTTVAR,
+            'rto': self.RTO,
+            'pacing_rate': self.pacing_rate,
+            'mss': self.mss,
+            'in_flight_bytes': self.SEQ - una,
+            'in_flight_packets': self.current_window,
+            'reorder_packets': len(self.recv_buffer),
+            'recv_buffered_bytes': len(self.data),
+            'send_buffered_bytes': len(self.wait_send) - self.wait_send_offset,
+            'recv_window': self.recv_window,
+        }
+
     def save_perf(self, path: str):
         with open(path, 'w') as f:
             json.dump(self.perf, f)
 
 
+CUMULATIVE_STATS = ('bytes_sent', 'bytes_received', 'bytes_retransmitted', 'packets_sent', 'packets_received',
+                    'packets_retransmitted', 'fast_retransmits', 'timeouts', 'saks_sent',
+                    'saks_received')  # 只增不减的计数，连接销毁后还要算进监听 socket 的汇总
+SUMMED_STATS = CUMULATIVE_STATS + ('in_flight_bytes', 'in_flight_packets', 'reorder_packets', 'recv_buffered_bytes',
+                                   'send_buffered_bytes')  # 汇总时相加的项，其余的瞬时值取平均
+AVERAGED_STATS = ('cwnd', 'srtt', 'rto')
+
+
+def aggregate_stats(connections: list) -> dict:
+    """
+    服务端所有连接的汇总
+    """
+    stats = [s.get_stats() for s in connections]
+    total = {'connections': len(stats)}
+    for key in SUMMED_STATS:
+        total[key] = sum(st[key] for st in stats)
+    for key in AVERAGED_STATS:
+        total['avg_' + key] = sum(st[key] for st in stats) / len(stats) if len(stats) > 0 else 0
+    return total
+
+
 class EventLoop(threading.Thread):
     def __init__(self, _socket: RDTSocket):
         super().__init__()
@@ -388,78 +966,89 @@ class EventLoop(threading.Thread):
         self.event_queue: SimpleQueue = SimpleQueue()
         self.send_loop: SendLoop = SendLoop(_socket, self)
         self.recv_loop: RecvLoop = RecvLoop(_socket, self)
-        self.timers = []
+        self.timers = []  # 定时器小顶堆，元素为 [target_time, 序号, timer]，取消时只把 timer 置为 None
+        self.timer_cnt = 0  # 堆里还没取消的定时器个数
+        self.timer_seq = count()  # 同一时刻的定时器按加入顺序触发
+        self.corrupt_cnt = 0  # 校验没过的包数，包括找不到连接的
+        self.link_tokens = 0.0  # socket 的 rate 限速：所有连接共用的令牌桶，字节
+        self.link_at = time.time()  # 上次往共用令牌桶里加令牌的时间
 
     def run(self) -> None:
         if self.socket.debug:
             print('\033[0;36m\n275: Event loop start->', self.getName(), ' \033[0m')
         while True:
-            while len(self.timers) > 0 and self.timers[0].target_time <= time.time():
-                timer = self.timers.pop(0)
-                self.event_queue.put_nowait(timer.event)
-                if self.socket.debug:
-                    print('\033[0;37m281: Timer-> ', timer.target_time - timer.start_time, 's | ', timer.event.type,
-                          '\033[0m')
-            if self.event_queue.empty():
-                time.sleep(0.00001)
+            self.fire_timers(time.time())
+            next_time = self.next_timer_time()
+            try:
+                event: RDTEvent = self.event_queue.get(
+                    timeout=None if next_time is None else max(0.0, next_time - time.time()))
+            except Empty:
+                continue  # 没有事件，定时器到点了
+            if not self.dispatch(event):
+                break
+
+    def dispatch(self, event: RDTEvent) -> bool:
+        """
+        处理一个事件
+        :return: False 表示事件循环该结束了
+        """
+        try:
+            if self.socket.debug:
+                print('\033[0;37m290: Event-> ', event.type, '\033[0m')
+            if event.type == RDTEventType.VANISH:
+                return self.on_vanish()
+            elif event.type == RDTEventType.DESTROY_ALL:
+                self.on_destroy_all()
+            elif event.type == RDTEventType.LISTEN_CLOSE:
+                self.on_listen_close()
+            elif event.type == RDTEventType.SIMPLE_CLOSE:
+                self.on_simple_close(event.body)
+            elif event.type == RDTEventType.DESTROY_SIMPLE:
+                self.on_destroy_simple(event.body)
+            elif event.type == RDTEventType.SEND_ACK:
+                self.on_send_ack(event.body)
+            elif event.type == RDTEventType.SEND_FIN:
+                self.on_send_fin(event.body)
+            elif event.type == RDTEventType.SEND_SAK:
+                self.on_send_sak(event.body)
+            elif event.type == RDTEventType.WINDOW_UPDATE:
+                self.on_window_update(event.body)
+            elif event.type == RDTEventType.MSS_PROBE:
+                self.on_mss_probe(event.body)
+            elif event.type == RDTEventType.MSS_PROBE_TIMEOUT:
+                self.on_mss_probe_timeout(event.body)
+            elif event.type == RDTEventType.SAK:
+                self.on_sak(event.body)
+            elif event.type == RDTEventType.SEND:
+                self.on_send(event.body)
+            elif event.type == RDTEventType.CONNECT:
+                self.on_connect(event.body)
+            elif event.type == RDTEventType.CORRUPTION:
+                self.on_corruption(event.body)
+            elif event.type == RDTEventType.ACK_TIMEOUT:
+                self.on_ack_timeout(event.body)
+            elif event.type == RDTEventType.RST:
+                self.on_rst(event.body)
+            elif event.type == RDTEventType.UNKNOWN_ERROR:
+                self.on_unknown_error(event.body)
+            elif event.type == RDTEventType.FIN_ACK:
+                self.on_fin_ack(event.body)
+            elif event.type == RDTEventType.FIN:
+                self.on_fin(event.body)
+            elif event.type == RDTEventType.ACK:
+                self.on_ack(event.body)
+            elif event.type == RDTEventType.SYN_ACK:
+                self.on_syn_ack(event.body)
+            elif event.type == RDTEventType.SYN:
+                self.on_syn(event.body)
             else:
-                try:
-                    event: RDTEvent = self.event_queue.get_nowait()
-                    if self.socket.debug:
-                        print('\033[0;37m290: Event-> ', event.type, '\033[0m')
-                    if event.type == RDTEventType.VANISH:
-                        if len(self.timers) > 0:
-                            time.sleep(self.timers[0].target_time - time.time())
-                            self.put(RDTEventType.VANISH, None)
-                            continue
-                        self.close()
-                        self.before_vanish()
-                        break
-                    elif event.type == RDTEventType.DESTROY_ALL:
-                        self.on_destroy_all()
-                    elif event.type == RDTEventType.LISTEN_CLOSE:
-                        self.on_listen_close()
-                    elif event.type == RDTEventType.SIMPLE_CLOSE:
-                        self.on_simple_close(event.body)
-                    elif event.type == RDTEventType.DESTROY_SIMPLE:
-                        self.on_destroy_simple(event.body)
-                    elif event.type == RDTEventType.SEND_ACK:
-                        self.on_send_ack(event.body)
-                    elif event.type == RDTEventType.SEND_FIN:
-                        self.on_send_fin(event.body)
-                    elif event.type == RDTEventType.SAK:
-                        self.on_sak(event.body)
-                    elif event.type == RDTEventType.SEND:
-                        self.on_send(event.body)
-                    elif event.type == RDTEventType.CONNECT:
-                        self.on_connect(event.body)
-                    elif event.type == RDTEventType.CORRUPTION:
-                        self.on_corruption(event.body)
-                    elif event.type == RDTEventType.ACK_TIMEOUT:
-                        self.on_ack_timeout(event.body)
-                    elif event.type == RDTEventType.RST:
-                        self.on_rst(event.body)
-                    elif event.type == RDTEventType.UNKNOWN_ERROR:
-                        self.on_unknown_error(event.body)
-                    elif event.type == RDTEventType.FIN_ACK:
-                        self.on_fin_ack(event.body)
-                    elif event.type == RDTEventType.FIN:
-                        self.on_fin(event.body)
-                    elif event.type == RDTEventType.ACK:
-                        self.on_ack(event.body)
-                    elif event.type == RDTEventType.SYN_ACK:
-                        self.on_syn_ack(event.body)
-                    elif event.type == RDTEventType.SYN:
-                        self.on_syn(event.body)
-                    else:
-                        self.on_sb()
-                except Empty:
-                    pass
-                except AssertionError as ev:
-                    if self.socket.debug:
-                        print('\033[0;31m342: Assertion->', ev, '\033[0m')
-                except Exception as error:
-                    print('\033[0;31m345: Error->', error, '\033[0m')
+                self.on_sb()
+        except AssertionError as ev:
+            if self.socket.debug:
+                print('\033[0;31m342: Assertion->', ev, '\033[0m')
+        except Exception as error:
+            print('\033[0;31m345: Error->', error, '\033[0m')
+        return True
 
     def close(self):
         self.send_loop.put(0)
@@ -483,7 +1072,10 @@ class EventLoop(threading.Thread):
     def on_corruption(self, pkt: RDTPacket):
         if self.socket.debug:
             print('\033[0;31m367: Corruption-> SEQ=', pkt.SEQ, '\033[0m')
-        pass  # 包炸了
+        self.corrupt_cnt += 1  # 包炸了
+        skt = self.connection_of(pkt.remote)
+        if skt is not None:
+            skt.corrupt_cnt += 1
 
     def on_ack_timeout(self, pkt: RDTPacket):
         pass  # 等ACK超时了
@@ -527,6 +1119,28 @@ class EventLoop(threading.Thread):
     def on_send_ack(self, simple_skt: SimpleRDT):
         pass  # 延时到了，判断是否发送ack
 
+    def on_send_sak(self, body: (SimpleRDT, int)):
+        skt, seq_sak = body
+        skt.sak_timer = None
+        if len(skt.sack_ranges) > 0:  # 期间空洞可能已经补上了
+            self.send_sak_pkt(seq_sak, skt)
+
+    def on_window_update(self, skt: SimpleRDT):
+        if not skt.remote_close:
+            self.send_ack_pkt(skt)
+
+    def on_mss_probe(self, pkt: RDTPacket):
+        pass  # MSS 探测包或者它的回复
+
+    def on_mss_probe_timeout(self, body: (SimpleRDT, int)):
+        skt, size = body
+        if size != skt.probe_size:
+            return  # 排队时收到了回复
+        skt.probe_tries += 1
+        if skt.probe_tries >= MSS_PROBE_TRIES:
+            skt.probe_high = size - 1  # 这么大过不去
+        self.send_mss_probe(skt)
+
     def on_simple_close(self, remote: (str, int)):
         pass  # 单连接调用close
 
@@ -542,34 +1156,81 @@ class EventLoop(threading.Thread):
     def before_vanish(self):
         pass  # 事件循环消失前最后的挣扎
 
+    def on_vanish(self) -> bool:
+        if self.timer_cnt > 0:
+            time.sleep(max(0.0, self.next_timer_time() - time.time()))
+            self.put(RDTEventType.VANISH, None)
+            return True
+        self.close()
+        self.before_vanish()
+        return False
+
     def push_timer(self, timeout: float, ev: RDTEvent):
-        index = 0
         timer = RDTTimer(timeout=timeout, e=ev)
-        while len(self.timers) > index:
-            if self.timers[index].target_time <= timer.target_time:
-                index += 1
-            else:
-                self.timers.insert(index, timer)
-                return timer
-        self.timers.append(timer)
+        self.push_raw_timer(timer)
         return timer
 
     def push_raw_timer(self, timer: RDTTimer):
-        self.timers.append(timer)
+        if timer.entry is not None:
+            self.cancel_timer(timer)  # 同一个定时器在堆里只留一份
+        timer.entry = [timer.target_time, next(self.timer_seq), timer]
+        heapq.heappush(self.timers, timer.entry)
+        self.timer_cnt += 1
 
     def cancel_timer(self, _: RDTTimer):
-        try:
-            self.timers.remove(_)
-        except Exception as ev:
+        if _ is None or _.entry is None:
             if self.socket.debug:
-                print('\033[0;33m440: Exception->', ev, '\033[0m')
+                print('\033[0;33m440: Timer not pending->', _, '\033[0m')
+            return
+        _.entry[2] = None  # 懒删除，弹到堆顶时丢掉
+        _.entry = None
+        self.timer_cnt -= 1
+
+    def fire_timers(self, now: float):
+        """
+        把所有到点的定时器的事件放进事件队列
+        """
+        while len(self.timers) > 0 and self.timers[0][0] <= now:
+            timer: RDTTimer = heapq.heappop(self.timers)[2]
+            if timer is None:
+                continue
+            timer.entry = None
+            self.timer_cnt -= 1
+            self.event_queue.put_nowait(timer.event)
+            if self.socket.debug:
+                print('\033[0;37m281: Timer-> ', timer.target_time - timer.start_time, 's | ', timer.event.type,
+                      '\033[0m')
+
+    def next_timer_time(self):
+        """
+        最近一个未取消定时器的触发时间，没有定时器返回 None
+        """
+        while len(self.timers) > 0 and self.timers[0][2] is None:
+            heapq.heappop(self.timers)
+        return self.timers[0][0] if len(self.timers) > 0 else None
+
+    def checksum_of(self, remote: (str, int)) -> int:
+        return 0  # recv loop 校验时用的算法，由子类按连接查
+
+    def connection_of(self, remote: (str, int)):
+        return None  # 远端对应的连接，没有就是 None
 
     def send_sak_pkt(self, seq_sak: int, sct: SimpleRDT):
-        sak_pkt = RDTPacket(SAK=1, SEQ=seq_sak, remote=sct.remote, SEQ_ACK=sct.SEQ_ACK)
+        sak_pkt = RDTPacket(SAK=1, SEQ=seq_sak, remote=sct.remote, SEQ_ACK=sct.SEQ_ACK,
+                            PAYLOAD=sct.sack_payload(seq_sak), algo=sct.checksum)
+        sct.advertise(sak_pkt)
+        sct.sak_sent_cnt += 1
         self.send_loop.put(sak_pkt)
 
+    def await_send_sak(self, skt: SimpleRDT, seq_sak: int):
+        """
+        SAK_WAIT 内陆续到的乱序包合成一个带多个区间的SAK
+        """
+        if skt.sak_timer is None:
+            skt.sak_timer = self.push_timer(SAK_WAIT, RDTEvent(RDTEventType.SEND_SAK, (skt, seq_sak)))
+
     def await_send_ack(self, skt: SimpleRDT):
-        timeout = SEND_WAIT
+        timeout = skt.ack_delay
         if skt.ack_timer and time.time() < skt.ack_timer.target_time:
             return
         _ = self.push_timer(timeout, RDTEvent(RDTEventType.SEND_ACK, skt))
@@ -584,85 +1245,206 @@ class EventLoop(threading.Thread):
     def call_send(self, skt: SimpleRDT):
         self.put(RDTEventType.SEND, (skt.remote, bytes()))
 
+    def pace(self, skt: SimpleRDT, n: int) -> bool:
+        """
+        令牌桶：连接自己的发包速率和 socket 的 rate 限速两个桶都够发 n 字节才一起扣掉，返回 True；
+        不够就按等得久的那个定个时，令牌攒够了再来发，返回 False
+        """
+        now = time.time()
+        wait = 0.0
+        rate = skt.pacing_rate
+        if rate is not None:
+            skt.pace_tokens = min(PACING_BURST * skt.mss, skt.pace_tokens + (now - skt.pace_at) * rate)
+            skt.pace_at = now
+            wait = (n - skt.pace_tokens) / rate
+        link = self.socket._rate
+        size = datagram_size(n) - 8  # rate 按 sendto 出去的字节算，地址头是模拟器加的
+        if link:
+            burst = max(PACING_BURST * (datagram_size(skt.mss) - 8), size)
+            self.link_tokens = min(burst, self.link_tokens + (now - self.link_at) * link)
+            self.link_at = now
+            wait = max(wait, (size - self.link_tokens) / link)
+        if wait <= 0:
+            if rate is not None:
+                skt.pace_tokens -= n
+            if link:
+                self.link_tokens -= size
+            return True
+        if skt.pace_timer is None or skt.pace_timer.entry is None:
+            skt.pace_timer = self.push_timer(wait, RDTEvent(RDTEventType.SEND, (skt.remote, bytes())))
+        return False
+
     def deal_ack(self, simple_sct: SimpleRDT, pkt: RDTPacket):
         if simple_sct.debug:
             print('\033[0;36m471: pkt SEQ ->', pkt.SEQ, 'pkt SEQ_ACK ->', pkt.SEQ_ACK, '当前 SEQ_ACK->',
                   simple_sct.SEQ_ACK, '当前 SEQ->', simple_sct.SEQ)
         # 处理 ACK
-        self.pop_wait_ack(simple_sct, pkt)
+        simple_sct.update_send_edge(pkt)
+        advanced = self.pop_wait_ack(simple_sct, pkt)
+        if advanced or pkt.LEN == 0:  # 带数据的包不算重复ACK
+            self.deal_fast_retransmit(simple_sct, pkt, advanced)
         # 窗口可能空了，去发数据
         self.call_send(simple_sct)
+        if simple_sct.waker is not None:
+            simple_sct.waker()
         # 处理数据
         if pkt.LEN == 0:
             return
+        had_gap = len(simple_sct.sack_ranges) > 0
         ACK, SEQ_SAK = simple_sct.deal_recv_data(pkt)
         if ACK:
             if simple_sct.debug:
                 print('\033[0;32m483: '
                       'ACK-> SEQ_ACK=', simple_sct.SEQ_ACK, '待收data 长度->', len(simple_sct.data),
                       '\033[0m')
-            self.await_send_ack(simple_sct)
+            if had_gap or simple_sct.SEQ_ACK - simple_sct.last_ACK >= simple_sct.ack_every * simple_sct.mss:
+                self.send_ack_pkt(simple_sct)  # 补上了空洞或者攒够了包，立即ACK
+            else:
+                self.await_send_ack(simple_sct)
         elif SEQ_SAK != 0:
             if simple_sct.debug:
                 print('\033[0;34m482: SAK-> SEQ_SAK=', pkt.SEQ, '\033[0m')
-            self.send_sak_pkt(SEQ_SAK, simple_sct)
+            if not had_gap:
+                self.send_sak_pkt(SEQ_SAK, simple_sct)  # 刚出现空洞，立即告诉对方
+            else:
+                self.await_send_sak(simple_sct, SEQ_SAK)
         else:
-            self.send_ack_pkt(simple_sct)
+            self.send_dup_ack_pkt(simple_sct)
             if simple_sct.debug:
                 print('\033[0;33m494: 无效包-> SEQ=', pkt.SEQ, ' 当前SEQ=', simple_sct.SEQ_ACK, '\033[0m')
 
     def deal_sak(self, simple_sct: SimpleRDT, pkt: RDTPacket):
-        SEQ_SAK = pkt.SEQ
+        """
+        SAK 带着对方乱序缓存的区间，区间里在途的包都不用再重发，等累计ACK弹出
+        """
         if self.socket.debug:
-            print('\033[0;33m499: SAK->', SEQ_SAK)
-        timer = None
-        for t in simple_sct.wait_ack:
-            if t.event.body.SEQ == SEQ_SAK:
-                timer = t
-                break
-        assert timer is not None, 'Timer dose not exist'
-        RTT = time.time() - timer.start_time
-        simple_sct.deal_RTT(RTT)
-        simple_sct.wait_ack.remove(timer)
-        if timer.active:
-            self.cancel_timer(timer)
-        else:
-            simple_sct.wait_resend.remove(timer)
-
-        self.pop_wait_ack(simple_sct, pkt)
+            print('\033[0;33m499: SAK->', pkt.SEQ, '区间数->', pkt.LEN // 8)
+        simple_sct.sak_recv_cnt += 1
+        simple_sct.update_send_edge(pkt)
+        advanced = self.pop_wait_ack(simple_sct, pkt)
+        now = time.time()
+        for start, end in struct.iter_unpack('!2I', pkt.PAYLOAD[:pkt.LEN - pkt.LEN % 8]):
+            seq = start
+            while seq < end:
+                timer = simple_sct.wait_ack.get(seq)
+                if timer is None or timer.event.body.LEN == 0:
+                    break
+                if not timer.sacked:
+                    if timer.active:
+                        self.cancel_timer(timer)
+                    else:
+                        del simple_sct.wait_resend[seq]
+                    timer.sacked = True
+                    simple_sct.sacked_cnt += 1
+                    simple_sct.cc.on_ack(timer.event.body.LEN)
+                    if not timer.resent:
+                        simple_sct.deal_RTT(now - timer.start_time)
+                seq += timer.event.body.LEN
+        self.deal_fast_retransmit(simple_sct, pkt, advanced)
         # 尝试发数据
         self.call_send(simple_sct)
+        if simple_sct.waker is not None:
+            simple_sct.waker()
 
-    def pop_wait_ack(self, simple_sct, pkt):
+    def pop_wait_ack(self, simple_sct, pkt) -> bool:
+        """
+        弹出被累计确认的包
+        :return: 累计确认有没有推进
+        """
+        advanced = False
         while len(simple_sct.wait_ack) > 0:
-            timer: RDTTimer = simple_sct.wait_ack[0]
+            timer: RDTTimer = next(iter(simple_sct.wait_ack.values()))
             wait_ack_pkt: RDTPacket = timer.event.body
-            if wait_ack_pkt.SEQ + wait_ack_pkt.LEN < pkt.SEQ_ACK:
-                if not timer.active:
-                    simple_sct.wait_resend.remove(timer)
-                self.cancel_timer(simple_sct.wait_ack.pop(0))
-            elif wait_ack_pkt.SEQ + wait_ack_pkt.LEN == pkt.SEQ_ACK:
-                if not timer.active:
-                    simple_sct.wait_resend.remove(timer)
-                self.cancel_timer(simple_sct.wait_ack.pop(0))
-                if timer.event.body.FIN == 1:
-                    self.put(RDTEventType.DESTROY_SIMPLE, simple_sct)
-                RTT = time.time() - timer.start_time
-                simple_sct.deal_RTT(RTT)
+            if wait_ack_pkt.SEQ + wait_ack_pkt.LEN > pkt.SEQ_ACK:
                 break
+            simple_sct.wait_ack.popitem(last=False)
+            advanced = True
+            simple_sct.timeout_cnt = 0  # 有进展，不再退避
+            if timer.sacked:
+                simple_sct.sacked_cnt -= 1
             else:
+                if not timer.active:
+                    del simple_sct.wait_resend[wait_ack_pkt.SEQ]
+                self.cancel_timer(timer)
+                if wait_ack_pkt.LEN > 0:
+                    simple_sct.cc.on_ack(wait_ack_pkt.LEN)
+            if wait_ack_pkt.SEQ + wait_ack_pkt.LEN == pkt.SEQ_ACK:
+                if wait_ack_pkt.FIN == 1:
+                    self.put(RDTEventType.DESTROY_SIMPLE, simple_sct)
+                if not timer.sacked and not timer.resent:
+                    RTT = time.time() - timer.start_time
+                    simple_sct.deal_RTT(RTT)
                 break
+        return advanced
+
+    def deal_fast_retransmit(self, simple_sct: SimpleRDT, pkt: RDTPacket, advanced: bool):
+        """
+        DUP_THRESH 个重复ACK，或者第一个未确认的包后面已经有 DUP_THRESH 个包被SAK，就不等超时直接重发它；
+        重发后到累计确认越过重发时的 SEQ 之前，每个部分确认都说明下一个空洞也丢了，同样直接重发
+        """
+        if len(simple_sct.wait_ack) == 0:
+            simple_sct.dup_acks = 0
+            simple_sct.recover = None
+            return
+        first_seq, timer = next(iter(simple_sct.wait_ack.items()))
+        if advanced:
+            simple_sct.dup_acks = 0
+            if simple_sct.recover is None:
+                return
+            if first_seq >= simple_sct.recover:
+                simple_sct.recover = None
+                return
+        else:
+            if pkt.SEQ_ACK != first_seq:
+                return  # 迟到的旧ACK
+            simple_sct.dup_acks += 1
+            if simple_sct.recover is not None or \
+                    (simple_sct.dup_acks < DUP_THRESH and simple_sct.sacked_cnt < DUP_THRESH):
+                return
+            simple_sct.recover = simple_sct.SEQ
+        if timer.sacked:
+            return
+        if simple_sct.debug:
+            print('\033[0;33m快速重传-> SEQ=', first_seq, '重复ACK->', simple_sct.dup_acks, '已SAK->',
+                  simple_sct.sacked_cnt, '\033[0m')
+        if timer.active:
+            self.cancel_timer(timer)
+        else:
+            del simple_sct.wait_resend[first_seq]
+        wait_ack_pkt: RDTPacket = timer.event.body
+        simple_sct.advertise(wait_ack_pkt)
+        simple_sct.fast_resent_cnt += 1
+        simple_sct.resent_pkt_cnt += 1
+        simple_sct.resent_bytes += wait_ack_pkt.LEN
+        simple_sct.cc.on_loss(0, simple_sct.RTO)
+        timer.start_time = time.time()
+        timer.target_time = timer.start_time + simple_sct.RTO
+        timer.active = True
+        timer.resent = True
+        timer.backoff = simple_sct.timeout_cnt
+        self.push_raw_timer(timer)
+        if self.socket._rate:
+            self.link_tokens -= datagram_size(wait_ack_pkt.LEN) - 8  # 快速重传不等令牌，先欠着，后面的包晚点发
+        self.send_loop.put(wait_ack_pkt)
 
     def deal_resend(self, simple_sct: SimpleRDT):
-        while simple_sct.current_window + 1 < simple_sct.SEND_WINDOW_SIZE and len(simple_sct.wait_resend) > 0:
-            timer: RDTTimer = simple_sct.wait_resend.pop(0)
+        while len(simple_sct.wait_resend) > 0 and (simple_sct.current_window + 1 < simple_sct.SEND_WINDOW_SIZE or
+                                                   simple_sct.current_window == 0):  # 路上没包时窗口再小也重发一个
+            if not self.pace(simple_sct, next(iter(simple_sct.wait_resend.values())).event.body.LEN):
+                break
+            timer: RDTTimer = simple_sct.wait_resend.popitem(last=False)[1]
             timer.start_time = time.time()
-            timer.target_time = timer.start_time + simple_sct.BASE_RTT * 2 + EXTRA_ACK_WAIT
+            timer.target_time = timer.start_time + simple_sct.RTO
             timer.active = True
+            timer.resent = True
+            timer.backoff = simple_sct.timeout_cnt
             if simple_sct.debug:
                 print('\033[0;33m545: 重发包, SEQ=', timer.event.body.SEQ, '当前占用->', simple_sct.current_window,
-                      '窗口-> ', simple_sct.SEND_WINDOW_SIZE, '当前等待重发->', len(simple_sct.wait_resend), ' RTT-> ',
-                      simple_sct.BASE_RTT, '\033[0m')
+                      '窗口-> ', simple_sct.SEND_WINDOW_SIZE, '当前等待重发->', len(simple_sct.wait_resend), ' RTO-> ',
+                      simple_sct.RTO, '\033[0m')
+            simple_sct.advertise(timer.event.body)
+            simple_sct.resent_pkt_cnt += 1
+            simple_sct.resent_bytes += timer.event.body.LEN
             self.push_raw_timer(timer)
             self.send_loop.put(timer.event.body)
 
@@ -672,57 +1454,103 @@ class EventLoop(threading.Thread):
         while simple_sct.current_window < simple_sct.SEND_WINDOW_SIZE:
             if len(simple_sct.wait_send) == 0 or simple_sct.wait_send_offset >= len(simple_sct.wait_send):
                 break
+            n = min(simple_sct.mss, len(simple_sct.wait_send) - simple_sct.wait_send_offset)
+            if simple_sct.wnd_ok and simple_sct.SEQ + n > simple_sct.send_edge:
+                if len(simple_sct.wait_ack) > 0:
+                    break  # 对方窗口满了，等ACK带来新窗口
+                n = max(1, simple_sct.send_edge - simple_sct.SEQ)  # 用完剩下的小窗口，零窗口时发1字节探测，靠超时重发反复探测
+            if not self.pace(simple_sct, n):
+                break
             pkt = RDTPacket(remote=simple_sct.remote, ACK=1, SEQ=simple_sct.SEQ, SEQ_ACK=simple_sct.SEQ_ACK,
-                            PAYLOAD=simple_sct.wait_send[
-                                    simple_sct.wait_send_offset:simple_sct.wait_send_offset + MAX_PKT_LEN])
+                            PAYLOAD=simple_sct.wait_send[simple_sct.wait_send_offset:simple_sct.wait_send_offset + n],
+                            algo=simple_sct.checksum)
+            simple_sct.advertise(pkt)
             self.send_loop.put(pkt)
+            simple_sct.sent_pkt_cnt += 1
+            simple_sct.sent_bytes += n
             simple_sct.SEQ += pkt.LEN
-            simple_sct.last_ACK = simple_sct.SEQ_ACK
-            simple_sct.wait_send_offset += MAX_PKT_LEN
+            simple_sct.wait_send_offset += n
             if simple_sct.wait_send_offset >= len(simple_sct.wait_send):
                 simple_sct.wait_send.clear()
                 simple_sct.wait_send_offset = 0
             if self.socket.debug:
                 print('\033[0;33m568: 发送包 SEQ->', pkt.SEQ)
-            timer = self.push_timer(simple_sct.BASE_RTT * 2 + EXTRA_ACK_WAIT, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
-            simple_sct.wait_ack.append(timer)
+            timer = self.push_timer(simple_sct.RTO, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
+            timer.backoff = simple_sct.timeout_cnt
+            simple_sct.wait_ack[pkt.SEQ] = timer
         if simple_sct.debug:
             print('\033[0;36m572: 当前等待发送数据长度->', len(simple_sct.wait_send) - simple_sct.wait_send_offset)
 
     def deal_ack_timeout(self, simple_sct: SimpleRDT, pkt: RDTPacket):
-        timer = None
-        index = 0
-        for i in range(len(simple_sct.wait_ack)):
-            _timer: RDTTimer = simple_sct.wait_ack[i]
-            if _timer.event.body is pkt:
-                timer = _timer
-                index = i
-                break
-        assert timer is not None, 'Can not find timer'
-        pkt.SEQ_ACK = simple_sct.SEQ_ACK
-        simple_sct.last_ACK = simple_sct.SEQ_ACK
-        if simple_sct.SEND_WINDOW_SIZE > 1.6 and index / simple_sct.SEND_WINDOW_SIZE > BOMB_RATE \
-                and time.time() - simple_sct.last_bomb > 2 * simple_sct.BASE_RTT + EXTRA_ACK_WAIT:  # 连续丢包强制降窗
-            simple_sct.SEND_WINDOW_SIZE = simple_sct.SEND_WINDOW_SIZE * 0.65
-            simple_sct.last_bomb = time.time()
-            if simple_sct.debug:
-                print('\033[0;33m583: 丢包降窗->', simple_sct.SEND_WINDOW_SIZE)
+        timer = simple_sct.wait_ack.get(pkt.SEQ)
+        assert timer is not None and timer.event.body is pkt, 'Can not find timer'
+        if timer.sacked:
+            return  # 超时事件排队时被SAK了
+        index = (pkt.SEQ - next(iter(simple_sct.wait_ack))) / simple_sct.mss  # 前面还有多少个包没确认，按满包估计
+        simple_sct.advertise(pkt)
+        simple_sct.rto_cnt += 1
+        if timer.backoff == simple_sct.timeout_cnt and simple_sct.RTO < simple_sct.max_rto:
+            simple_sct.timeout_cnt += 1  # 这一轮第一个超时的包，退避
+        if not simple_sct.wnd_ok or pkt.SEQ + pkt.LEN <= simple_sct.send_edge:  # 零窗口探测被丢不算拥塞
+            simple_sct.cc.on_loss(index, simple_sct.RTO)
+        if simple_sct.debug:
+            print('\033[0;33m583: 超时后窗口->', simple_sct.SEND_WINDOW_SIZE)
         timer.active = False  # 定时器记为无效
-        simple_sct.wait_resend.append(timer)
+        simple_sct.wait_resend[pkt.SEQ] = timer
         self.deal_resend(simple_sct)
 
     def send_ack_pkt(self, simple_sct):
-        pkt: RDTPacket = RDTPacket(remote=simple_sct.remote, ACK=1, SEQ=simple_sct.SEQ, SEQ_ACK=simple_sct.SEQ_ACK)
-        simple_sct.last_ACK = simple_sct.SEQ_ACK
+        pkt: RDTPacket = RDTPacket(remote=simple_sct.remote, ACK=1, SEQ=simple_sct.SEQ, SEQ_ACK=simple_sct.SEQ_ACK,
+                                   algo=simple_sct.checksum)
+        simple_sct.advertise(pkt)
         self.send_loop.put(pkt)
 
+    def send_dup_ack_pkt(self, simple_sct: SimpleRDT):
+        """
+        回复重复的包，限速，免得对方重传一大片时每个包都换来一个ACK
+        """
+        now = time.time()
+        if now - simple_sct.last_dup_ACK < simple_sct.dup_ack_interval:
+            return
+        simple_sct.last_dup_ACK = now
+        self.send_ack_pkt(simple_sct)
+
+    def send_mss_probe(self, skt: SimpleRDT):
+        """
+        在 (skt.mss, skt.probe_high] 里找路径过得去的最大包，发一个探测包，对方回复收到的包长；
+        先从当前包长翻倍往上试，第一次过不去以后再二分，上限远大于路径能过的包时不用在大包上白等超时
+        """
+        if skt.probe_high - skt.mss < MSS_PROBE_STEP or skt.remote_close:
+            skt.probe_size = 0
+            return
+        size = min(skt.mss * 2, (skt.mss + skt.probe_high + 1) // 2)
+        if size != skt.probe_size:
+            skt.probe_tries = 0
+        skt.probe_size = size
+        self.send_loop.put(RDTPacket(remote=skt.remote, _=FLAG_PROBE, SEQ=skt.SEQ, SEQ_ACK=skt.SEQ_ACK,
+                                     PAYLOAD=bytes(size), algo=skt.checksum,
+                                     WND=skt.recv_window if skt.wnd_ok else None))  # 和数据包一样带窗口，长度才一致
+        skt.probe_timer = self.push_timer(skt.RTO, RDTEvent(RDTEventType.MSS_PROBE_TIMEOUT, (skt, size)))
+
+    def deal_mss_probe(self, skt: SimpleRDT, pkt: RDTPacket):
+        if pkt.ACK == 0:  # 对方在探测，回复包长
+            self.send_loop.put(RDTPacket(remote=skt.remote, ACK=1, _=FLAG_PROBE, SEQ=skt.SEQ, SEQ_ACK=skt.SEQ_ACK,
+                                         PAYLOAD=struct.pack('!I', pkt.LEN), algo=skt.checksum))
+            return
+        size = struct.unpack('!I', pkt.PAYLOAD)[0]
+        if size != skt.probe_size:
+            return  # 超时后迟到的回复
+        self.cancel_timer(skt.probe_timer)
+        skt.set_mss(size)
+        self.send_mss_probe(skt)
+
     def send_fin_ack_pkt(self, simple_sct: SimpleRDT):
         pkt: RDTPacket = RDTPacket(remote=simple_sct.remote, FIN=1, ACK=1, SEQ=simple_sct.SEQ,
-                                   SEQ_ACK=simple_sct.SEQ_ACK)
+                                   SEQ_ACK=simple_sct.SEQ_ACK, algo=simple_sct.checksum)
         self.send_loop.put(pkt)
 
     def deal_send_fin(self, skt: SimpleRDT):
-        pkt = RDTPacket(remote=skt.remote, FIN=1, SEQ=skt.SEQ, SEQ_ACK=skt.SEQ_ACK, PAYLOAD=bytes(1))
+        pkt = RDTPacket(remote=skt.remote, FIN=1, SEQ=skt.SEQ, SEQ_ACK=skt.SEQ_ACK, PAYLOAD=bytes(1), algo=skt.checksum)
         skt.SEQ += 1  # 强制加一做区分
         for i in range(3):
             self.send_loop.put(pkt)
@@ -730,12 +1558,13 @@ class EventLoop(threading.Thread):
             print('\033[0;34m612: 发送FIN， 当前状态-> ', skt.status, '\033[0m')
         if skt.status != RDTConnectionStatus.FIN_:
             skt.status = RDTConnectionStatus.FIN
-            timer = self.push_timer(skt.BASE_RTT + EXTRA_ACK_WAIT, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
-            skt.wait_ack.append(timer)
-            skt.destroy_timer = self.push_timer(skt.BASE_RTT * 16 + EXTRA_ACK_WAIT * 8,
+            timer = self.push_timer(skt.RTO, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
+            timer.backoff = skt.timeout_cnt
+            skt.wait_ack[pkt.SEQ] = timer
+            skt.destroy_timer = self.push_timer(skt.SRTT * 16 + EXTRA_ACK_WAIT * 8,
                                                 RDTEvent(RDTEventType.DESTROY_SIMPLE, skt))
         else:
-            self.push_timer(skt.BASE_RTT * 2 + EXTRA_ACK_WAIT, RDTEvent(RDTEventType.DESTROY_SIMPLE, skt))
+            self.push_timer(skt.SRTT * 2 + EXTRA_ACK_WAIT, RDTEvent(RDTEventType.DESTROY_SIMPLE, skt))
 
 
 class ServerEventLoop(EventLoop):
@@ -743,6 +1572,11 @@ class ServerEventLoop(EventLoop):
         super().__init__(listen_socket)
         self.connections: dict = {}
         self.accept_queue = SimpleQueue()
+        self.cookie_key = os.urandom(16)  # 签发快速打开 cookie 的密钥
+        self.fast_open_seen: dict = {}  # (对方IP, SYN 的 SEQ) -> 过期时间，按插入顺序即过期顺序
+        self.retired = dict.fromkeys(CUMULATIVE_STATS, 0)  # 已销毁连接的计数
+        self.retired['connections'] = 0
+        self.stats_lock = threading.Lock()  # 销毁连接时计数从 connections 挪到 retired，汇总不能正好读到一半
         self.__is_close = False
         self.setName('ServerEventLoop')
 
@@ -751,48 +1585,101 @@ class ServerEventLoop(EventLoop):
         self.recv_loop.start()
         super(ServerEventLoop, self).run()
 
-    def accept(self) -> (RDTSocket, (str, int)):
+    def accept(self, timeout=None) -> SimpleRDT:
+        """
+        从 accept 队列取一个已建立的连接，timeout 为 0.0 时不阻塞，取不到抛 Empty
+        """
         assert not self.__is_close, 'Can not accept after close'
-        if not self.accept_queue.empty():
-            try:
-                return self.accept_queue.get_nowait()
-            except Empty as ev:
-                print('\033[0;31m642: Empty-> ', ev, '\033[0m')
+        s = self.accept_queue.get(block=timeout != 0.0, timeout=timeout or None)
+        if s is None:  # 等着的时候监听关了，放回去叫醒下一个等着的 accept
+            self.accept_queue.put(None)
+        assert s is not None, 'Can not accept after close'
+        return s
 
     def on_syn(self, pkt: RDTPacket):
         remote = pkt.remote
         if remote in self.connections:
             simple_sct = self.connections[remote]
-            simple_sct.SEQ_ACK = max(simple_sct.SEQ_ACK, pkt.SEQ + pkt.LEN)
-            syn_ack_pkt = RDTPacket(SYN=1, ACK=1, remote=remote, SEQ=simple_sct.SEQ, SEQ_ACK=simple_sct.SEQ_ACK)
+            if simple_sct.status != RDTConnectionStatus.SYN_:
+                return  # 握手已经完成，迟到的SYN
+            first = next(iter(simple_sct.wait_ack.values())).event.body  # 第一次的 SYN_ACK，对方ACK之前一直在
+            syn_ack_pkt = RDTPacket(SYN=1, ACK=1, remote=remote, SEQ=first.SEQ, SEQ_ACK=simple_sct.SEQ_ACK,
+                                    PAYLOAD=first.PAYLOAD)
             self.send_loop.put(syn_ack_pkt)
             return
         elif self.__is_close:
             self.send_loop.put(RDTPacket(remote=pkt.remote, SEQ=0, SEQ_ACK=0, RST=1))
             return
         assert remote not in self.connections, 'Has SYN'
-        simple_sct = self.socket.create_simple_socket(remote, pkt.SEQ, pkt.SEQ_ACK)
-        simple_sct.SEQ_ACK += pkt.LEN
+        simple_sct = self.socket.create_simple_socket(remote, pkt.SEQ, pkt.SEQ_ACK, self.event_queue)
         simple_sct.status = RDTConnectionStatus.SYN_
+        options, end = parse_options(pkt.PAYLOAD)
+        cookie = options.get(OPT_COOKIE)
+        if cookie is None:
+            simple_sct.SEQ_ACK += pkt.LEN  # 旧版本的 SYN 补到 1024 字节，一起确认
+        elif self.socket.fast_open and end < pkt.LEN and hmac.compare_digest(cookie, self.cookie_of(remote)) \
+                and self.first_fast_open(remote, pkt.SEQ):
+            simple_sct.SEQ_ACK += pkt.LEN
+            simple_sct.data.extend(pkt.PAYLOAD[end:])  # 快速打开，不等握手完成就交给上层
+            simple_sct.recv_bytes += pkt.LEN - end
+            simple_sct.early_accept = True
+        else:
+            simple_sct.SEQ_ACK += end  # 没有数据或者 cookie 不对，只确认到选项，数据让对方握手后重发
+        simple_sct.negotiate_checksum(options)
+        simple_sct.wnd_ok = OPT_WINDOW in options
+        simple_sct.negotiate_mss(options)
         self.connections[remote] = simple_sct
         syn_ack_pkt = RDTPacket(SYN=1, ACK=1, remote=remote, SEQ=simple_sct.SEQ, SEQ_ACK=simple_sct.SEQ_ACK,
-                                PAYLOAD=bytes(1024))
-        simple_sct.SEQ += 1024
+                                PAYLOAD=self.syn_ack_options(simple_sct, cookie))
+        simple_sct.SEQ += syn_ack_pkt.LEN
+        if simple_sct.wnd_ok:
+            simple_sct.send_edge = simple_sct.SEQ + struct.unpack('!I', options[OPT_WINDOW])[0]
         self.send_loop.put(syn_ack_pkt)
         timer = self.push_timer(SYN_ACK_WAIT,
                                 RDTEvent(RDTEventType.ACK_TIMEOUT, syn_ack_pkt))
-        simple_sct.wait_ack.append(timer)
+        simple_sct.wait_ack[syn_ack_pkt.SEQ] = timer
+        if simple_sct.early_accept:
+            self.accept_queue.put(simple_sct)
         if self.socket.debug:
             print('\033[0;32m668: SYN<- ', remote, '\033[0m')
 
     def on_syn_ack(self, pkt: RDTPacket):
         assert False, 'SYN_ACK ???'
 
+    def syn_ack_options(self, simple_sct: SimpleRDT, cookie) -> bytes:
+        options = {OPT_CHECKSUM: bytes([simple_sct.checksum]), OPT_MSS: struct.pack('!H', simple_sct.mss_limit)}
+        if simple_sct.wnd_ok:
+            options[OPT_WINDOW] = struct.pack('!I', simple_sct.rcvbuf)
+        if cookie is not None and self.socket.fast_open and not simple_sct.early_accept:
+            options[OPT_COOKIE] = self.cookie_of(simple_sct.remote)  # 对方要 cookie 或者带的不对
+        return pack_options(options)
+
+    def first_fast_open(self, remote: (str, int), isn: int) -> bool:
+        """
+        cookie 只认IP，重放的 SYN 也能通过，所以同一个 SYN 的数据只收一次，重复的退回普通握手让对方重发
+        """
+        now = time.time()
+        while self.fast_open_seen and next(iter(self.fast_open_seen.values())) < now:
+            del self.fast_open_seen[next(iter(self.fast_open_seen))]
+        key = (remote[0], isn)  # 不带端口，换个源端口重放也拦得住
+        if key in self.fast_open_seen:
+            return False
+        self.fast_open_seen[key] = now + FAST_OPEN_REPLAY_WAIT
+        return True
+
+    def cookie_of(self, remote: (str, int)) -> bytes:
+        """
+        快速打开的 cookie：只和对方IP有关，监听 socket 关掉以后旧 cookie 全部失效
+        """
+        return hmac.new(self.cookie_key, remote[0].encode(), hashlib.sha256).digest()[:8]
+
     def on_ack(self, pkt: RDTPacket):
         simple_sct = self.get_simple_sct(pkt)
         if simple_sct.status == RDTConnectionStatus.SYN_:
-            self.accept_queue.put(simple_sct)
+            if not simple_sct.early_accept:
+                self.accept_queue.put(simple_sct)
             simple_sct.status = RDTConnectionStatus.ACK_
+            self.send_mss_probe(simple_sct)
 
         self.deal_ack(simple_sct=simple_sct, pkt=pkt)
 
@@ -826,7 +1713,7 @@ class ServerEventLoop(EventLoop):
     def on_send(self, r: ((str, int), bytes)):
         remote, bs = r
         simple_sct: SimpleRDT = self.connections[remote]
-        assert simple_sct.status == RDTConnectionStatus.ACK_, 'Send with a wrong state'
+        assert simple_sct.status == RDTConnectionStatus.ACK_ or simple_sct.early_accept, 'Send with a wrong state'
         self.deal_send(simple_sct, bs)
 
     def on_send_ack(self, simple_sct: SimpleRDT):
@@ -853,6 +1740,27 @@ class ServerEventLoop(EventLoop):
     def on_sak(self, pkt: RDTPacket):
         self.deal_sak(self.get_simple_sct(pkt), pkt)
 
+    def on_mss_probe(self, pkt: RDTPacket):
+        self.deal_mss_probe(self.get_simple_sct(pkt), pkt)
+
+    def checksum_of(self, remote: (str, int)) -> int:
+        simple_sct = self.connections.get(remote)
+        return simple_sct.checksum if simple_sct is not None else 0
+
+    def connection_of(self, remote: (str, int)):
+        return self.connections.get(remote)
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            stats = aggregate_stats(list(self.connections.values()))
+            for key in CUMULATIVE_STATS:
+                stats[key] += self.retired[key]
+            stats['closed_connections'] = self.retired['connections']
+        stats['corruptions'] = self.corrupt_cnt
+        stats['accept_queue'] = self.accept_queue.qsize()
+        stats['timers'] = self.timer_cnt
+        return stats
+
     def get_simple_sct(self, pkt: RDTPacket):
         try:
             assert pkt.remote in self.connections, 'No such connection'
@@ -872,17 +1780,25 @@ class ServerEventLoop(EventLoop):
         assert not self.__is_close, 'Has closed'
         self.__is_close = True
         while not self.accept_queue.empty():
-            _, remote = self.accept_queue.get()
-            del self.connections[remote]
+            skt: SimpleRDT = self.accept_queue.get()
+            del self.connections[skt.remote]
+        self.accept_queue.put(None)  # 叫醒阻塞在 accept 的线程，拿到 None 就知道监听关了
         self.put(RDTEventType.DESTROY_ALL, None)
 
     def on_destroy_simple(self, skt: SimpleRDT):
         assert skt.remote in self.connections, 'No such connection'
-        with skt.lock:
-            skt.remote_close = True
-        for t in self.connections[skt.remote].wait_ack:
+        skt.set_remote_close()
+        for t in self.connections[skt.remote].wait_ack.values():
             self.cancel_timer(t)
-        del self.connections[skt.remote]
+        for t in (skt.pace_timer, skt.probe_timer):
+            if t is not None and t.entry is not None:
+                self.cancel_timer(t)
+        stats = skt.get_stats()
+        with self.stats_lock:
+            for key in CUMULATIVE_STATS:
+                self.retired[key] += stats[key]
+            self.retired['connections'] += 1
+            del self.connections[skt.remote]
 
     def on_destroy_all(self):
         if len(self.connections) == 0:
@@ -898,6 +1814,8 @@ class ClientEventLoop(EventLoop):
         super().__init__(socket_)
         self.simple_sct: SimpleRDT = socket_.create_simple_socket(remote, random.randint(0, 1000000),
                                                                   random.randint(0, 1000000), self.event_queue)
+        self.connected = threading.Event()  # 收到 SYN_ACK 后置位，唤醒 connect
+        self.syn_pending = False  # 快速打开，SYN 还在等第一次 send 的数据
         self.setName('ClientEventLoop')
 
     def run(self) -> None:
@@ -908,13 +1826,35 @@ class ClientEventLoop(EventLoop):
 
     def on_syn_ack(self, pkt: RDTPacket):
         assert pkt.remote == self.simple_sct.remote
-        self.simple_sct.SEQ_ACK = max(self.simple_sct.SEQ_ACK, pkt.SEQ + pkt.LEN)
+        with self.simple_sct.lock:
+            self.simple_sct.SEQ_ACK = max(self.simple_sct.SEQ_ACK, pkt.SEQ + pkt.LEN)
+            self.simple_sct.deliver_buffered()  # 快速打开时对方的回复可能比 SYN_ACK 先到
+        options, _ = parse_options(pkt.PAYLOAD)
+        if OPT_COOKIE in options:
+            fast_open_cookies[pkt.remote] = options[OPT_COOKIE]
+        self.simple_sct.checksum = options[OPT_CHECKSUM][0] if OPT_CHECKSUM in options else 0  # 服务端定的，旧版只会sum
+        if OPT_WINDOW in options and not self.simple_sct.wnd_ok:
+            self.simple_sct.wnd_ok = True
+            self.simple_sct.send_edge = pkt.SEQ_ACK + struct.unpack('!I', options[OPT_WINDOW])[0]
+        if len(self.simple_sct.wait_ack) > 0:
+            seq, timer = next(iter(self.simple_sct.wait_ack.items()))
+            syn = timer.event.body
+            if syn.SYN == 1:
+                del self.simple_sct.wait_ack[seq]
+                self.simple_sct.wait_resend.pop(seq, None)
+                self.cancel_timer(timer)
+                if pkt.SEQ_ACK < syn.SEQ + syn.LEN:  # SYN 带的数据没被收下，放回 wait_send 握手后重发
+                    del self.simple_sct.wait_send[:self.simple_sct.wait_send_offset]
+                    self.simple_sct.wait_send[0:0] = syn.PAYLOAD[pkt.SEQ_ACK - syn.SEQ:]
+                    self.simple_sct.wait_send_offset = 0
+                    self.simple_sct.SEQ = pkt.SEQ_ACK
         self.send_ack_pkt(self.simple_sct)
         if self.simple_sct.status is None:
+            self.simple_sct.negotiate_mss(options)
             self.simple_sct.status = RDTConnectionStatus.SYN_ACK_
-            return
-        if self.simple_sct.wait_ack[0].event.body.SYN == 1:
-            self.cancel_timer(self.simple_sct.wait_ack.pop(0))
+            self.connected.set()
+            self.send_mss_probe(self.simple_sct)
+            self.call_send(self.simple_sct)  # 快速打开时握手期间 send 的数据
 
     def on_ack(self, pkt: RDTPacket):
         assert pkt.remote == self.simple_sct.remote
@@ -943,6 +1883,11 @@ class ClientEventLoop(EventLoop):
         self.put(RDTEventType.DESTROY_ALL, None)
 
     def on_send(self, body: ((str, int), bytes)):
+        if self.simple_sct.status is None:  # 快速打开，握手还没完成
+            self.simple_sct.wait_send.extend(body[1])
+            if self.syn_pending:
+                self.send_syn(self.simple_sct.remote)
+            return
         self.deal_send(self.simple_sct, body[1])
 
     def on_send_ack(self, simple_skt: SimpleRDT):
@@ -971,14 +1916,46 @@ class ClientEventLoop(EventLoop):
                         print('\033[0;31m855: Try ', addr, ' Fail-> ', ev, '\033[0m')
         self.send_loop.start()
         self.recv_loop.start()
-        pkt: RDTPacket = RDTPacket(remote=remote, SYN=1, SEQ=self.simple_sct.SEQ, SEQ_ACK=self.simple_sct.SEQ_ACK,
-                                   PAYLOAD=bytes(1024))
-        self.simple_sct.SEQ += 1024
+        self.start_handshake(remote)
+
+    def fast_open_ready(self, remote: (str, int)) -> bool:
+        return self.socket.fast_open and remote in fast_open_cookies
+
+    def start_handshake(self, remote: (str, int)):
+        if self.fast_open_ready(remote):
+            self.syn_pending = True
+            self.push_timer(FAST_OPEN_WAIT, RDTEvent(RDTEventType.SEND, (remote, bytes())))
+        else:
+            self.send_syn(remote)
+
+    def send_syn(self, remote: (str, int)):
+        """
+        发 SYN，带着 cookie 的话把 wait_send 里的数据放在选项后面，SYN 整个不超过 MAX_PKT_LEN
+        """
+        s = self.simple_sct
+        options = {OPT_CHECKSUM: bytes([self.socket.checksum]), OPT_WINDOW: struct.pack('!I', s.rcvbuf),
+                   OPT_MSS: struct.pack('!H', s.mss)}
+        cookie = fast_open_cookies.get(remote, bytes()) if self.socket.fast_open else None
+        if cookie is not None:
+            options[OPT_COOKIE] = cookie
+        payload = pack_options(options)
+        if cookie:
+            n = min(MAX_PKT_LEN - len(payload), len(s.wait_send) - s.wait_send_offset)
+            payload += s.wait_send[s.wait_send_offset:s.wait_send_offset + n]
+            s.wait_send_offset += n
+            s.sent_bytes += n
+            s.sent_pkt_cnt += n > 0
+            if s.wait_send_offset >= len(s.wait_send):
+                s.wait_send.clear()
+                s.wait_send_offset = 0
+        self.syn_pending = False
+        pkt: RDTPacket = RDTPacket(remote=remote, SYN=1, SEQ=s.SEQ, SEQ_ACK=s.SEQ_ACK, PAYLOAD=payload)
+        s.SEQ += pkt.LEN
         self.send_loop.put(pkt)
         if self.simple_sct.debug:
             print('\033[0;32m863: Try connect-> ', remote, '\033[0m')
         timer = self.push_timer(SYN_ACK_WAIT, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
-        self.simple_sct.wait_ack.append(timer)
+        self.simple_sct.wait_ack[pkt.SEQ] = timer
 
     def on_rst(self, pkt: RDTPacket):
         self.on_destroy_all()  # 强制销毁
@@ -987,6 +1964,10 @@ class ClientEventLoop(EventLoop):
     def on_ack_timeout(self, pkt: RDTPacket):
         self.deal_ack_timeout(self.simple_sct, pkt)
 
+    def on_mss_probe(self, pkt: RDTPacket):
+        assert pkt.remote == self.simple_sct.remote
+        self.deal_mss_probe(self.simple_sct, pkt)
+
     def on_sak(self, pkt: RDTPacket):
         assert pkt.remote == self.simple_sct.remote
         self.deal_sak(self.simple_sct, pkt)
@@ -1001,12 +1982,21 @@ class ClientEventLoop(EventLoop):
         self.on_destroy_all()
 
     def on_destroy_all(self):
-        for timer in self.simple_sct.wait_ack:
+        for timer in self.simple_sct.wait_ack.values():
             self.cancel_timer(timer)
-        with self.simple_sct.lock:
-            self.simple_sct.remote_close = True
+        for t in (self.simple_sct.pace_timer, self.simple_sct.probe_timer):
+            if t is not None and t.entry is not None:
+                self.cancel_timer(t)
+        self.simple_sct.set_remote_close()
+        self.connected.set()  # 握手没完成就被销毁时唤醒 connect
         self.put(RDTEventType.VANISH, None)
 
+    def checksum_of(self, remote: (str, int)) -> int:
+        return self.simple_sct.checksum
+
+    def connection_of(self, remote: (str, int)):
+        return self.simple_sct if remote == self.simple_sct.remote else None
+
     def connect_(self):
         if self.simple_sct.status is None:
             return None
@@ -1024,25 +2014,83 @@ class SendLoop(threading.Thread):
         self.socket: RDTSocket = rdt_socket
         self.send_queue: SimpleQueue = SimpleQueue()
         self.event_loop = event_loop
+        self.start_time = 0  # 第一次醒来的时间
+        self.pkt_cnt = 0  # 从队列取出的包数
+        self.sendto_cnt = 0  # 真正调用 sendto 的次数
+        self.coalesced_cnt = 0  # 被后面的ACK/SAK覆盖而没发的纯ACK和SAK数
+        self.wakeup_cnt = 0  # 被唤醒处理一批包的次数
+        self.buffer = memoryview(bytearray(datagram_size(0xFFFF)))  # 编码用的缓冲区，每个包都写在这里，不再各自分配
+        self.tracer = rdt_socket.tracer
 
     def run(self) -> None:
         if self.socket.debug:
             print('\033[0;32mSend loop start\033[0m')
         while True:
+            batch = [self.send_queue.get()]  # 阻塞等第一个包，然后把队列里已有的一次取完
+            try:
+                while True:
+                    batch.append(self.send_queue.get_nowait())
+            except Empty:
+                pass
+            if not self.send_batch(batch):
+                break
+
+    def send_batch(self, batch: list) -> bool:
+        """
+        发一批包，后面有同一远端的ACK时前面的纯ACK是多余的，后面有同一远端的SAK时前面的SAK也是，直接丢掉
+        :return: False 表示收到了结束标记 0
+        """
+        if self.wakeup_cnt == 0:
+            self.start_time = time.time()
+        self.wakeup_cnt += 1
+        acked = {}  # remote -> 这批里之后发往它的最大 SEQ_ACK
+        saked = {}  # remote -> 这批里之后发往它的SAK的最大 SEQ_ACK，后面的SAK区间更全
+        keep = []
+        running = True
+        for pkt in reversed(batch):
+            if pkt == 0:
+                running = False
+                keep.clear()  # 结束标记之后的包不再发
+                acked.clear()
+                saked.clear()
+                continue
+            if pkt.SAK == 1 and pkt.ACK == 0:
+                if saked.get(pkt.remote, -1) >= pkt.SEQ_ACK:
+                    self.coalesced_cnt += 1
+                    continue
+                saked[pkt.remote] = pkt.SEQ_ACK
+            if pkt.ACK == 1 and pkt.SYN == 0 and pkt.FIN == 0 and pkt.RST == 0 and pkt.SAK == 0:
+                if pkt.LEN == 0 and acked.get(pkt.remote, -1) >= pkt.SEQ_ACK:
+                    self.coalesced_cnt += 1
+                    continue
+                acked[pkt.remote] = max(acked.get(pkt.remote, -1), pkt.SEQ_ACK)
+            keep.append(pkt)
+        self.pkt_cnt += len(batch) - (0 if running else 1)
+        for pkt in reversed(keep):
             try:
-                if not self.send_queue.empty():
-                    try:
-                        pkt: RDTPacket = self.send_queue.get_nowait()
-                        if pkt == 0:
-                            break
-                        _bytes = pkt.make_packet()
-                        self.socket.sendto(_bytes, pkt.remote)
-                    except Empty:
-                        pass
-                else:
-                    time.sleep(0.00001)
+                n = pkt.pack_into(self.buffer)
+                self.socket.sendto(self.buffer[:n], pkt.remote)
+                self.sendto_cnt += 1
+                if self.tracer is not None:
+                    self.tracer.sent(pkt, n)
             except AssertionError as a:
                 print('\033[0;31m', a, '\033[0m')
+        return running
+
+    def report(self) -> dict:
+        """
+        发送统计：包速率、每个包的 sendto 次数、每次唤醒处理的包数
+        """
+        elapsed = time.time() - self.start_time if self.wakeup_cnt > 0 else 0
+        return {
+            'packets': self.pkt_cnt,
+            'sendto': self.sendto_cnt,
+            'coalesced_acks': self.coalesced_cnt,
+            'wakeups': self.wakeup_cnt,
+            'packets_per_second': self.pkt_cnt / elapsed if elapsed > 0 else 0,
+            'syscalls_per_packet': self.sendto_cnt / self.pkt_cnt if self.pkt_cnt > 0 else 0,
+            'packets_per_wakeup': self.pkt_cnt / self.wakeup_cnt if self.wakeup_cnt > 0 else 0,
+        }
 
     def put(self, ev):
         self.send_queue.put(ev)
@@ -1054,40 +2102,49 @@ class RecvLoop(threading.Thread):
         self.socket: RDTSocket = rdt_socket
         self.event_queue = SimpleQueue()
         self.event_loop = event_loop
+        self.bufsize = datagram_size(max(rdt_socket.mss, 1024))  # 协商出的 MSS 不超过自己通告的，SYN 补齐到 1024 字节
+        self.tracer = rdt_socket.tracer
 
     def run(self) -> None:
         if self.socket.debug:
             print('\033[0;32mRecv loop start\033[0m')
         while self.event_queue.empty():
             try:
-                rec, addr = self.socket.recvfrom(MAX_PKT_LEN + 13 + 8)
-                pkt = RDTPacket.resolve(rec, addr)
-                if pkt.check():
-                    if pkt.SYN == 1:
-                        if pkt.ACK == 0:
-                            self.event_loop.put(RDTEventType.SYN, pkt)
-                        else:
-                            self.event_loop.put(RDTEventType.SYN_ACK, pkt)
-                    elif pkt.FIN == 1:
-                        if pkt.ACK == 0:
-                            self.event_loop.put(RDTEventType.FIN, pkt)
-                        else:
-                            self.event_loop.put(RDTEventType.FIN_ACK, pkt)
-                    elif pkt.RST == 1:
-                        self.event_loop.put(RDTEventType.RST, pkt)
-                    elif pkt.ACK == 1:
-                        self.event_loop.put(RDTEventType.ACK, pkt)
-                    elif pkt.SAK == 1:
-                        self.event_loop.put(RDTEventType.SAK, pkt)
-                    else:
-                        self.event_loop.put(RDTEventType.CORRUPTION, pkt)
-                else:
-                    self.event_loop.put(RDTEventType.CORRUPTION, pkt)
+                rec, addr = self.socket.recvfrom(self.bufsize)
+                self.deal_datagram(rec, addr)
             except AssertionError as a:
                 print('\033[0;31m', a, '\033[0m')
             except Exception as ev:
                 self.event_loop.put(RDTEventType.UNKNOWN_ERROR, ev)
 
+    def deal_datagram(self, rec: bytes, addr: (str, int)):
+        """
+        解析、校验一个收到的包，按标志位变成事件交给事件循环
+        """
+        pkt = RDTPacket.resolve(rec, addr)
+        if not pkt.SYN:
+            pkt.algo = self.event_loop.checksum_of(addr)
+        if pkt.check():
+            if pkt._ & FLAG_PROBE:
+                e_type = RDTEventType.MSS_PROBE
+            elif pkt.SYN == 1:
+                e_type = RDTEventType.SYN if pkt.ACK == 0 else RDTEventType.SYN_ACK
+            elif pkt.FIN == 1:
+                e_type = RDTEventType.FIN if pkt.ACK == 0 else RDTEventType.FIN_ACK
+            elif pkt.RST == 1:
+                e_type = RDTEventType.RST
+            elif pkt.ACK == 1:
+                e_type = RDTEventType.ACK
+            elif pkt.SAK == 1:
+                e_type = RDTEventType.SAK
+            else:
+                e_type = RDTEventType.CORRUPTION
+        else:
+            e_type = RDTEventType.CORRUPTION
+        if self.tracer is not None:
+            self.tracer.received(pkt, e_type, len(rec))
+        self.event_loop.put(e_type, pkt)
+
 
 """
 You can define additional functions and classes to do thing such as packing/unpacking packets, or threading.
@@ -0,0 +1,327 @@
+"""
+多进程分片的监听 socket
+
+一个 ServerEventLoop 线程处理所有连接的事件、定时器和拥塞控制，服务端吞吐被一个核（一个 GIL）卡住。
+ShardedListener 开 n 个分片进程，每个进程里是一个普通的监听 RDTSocket，有自己的事件循环、定时器和连接表：
+-   父进程拥有公共 UDP socket，分发线程按数据报头里的远端地址哈希，经 AF_UNIX 数据报 socketpair 转给固定的分片
+-   分片 fork 时继承公共 UDP socket，发包不经过父进程，直接发给模拟器
+-   分片接受的连接经 Pipe 报给父进程，父进程的 accept() 是所有分片共用的一个队列；
+    拿到的 ShardConnection 把 send/recv/recv_exactly/close 转成对分片的请求，recv 是去分片拉，数据不会堆进父进程
+
+用法:
+    listener = ShardedListener(4, debug=False)
+    listener.bind(('127.0.0.1', 9999))
+    conn, addr = listener.accept()
+    conn.send(conn.recv(2048))
+    conn.close()
+    listener.close()
+    listener.block_until_close()
+
+分片靠 fork 继承 socket，只能在 Linux/macOS 上用；分片之间不共享快速打开的 cookie 密钥和防重放表，不支持 fast_open
+"""
+import multiprocessing
+import threading
+from itertools import count
+from queue import SimpleQueue, Empty
+from socket import socket, socketpair, timeout as socket_timeout, AF_INET, AF_UNIX, SOCK_DGRAM, SHUT_RDWR
+
+from USocket import addr_to_bytes, bytes_to_addr, network
+from rdt import RDTSocket, ServerEventLoop
+
+DATAGRAM_LIMIT = 1 << 16  # 分发线程一次收的数据报上限，UDP 数据报不超过 64K
+
+
+class ShardSocket(RDTSocket):
+    """
+    分片进程里的监听 socket：从 socketpair 收分发过来的数据报，从继承来的公共 UDP socket 直接发
+    """
+    own_socket = False
+
+    def __init__(self, pair: socket, public: socket, **kwargs):
+        super().__init__(**kwargs)
+        self.pair = pair
+        self.public = public
+
+    def listen(self):
+        """
+        进程一启动就把事件循环跑起来，不等第一次 accept，close 时也就一定有事件循环
+        """
+        self._event_loop = ServerEventLoop(self)
+        self._event_loop.start()
+        self.bind_(self.addr)
+
+    def bind_(self, address: (str, int)):
+        if self.tracer is not None:
+            self.tracer.local = address  # 公共 socket 父进程已经绑好了
+
+    def recvfrom(self, bufsize) -> (bytes, (str, int)):
+        data = self.pair.recv(bufsize)
+        return data[8:], bytes_to_addr(data[:8])
+
+    def sendto(self, data: bytes, addr):
+        self.public.sendto(addr_to_bytes(addr) + data, network)
+
+    def force_close(self):
+        try:
+            self.pair.shutdown(SHUT_RDWR)  # 唤醒阻塞在 recvfrom 的接收循环；公共 socket 别的分片还在用，不能关
+        except OSError:
+            pass
+
+
+def serve_shard(pair: socket, public: socket, pipe, address: (str, int), kwargs: dict):
+    """
+    分片进程：跑一个监听 ShardSocket，接受的连接报给父进程，父进程的请求按连接排队，一个连接一个线程执行
+    发给父进程的消息: ('accept', 连接编号, 远端地址), ('reply', 请求编号, 是否成功, 结果或异常), ('closed',)
+    """
+    listener = ShardSocket(pair, public, **kwargs)
+    listener.bind(address)
+    listener.listen()
+    lock = threading.Lock()  # 多个线程往 pipe 里写
+    requests = {}  # 连接编号 -> 这个连接的请求队列
+
+    def reply(*msg):
+        with lock:
+            pipe.send(msg)
+
+    def serve(conn, queue: SimpleQueue):
+        while True:
+            req, op, arg = queue.get()
+            try:
+                result = getattr(conn, op)() if arg is None else getattr(conn, op)(arg)
+            except Exception as ev:
+                reply('reply', req, False, ev)
+            else:
+                reply('reply', req, True, result)
+            if op == 'close':
+                return
+
+    def accept_all():
+        for cid in count():
+            try:
+                conn, remote = listener.accept()
+            except AssertionError:
+                return  # 监听关了
+            requests[cid] = SimpleQueue()
+            threading.Thread(target=serve, args=(conn, requests[cid]), daemon=True).start()
+            reply('accept', cid, remote)
+
+    def vanish():
+        listener.block_until_close()
+        reply('closed')
+
+    accepter = threading.Thread(target=accept_all)
+    accepter.start()
+    while True:
+        req, cid, op, arg = pipe.recv()
+        if cid is not None:
+            requests[cid].put((req, op, arg))
+            if op == 'close':
+                del requests[cid]
+        elif op == 'stats':
+            reply('reply', req, True, listener.get_stats())
+        elif op == 'close':
+            listener.close()
+            accepter.join()  # 已经接受的连接都报过了，父进程收到回复时 accept 队列是全的
+            threading.Thread(target=vanish).start()
+            reply('reply', req, True, None)
+        else:  # 'exit'，父进程收到 'closed' 以后发
+            break
+
+
+class Shard:
+    """
+    父进程这边的一个分片：转发数据报的 socketpair，发请求、收回复的 Pipe，还有等回复的表
+    """
+
+    def __init__(self, listener: 'ShardedListener', ctx, address: (str, int)):
+        self.pair, child_pair = socketpair(AF_UNIX, SOCK_DGRAM)
+        self.pair.setblocking(False)  # 分片收不过来就丢，和 UDP 缓冲区满了一样，不拖住别的分片
+        self.pipe, child_pipe = ctx.Pipe()
+        self.process = ctx.Process(target=serve_shard, daemon=True,
+                                   args=(child_pair, listener.public, child_pipe, address, listener.kwargs))
+        self.process.start()
+        child_pair.close()
+        child_pipe.close()
+        self.lock = threading.Lock()  # 多个线程往 pipe 里写
+        self.seq = count()
+        self.waiting = {}  # 请求编号 -> [Event, 是否成功, 结果或异常]
+        self.closed = threading.Event()  # 分片的监听 socket 完全关了
+        self.reader = threading.Thread(target=self.read, args=(listener.accept_queue,), daemon=True)
+        self.reader.start()
+
+    def call(self, cid, op: str, arg=None):
+        """
+        发一个请求，等分片执行完返回结果；分片上抛的异常在这里重新抛出
+        """
+        entry = [threading.Event(), False, None]
+        with self.lock:
+            req = next(self.seq)
+            self.waiting[req] = entry
+            self.pipe.send((req, cid, op, arg))
+        entry[0].wait()
+        with self.lock:
+            del self.waiting[req]
+        if not entry[1]:
+            raise entry[2]
+        return entry[2]
+
+    def read(self, accept_queue: SimpleQueue):
+        while True:
+            try:
+                msg = self.pipe.recv()
+            except (EOFError, OSError):
+                break
+            if msg[0] == 'accept':
+                accept_queue.put(ShardConnection(self, msg[1], msg[2]))
+            elif msg[0] == 'reply':
+                entry = self.waiting[msg[1]]
+                entry[1:] = msg[2:]
+                entry[0].set()
+            else:
+                self.closed.set()
+        self.closed.set()
+        with self.lock:
+            for entry in self.waiting.values():
+                if not entry[0].is_set():
+                    entry[1:] = False, ConnectionAbortedError('Shard exited')
+                    entry[0].set()
+
+
+class ShardConnection:
+    """
+    父进程里分片上一个连接的句柄，每个调用都转成对分片的请求，分片上执行完才返回
+    """
+
+    def __init__(self, shard: Shard, cid: int, remote: (str, int)):
+        self.shard = shard
+        self.cid = cid  # 分片里的连接编号
+        self.remote = remote
+
+    def send(self, _bytes: bytes):
+        self.shard.call(self.cid, 'send', bytes(_bytes))
+
+    def recv(self, bufsize: int) -> bytes:
+        return self.shard.call(self.cid, 'recv', bufsize)
+
+    def recv_exactly(self, n: int) -> bytes:
+        return self.shard.call(self.cid, 'recv_exactly', n)
+
+    def close(self):
+        self.shard.call(self.cid, 'close')
+
+    def get_stats(self) -> dict:
+        return self.shard.call(self.cid, 'get_stats')
+
+
+class ShardedListener:
+    """
+    n 个分片进程共用一个地址的监听 socket，参数除了 shards 都原样交给每个分片的 RDTSocket
+    """
+
+    def __init__(self, shards=2, **kwargs):
+        assert shards >= 1, 'Need at least one shard'
+        assert not kwargs.get('fast_open'), 'Fast open is not supported across shards'
+        self.n = shards
+        self.kwargs = kwargs
+        self.public = None  # 公共 UDP socket，bind 时打开
+        self.shards = []
+        self.accept_queue = SimpleQueue()
+        self.dispatcher = None
+        self._timeout = None
+        self.is_close = False
+        self.vanished = False  # 分片都退出了，分发线程该结束了
+
+    def settimeout(self, value):
+        assert value is None or value >= 0, 'Timeout value out of range'
+        self._timeout = value
+
+    def bind(self, address: (str, int)):
+        assert self.public is None, 'Has bound'
+        self.public = socket(AF_INET, SOCK_DGRAM)
+        self.public.bind(address)
+        ctx = multiprocessing.get_context('fork')  # 分片要继承公共 UDP socket 和 socketpair
+        self.shards = [Shard(self, ctx, address) for _ in range(self.n)]
+        self.dispatcher = threading.Thread(target=self.dispatch, name='ShardDispatcher', daemon=True)
+        self.dispatcher.start()
+
+    def dispatch(self):
+        """
+        分发线程：公共 UDP socket 上收到的数据报按远端地址交给固定的分片，同一连接的包总在同一个分片
+        """
+        while True:
+            try:
+                data, frm = self.public.recvfrom(DATAGRAM_LIMIT)
+            except OSError:
+                return
+            if self.vanished:
+                return
+            if frm != network or len(data) < 8:
+                continue
+            try:
+                self.shards[hash(data[:8]) % self.n].pair.send(data)
+            except OSError:
+                pass  # 分片的缓冲区满了或者已经退出，当作丢包
+
+    def accept(self) -> (ShardConnection, (str, int)):
+        assert self.public is not None, 'Not bound'
+        assert not self.is_close, 'Can not accept after close'
+        try:
+            conn = self.accept_queue.get(block=self._timeout != 0.0, timeout=self._timeout or None)
+        except Empty:
+            if self._timeout == 0.0:
+                raise BlockingIOError('Resource temporarily unavailable')
+            raise socket_timeout('timed out')
+        if conn is None:  # 等着的时候监听关了，放回去叫醒下一个等着的 accept
+            self.accept_queue.put(None)
+        assert conn is not None, 'Can not accept after close'
+        return conn, conn.remote
+
+    def close(self):
+        """
+        关闭所有分片的监听，已经接受但还没被 accept 取走的连接直接关掉
+        """
+        assert self.public is not None and not self.is_close, 'Duplicated closing'
+        self.is_close = True
+        for shard in self.shards:
+            shard.call(None, 'close')
+        while not self.accept_queue.empty():
+            conn = self.accept_queue.get()
+            if conn is not None:
+                conn.close()
+        self.accept_queue.put(None)
+
+    def block_until_close(self):
+        """
+        等所有分片上的连接都结束、分片进程退出，再关公共 socket
+        """
+        for shard in self.shards:
+            shard.closed.wait()
+            with shard.lock:
+                shard.pipe.send((None, None, 'exit', None))
+            shard.process.join()
+            shard.reader.join()
+            shard.pipe.close()
+            shard.pair.close()
+        self.vanished = True
+        try:
+            self.public.shutdown(SHUT_RDWR)  # 唤醒阻塞在 recvfrom 的分发线程
+        except OSError:
+            pass
+        self.dispatcher.join()
+        self.public.close()
+
+    def get_stats(self) -> dict:
+        """
+        各分片监听 socket 的汇总：计数相加，avg_ 开头的按连接数加权平均
+        """
+        per_shard = [shard.call(None, 'stats') for shard in self.shards]
+        total = {}
+        for key in per_shard[0]:
+            if key.startswith('avg_'):
+                n = sum(st['connections'] for st in per_shard)
+                total[key] = sum(st[key] * st['connections'] for st in per_shard) / n if n > 0 else 0
+            else:
+                total[key] = sum(st[key] for st in per_shard)
+        total['accept_queue'] += self.accept_queue.qsize()
+        total['shards'] = [st['connections'] for st in per_shard]  # 每个分片上的连接数
+        return total
@@ -0,0 +1,170 @@
+"""
+包编解码的测试：编码再解码字段不变、和原来 make_packet 的字节完全一样、几种求和引擎在奇数长度的负载上结果一致
+
+在仓库根目录运行: python -m unittest test_codec
+"""
+import random
+import struct
+import unittest
+
+import rdt
+from rdt import RDTPacket, CHECKSUM_ALGORITHMS, CHECKSUM_ENGINES, FLAG_PROBE, FLAG_WND
+
+REMOTE = ('127.0.0.1', 1)
+BASELINE = (  # 原来的 make_packet 编出来的包，没有 WND，校验和是 'sum'
+    (dict(SEQ=1, SEQ_ACK=2), '00000000010000000200000003'),
+    (dict(ACK=1, SEQ=123456, SEQ_ACK=654321, PAYLOAD=b'hello'), '400001e2400009fbf10005f98b68656c6c6f000000'),
+    (dict(SYN=1, SEQ=0xFFFFFFFF, SEQ_ACK=7, PAYLOAD=b'abc'), '80ffffffff00000007000325e661626300'),
+    (dict(FIN=1, ACK=1, SEQ=99, SEQ_ACK=100, PAYLOAD=bytes(range(200, 255))),
+     '600000006300000064003755dac8c9cacbcccdcecfd0d1d2d3d4d5d6d7d8d9dadbdcdddedfe0e1e2e3e4e5e6e7e8e9eaebecedeeef'
+     'f0f1f2f3f4f5f6f7f8f9fafbfcfdfe00'),
+)
+LENGTHS = (0, 1, 2, 3, 4, 5, 7, 13, 1021, 1023, 1024, 1025)
+
+
+class ConcatPacket(RDTPacket):
+    """
+    原来的编解码，留作对照：包头、补齐、WND 各自 struct.pack 再 += 拼起来，解码时先切出整个包尾再切负载
+    """
+    __slots__ = ('PAYLOAD_REAL',)
+
+    def make_packet(self):
+        self._ = (self._ & ~FLAG_WND) | (FLAG_WND if self.WND is not None else 0)
+        packet = bytearray()
+        packet += ((self.SYN << 7) + (self.ACK << 6) + (self.FIN << 5) + (self.RST << 4) +
+                   (self.SAK << 3) + self._).to_bytes(1, 'big')
+        packet += struct.pack('!2I2H', self.SEQ, self.SEQ_ACK, self.LEN, 0)
+        extra = (4 - self.LEN % 4) % 4
+        self.PAYLOAD_REAL = self.PAYLOAD + b'\x00' * extra
+        if self.WND is not None:
+            self.PAYLOAD_REAL += struct.pack('!I', self.WND)
+        self.CHECKSUM = self._checksum(self.PAYLOAD_REAL)
+        packet[-2:] = struct.pack('!H', self.CHECKSUM)
+        packet += self.PAYLOAD_REAL
+        return packet
+
+    @staticmethod
+    def resolve(bs, addr):
+        r = ConcatPacket(remote=addr, SEQ=0, SEQ_ACK=0)
+        bits, r.SEQ, r.SEQ_ACK, r.LEN, r.CHECKSUM = struct.unpack('!B2I2H', bs[:13])
+        r.SYN, r.ACK, r.FIN, = (bits >> 7) & 1, (bits >> 6) & 1, (bits >> 5) & 1
+        r.RST, r.SAK, r._ = (bits >> 4) & 1, (bits >> 3) & 1, bits & 0x7
+        r.PAYLOAD_REAL = bs[13:]
+        return r
+
+    def check(self):
+        if len(self.PAYLOAD_REAL) % 4 != 0:
+            return False
+        check = self._checksum(self.PAYLOAD_REAL)
+        self.PAYLOAD = self.PAYLOAD_REAL[:self.LEN]
+        if check != self.CHECKSUM or self._ & ~(FLAG_WND | FLAG_PROBE):
+            return False
+        if self._ & FLAG_WND:
+            if len(self.PAYLOAD_REAL) < self.LEN + 4:
+                return False
+            self.WND = struct.unpack('!I', self.PAYLOAD_REAL[-4:])[0]
+        return True
+
+
+def random_packet(rng: random.Random, length: int, algo: int, wnd) -> RDTPacket:
+    flags = dict(zip(('SYN', 'ACK', 'FIN', 'RST', 'SAK'), (rng.randint(0, 1) for _ in range(5))))
+    return RDTPacket(remote=REMOTE, SEQ=rng.getrandbits(32), SEQ_ACK=rng.getrandbits(32),
+                     PAYLOAD=rng.randbytes(length), algo=algo, WND=wnd, **flags)
+
+
+def decode(datagram: bytes, algo: int) -> RDTPacket:
+    pkt = RDTPacket.resolve(datagram, REMOTE)
+    pkt.algo = algo  # 接收循环按连接协商的算法设置
+    return pkt
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(305)
+
+    def test_round_trip(self):
+        for algo in range(len(CHECKSUM_ALGORITHMS)):
+            for length in LENGTHS:
+                for wnd in (None, 0, 0xFFFFFFFF):
+                    pkt = random_packet(self.rng, length, algo, wnd)
+                    r = decode(bytes(pkt.make_packet()), algo)
+                    self.assertTrue(r.check())
+                    self.assertEqual((r.SYN, r.ACK, r.FIN, r.RST, r.SAK, r.SEQ, r.SEQ_ACK, r.LEN, r.WND),
+                                     (pkt.SYN, pkt.ACK, pkt.FIN, pkt.RST, pkt.SAK, pkt.SEQ, pkt.SEQ_ACK, length, wnd))
+                    self.assertEqual(bytes(r.PAYLOAD), pkt.PAYLOAD)
+
+    def test_probe_flag(self):
+        pkt = RDTPacket(remote=REMOTE, SEQ=5, SEQ_ACK=6, PAYLOAD=bytes(9), _=FLAG_PROBE)
+        r = decode(bytes(pkt.make_packet()), 0)
+        self.assertTrue(r.check())
+        self.assertEqual(r._, FLAG_PROBE)
+
+    def test_pack_into_reused_buffer(self):
+        buffer = memoryview(bytearray(b'\xff' * 2048))  # 上个包的残留不能混进补齐的字节
+        for length in LENGTHS:
+            pkt = random_packet(self.rng, length, 0, 1 << 20)
+            n = pkt.pack_into(buffer)
+            self.assertEqual(n, pkt.size)
+            self.assertEqual(bytes(buffer[:n]), bytes(pkt.make_packet()))
+
+    def test_corruption_detected(self):
+        algo = CHECKSUM_ALGORITHMS.index('crc32')
+        datagram = bytearray(random_packet(self.rng, 100, algo, 1 << 16).make_packet())
+        for i in range(len(datagram)):
+            damaged = bytearray(datagram)
+            damaged[i] ^= 0x7F
+            self.assertFalse(decode(bytes(damaged), algo).check(), 'byte %d' % i)
+
+    def test_baseline_wire(self):
+        for kwargs, expected in BASELINE:
+            pkt = RDTPacket(remote=REMOTE, **kwargs)
+            self.assertEqual(bytes(pkt.make_packet()).hex(), expected)
+            r = decode(bytes.fromhex(expected), 0)
+            self.assertTrue(r.check())
+            self.assertEqual(bytes(r.PAYLOAD), kwargs.get('PAYLOAD', b''))
+
+    def test_same_bytes_as_concat(self):
+        for algo in range(len(CHECKSUM_ALGORITHMS)):
+            for length in LENGTHS:
+                for wnd in (None, 1 << 20):
+                    pkt = random_packet(self.rng, length, algo, wnd)
+                    old = ConcatPacket(remote=REMOTE, SEQ=pkt.SEQ, SEQ_ACK=pkt.SEQ_ACK, SYN=pkt.SYN, ACK=pkt.ACK,
+                                       FIN=pkt.FIN, RST=pkt.RST, SAK=pkt.SAK, PAYLOAD=pkt.PAYLOAD, algo=algo, WND=wnd)
+                    datagram = bytes(pkt.make_packet())
+                    self.assertEqual(datagram, bytes(old.make_packet()))
+                    r = ConcatPacket.resolve(datagram, REMOTE)
+                    r.algo = algo
+                    self.assertTrue(r.check())
+
+
+class ChecksumEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(305)
+        self.engine = rdt._word_sum
+
+    def tearDown(self):
+        rdt._word_sum = self.engine
+
+    def test_word_sum(self):
+        for length in range(1, 2050, 2):  # 奇数长度的负载，补齐到4字节后求和
+            bs = self.rng.randbytes(length) + bytes(-length % 4)
+            results = {name: engine(bs) for name, engine in CHECKSUM_ENGINES.items()}
+            self.assertEqual(len(set(results.values())), 1, 'length %d: %s' % (length, results))
+
+    def test_packet_checksum(self):
+        pkts = [random_packet(self.rng, length, 0, wnd) for length in range(1, 1026, 2) for wnd in (None, 1 << 20)]
+        expected = None
+        for name in CHECKSUM_ENGINES:
+            rdt.set_checksum_engine(name)
+            datagrams = [bytes(pkt.make_packet()) for pkt in pkts]
+            if expected is None:
+                expected = datagrams
+            self.assertEqual(datagrams, expected, name)
+            self.assertTrue(all(decode(datagram, 0).check() for datagram in datagrams), name)
+
+    def test_unknown_engine(self):
+        self.assertRaises(AssertionError, rdt.set_checksum_engine, 'nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
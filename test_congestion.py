@@ -0,0 +1,52 @@
+"""
+拥塞控制的测试：连续超时以后窗口不低于 2，窗口再小、路上没包时等着重发的包也要发出去
+
+在仓库根目录运行: python -m unittest test_congestion
+"""
+import unittest
+
+from congestion import CONTROLLERS
+from rdt import RDTEvent, RDTEventType, RDTPacket, RDTSocket, ServerEventLoop
+
+REMOTE = ('127.0.0.1', 1)
+
+
+class CongestionTest(unittest.TestCase):
+    def test_window_floor(self):
+        for name in ('newreno', 'cubic'):
+            cc = CONTROLLERS[name]()
+            for _ in range(50):  # 连续超时，每次都当成新的一轮丢包
+                cc.recover_until = 0
+                cc.on_loss(cc.cwnd, 1.0)
+            self.assertGreaterEqual(cc.cwnd, 2.0, name)  # 小于 2 时 deal_resend 不重发
+
+
+class ResendTest(unittest.TestCase):
+    def setUp(self):
+        self.socket = RDTSocket(debug=False, congestion='cubic', pacing=False)
+        self.loop = ServerEventLoop(self.socket)  # 不启动线程，只调处理函数
+        self.skt = self.socket.create_simple_socket(REMOTE, 0, 0, self.loop.event_queue)
+
+    def tearDown(self):
+        self.socket.force_close()
+
+    def lose(self, seq: int):
+        pkt = RDTPacket(remote=REMOTE, ACK=1, SEQ=seq, SEQ_ACK=0, PAYLOAD=bytes(1024))
+        timer = self.loop.push_timer(1.0, RDTEvent(RDTEventType.ACK_TIMEOUT, pkt))
+        timer.active = False
+        self.skt.wait_ack[seq] = timer
+        self.skt.wait_resend[seq] = timer
+
+    def test_resend_with_tiny_window(self):
+        self.lose(0)
+        self.lose(1024)
+        self.skt.cc.cwnd = 1.0  # 控制器给的最小窗口
+        self.loop.deal_resend(self.skt)
+        self.assertEqual(len(self.skt.wait_resend), 1)  # 路上没包，先重发一个
+        self.assertEqual(self.loop.send_loop.send_queue.get_nowait().SEQ, 0)
+        self.loop.deal_resend(self.skt)
+        self.assertEqual(len(self.skt.wait_resend), 1)  # 一个在路上，窗口不够再发
+
+
+if __name__ == '__main__':
+    unittest.main()
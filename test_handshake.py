@@ -0,0 +1,69 @@
+"""
+握手时校验和算法的协商：双方取强的一个，旧版本不带选项就用 'sum'
+
+在仓库根目录运行: python -m unittest test_handshake
+"""
+import unittest
+
+from rdt import (OPT_CHECKSUM, CHECKSUM_ALGORITHMS, ClientEventLoop, RDTPacket, RDTSocket, ServerEventLoop,
+                 pack_options, parse_options)
+
+REMOTE = ('127.0.0.1', 1)
+
+
+class ServerNegotiationTest(unittest.TestCase):
+    def handshake(self, server: str, payload: bytes) -> (int, int):
+        """
+        :return: 连接上用的算法, SYN_ACK 里告诉对方的算法
+        """
+        socket = RDTSocket(debug=False, checksum=server)
+        loop = ServerEventLoop(socket)  # 不启动线程，只调处理函数
+        socket._event_loop = loop
+        try:
+            loop.on_syn(RDTPacket(remote=REMOTE, SYN=1, SEQ=0, SEQ_ACK=0, PAYLOAD=payload))
+            syn_ack = loop.send_loop.send_queue.get_nowait()
+            self.assertEqual(syn_ack.SYN, 1)
+            return loop.connections[REMOTE].checksum, parse_options(syn_ack.PAYLOAD)[0][OPT_CHECKSUM][0]
+        finally:
+            socket.force_close()
+
+    def propose(self, algo: str) -> bytes:
+        return pack_options({OPT_CHECKSUM: bytes([CHECKSUM_ALGORITHMS.index(algo)])})
+
+    def test_server_stronger(self):
+        self.assertEqual(self.handshake('crc32', self.propose('sum')), (2, 2))
+
+    def test_client_stronger(self):
+        self.assertEqual(self.handshake('sum', self.propose('crc32')), (2, 2))
+        self.assertEqual(self.handshake('adler32', self.propose('crc32')), (2, 2))
+
+    def test_unknown_proposal(self):
+        payload = pack_options({OPT_CHECKSUM: bytes([len(CHECKSUM_ALGORITHMS)])})  # 对方比我们新
+        self.assertEqual(self.handshake('sum', payload), (2, 2))
+
+    def test_legacy_client(self):
+        self.assertEqual(self.handshake('crc32', bytes(1024)), (0, 0))  # 旧版本的 SYN 全是补的0
+
+
+class ClientNegotiationTest(unittest.TestCase):
+    def syn_ack(self, payload: bytes) -> int:
+        socket = RDTSocket(debug=False, checksum='adler32')
+        loop = ClientEventLoop(socket, REMOTE)
+        socket._event_loop, socket.simple_sct = loop, loop.simple_sct
+        try:
+            self.assertEqual(loop.simple_sct.checksum, 1)  # 握手前是自己的提议
+            loop.on_syn_ack(RDTPacket(remote=REMOTE, SYN=1, ACK=1, SEQ=0, SEQ_ACK=loop.simple_sct.SEQ,
+                                      PAYLOAD=payload))
+            return loop.simple_sct.checksum
+        finally:
+            socket.force_close()
+
+    def test_follow_server(self):
+        self.assertEqual(self.syn_ack(pack_options({OPT_CHECKSUM: bytes([2])})), 2)
+
+    def test_legacy_server(self):
+        self.assertEqual(self.syn_ack(bytes(1024)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
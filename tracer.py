@@ -0,0 +1,123 @@
+"""
+包跟踪：把收发的每个 RDT 包头连同时间和事件类型记进预先分配好的环形缓冲区，事后导出成 pcap 用 Wireshark/tcpdump 看
+
+用法:
+    tracer = PacketTracer(65536)
+    sock = RDTSocket(tracer=tracer)
+    ...
+    tracer.dump_pcap('rdt.pcap')  # 默认每个包套上 IPv4 + UDP 头，linktype=LINKTYPE_USER0 时只有 RDT 包头
+
+不开跟踪时发送循环和接收循环只多一次 is None 判断；开了以后每个包一次 pack_into，不分配内存。
+只记包头，不记负载：pcap 里每个包的捕获长度是包头，原始长度是整个数据报
+"""
+import struct
+import time
+from itertools import count
+from socket import inet_aton, inet_ntoa
+
+from rdt import HEADER, FLAG_WND, RDTEventType, RDTPacket
+
+SENT = 0
+RECEIVED = 1
+NO_EVENT = 0xFF  # 发出去的包没有事件类型
+
+# 时间, 方向, 事件类型, 远端IP, 远端端口, 标志位, SEQ, SEQ_ACK, LEN, CHECKSUM, WND, 数据报长度
+RECORD = struct.Struct('!dBB4sHBIIHHII')
+
+PCAP_HEADER = struct.Struct('<IHHiIII')  # magic, 版本 2.4, 时区, 精度, snaplen, linktype
+PCAP_RECORD = struct.Struct('<IIII')  # 秒, 微秒, 捕获长度, 原始长度
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_RAW = 101  # 裸 IPv4 包
+LINKTYPE_USER0 = 147  # 用户自定义，包里只有 RDT 包头
+IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+UDP_HEADER = struct.Struct('!HHHH')
+
+
+class PacketTracer:
+    """
+    定长的环形缓冲区，写满以后覆盖最早的记录；发送循环、接收循环可以在不同线程里同时记
+    """
+
+    def __init__(self, capacity: int = 65536):
+        assert capacity > 0, 'Capacity should be positive'
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.seq = count()  # 下一条记录的序号，next 在 GIL 下是原子的
+        self.total = 0  # 一共记过多少条
+        self.ips = {}  # IP 字符串 -> 4字节，免得每个包都 inet_aton
+        self.local = ('127.0.0.1', 0)  # 本地地址，导出 UDP 封装时用，RDTSocket 绑定时会填上
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def record(self, direction: int, event: int, pkt: RDTPacket, size: int):
+        ip = self.ips.get(pkt.remote[0])
+        if ip is None:
+            ip = self.ips[pkt.remote[0]] = inet_aton(pkt.remote[0])
+        i = next(self.seq)
+        RECORD.pack_into(self.buffer, (i % self.capacity) * RECORD.size, time.time(), direction, event, ip,
+                         pkt.remote[1], pkt.bits, pkt.SEQ, pkt.SEQ_ACK, pkt.LEN, pkt.CHECKSUM,
+                         pkt.WND if pkt.WND is not None else 0, size)
+        if i >= self.total:
+            self.total = i + 1
+
+    def sent(self, pkt: RDTPacket, size: int):
+        self.record(SENT, NO_EVENT, pkt, size)
+
+    def received(self, pkt: RDTPacket, e_type: RDTEventType, size: int):
+        self.record(RECEIVED, e_type.value, pkt, size)
+
+    def raw_records(self) -> list:
+        """
+        从旧到新的记录元组，字段顺序同 RECORD
+        """
+        total = self.total
+        start = max(0, total - self.capacity)
+        return [RECORD.unpack_from(self.buffer, (i % self.capacity) * RECORD.size) for i in range(start, total)]
+
+    def records(self) -> list:
+        """
+        从旧到新的记录，每条一个 dict，离线分析用
+        """
+        result = []
+        for t, direction, event, ip, port, bits, seq, seq_ack, length, checksum, wnd, size in self.raw_records():
+            result.append({
+                'time': t,
+                'direction': 'sent' if direction == SENT else 'received',
+                'event': RDTEventType(event).name if event != NO_EVENT else None,
+                'remote': (inet_ntoa(ip), port),
+                'SYN': (bits >> 7) & 1, 'ACK': (bits >> 6) & 1, 'FIN': (bits >> 5) & 1,
+                'RST': (bits >> 4) & 1, 'SAK': (bits >> 3) & 1, '_': bits & 0x7,
+                'SEQ': seq, 'SEQ_ACK': seq_ack, 'LEN': length, 'CHECKSUM': checksum,
+                'WND': wnd if bits & FLAG_WND else None,
+                'size': size,
+            })
+        return result
+
+    def dump_pcap(self, path: str, linktype: int = LINKTYPE_RAW):
+        """
+        导出成 pcap；LINKTYPE_RAW 每个包套 IPv4 + UDP 头，远端端口就是 UDP 端口，Wireshark 能直接按会话看
+        """
+        assert linktype in (LINKTYPE_RAW, LINKTYPE_USER0), 'Unknown linktype'
+        local_ip, local_port = inet_aton(self.local[0]), self.local[1]
+        with open(path, 'wb') as f:
+            f.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, 0xFFFF, linktype))
+            for t, direction, event, ip, port, bits, seq, seq_ack, length, checksum, wnd, size in self.raw_records():
+                frame = HEADER.pack(bits, seq, seq_ack, length, checksum)
+                orig = size
+                if linktype == LINKTYPE_RAW:
+                    src, dst = (local_ip, local_port), (ip, port)
+                    if direction == RECEIVED:
+                        src, dst = dst, src
+                    orig = size + IP_HEADER.size + UDP_HEADER.size
+                    frame = ip_header(src[0], dst[0], orig) + UDP_HEADER.pack(src[1], dst[1], size + 8, 0) + frame
+                f.write(PCAP_RECORD.pack(int(t), int(t % 1 * 1000000), len(frame), orig))
+                f.write(frame)
+
+
+def ip_header(src: bytes, dst: bytes, total_len: int) -> bytes:
+    header = IP_HEADER.pack(0x45, 0, min(total_len, 0xFFFF), 0, 0, 64, 17, 0, src, dst)  # UDP, TTL 64
+    checksum = sum(struct.unpack('!10H', header))
+    while checksum > 0xFFFF:
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+    return header[:10] + struct.pack('!H', ~checksum & 0xFFFF) + header[12:]